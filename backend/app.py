@@ -3,6 +3,7 @@ import os
 
 from dotenv import load_dotenv
 from firebase_admin import credentials, initialize_app
+from utils import get_storage_backend
 
 # Firebase Initialisation
 load_dotenv()
@@ -38,10 +39,12 @@ def create_firestore_credentials() -> None:
     file.close()
 
 
-# if get_is_dev_env():
-create_firestore_credentials()
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = CREDENTIAL_PATH
-initialize_app()
+# Local storage backends run without a Firebase project
+if get_storage_backend() == "firestore":
+    # if get_is_dev_env():
+    create_firestore_credentials()
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = CREDENTIAL_PATH
+    initialize_app()
 # else:
 #     initialize_app(credential=credentials.Certificate(get_firestore_credentials()))
 
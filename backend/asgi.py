@@ -0,0 +1,61 @@
+"""
+ASGI entrypoint, served by uvicorn workers when SERVER_MODE=asgi.
+
+Flask views still run in a thread pool, but asgiref schedules their coroutines
+on the worker's single long-lived event loop instead of creating a new loop per
+request. The Firestore client, Telegram sessions and background work are then
+shared by every request of the worker.
+"""
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from app import app as flask_app
+from utils import get_server_threads
+from utils.background import set_background_loop
+
+_run_wsgi_app = WsgiToAsgiInstance.__dict__["run_wsgi_app"].func
+
+
+class WsgiInstance(WsgiToAsgiInstance):
+    def build_environ(self, scope, body):
+        environ = super().build_environ(scope, body)
+        # Flask logs unhandled exceptions to this stream as text
+        environ["wsgi.errors"] = sys.stderr
+        return environ
+
+    async def run_wsgi_app(self, body):
+        # asgiref runs every request on one shared thread by default, requests
+        # have to run concurrently in the pool instead
+        await sync_to_async(_run_wsgi_app, thread_sensitive=False)(self, body)
+
+
+class Application(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        else:
+            await WsgiInstance(self.wsgi_application)(scope, receive, send)
+
+    async def lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+
+            if message["type"] == "lifespan.startup":
+                loop = asyncio.get_running_loop()
+                # Sized like gthread workers, open event streams hold a thread each
+                loop.set_default_executor(
+                    ThreadPoolExecutor(max_workers=get_server_threads())
+                )
+                # Also runs the restores of timers deferred until now
+                set_background_loop(loop)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+app = Application(flask_app)
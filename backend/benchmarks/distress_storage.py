@@ -0,0 +1,126 @@
+"""
+Compares legacy (embedded) and compact distress documents by their Firestore
+storage size and the time taken to serve them as a /distress listing.
+
+Usage (from backend/):
+    python -m benchmarks.distress_storage [--count 1000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+import uuid
+from typing import Callable, List
+
+from database.migrate import get_document_size
+from database.models import PWID, Distress, Location, Responder
+
+SEED_PATH = os.path.join(os.path.dirname(__file__), "..", "database", "seed")
+
+
+def _load_seed(filename: str) -> List[dict]:
+    with open(os.path.join(SEED_PATH, filename)) as file:
+        return json.load(file)
+
+
+def create_distress_signals(count: int, seed: int = 0) -> List[Distress]:
+    rng = random.Random(seed)
+    pwids = [
+        PWID.from_dict({**x, "id": str(uuid.UUID(int=rng.getrandbits(128)))})
+        for x in _load_seed("pwid_dummy_data.json")
+    ]
+    responders = [
+        Responder.from_dict(
+            {
+                "id": str(uuid.UUID(int=rng.getrandbits(128))),
+                "location": {"latitude": 1.3521, "longitude": 103.8198},
+                "is_available": True,
+                "state": 0,
+                "message_id": -1,
+                **x,
+                "existing_medical_knowledge": [
+                    {"created_at": "", "description": "", **y}
+                    for y in x["existing_medical_knowledge"]
+                ],
+            }
+        )
+        for x in _load_seed("responder_dummy_data.json")
+    ]
+
+    distress_signals = []
+    for i in range(count):
+        pwid = rng.choice(pwids)
+        distress_signals.append(
+            Distress(
+                id=str(uuid.UUID(int=rng.getrandbits(128))),
+                group_chat_message_id=i,
+                message_id=i,
+                location=Location(
+                    longitude=pwid.location.longitude,
+                    latitude=pwid.location.latitude,
+                    address=pwid.address,
+                ),
+                pwid=pwid,
+                responder=rng.choice(responders) if rng.random() < 0.8 else None,
+            )
+        )
+    return distress_signals
+
+
+def _render_listing(
+    documents: List[dict], serialise: Callable[[Distress], dict]
+) -> str:
+    # Decoding stored documents and encoding the response, as /distress does
+    return json.dumps([serialise(Distress.from_dict(x)) for x in documents])
+
+
+def _time_listing(
+    documents: List[dict], serialise: Callable[[Distress], dict], repeat: int
+) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _render_listing(documents, serialise)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def benchmark(
+    name: str,
+    serialise: Callable[[Distress], dict],
+    distress: List[Distress],
+    repeat: int,
+) -> dict:
+    documents = [serialise(x) for x in distress]
+    sizes = [get_document_size(x) for x in documents]
+    timings = _time_listing(documents, serialise, repeat)
+
+    return {
+        "format": name,
+        "documents": len(documents),
+        "mean_document_bytes": round(statistics.mean(sizes)),
+        "max_document_bytes": max(sizes),
+        "listing_bytes": len(_render_listing(documents, serialise)),
+        "listing_ms": round(statistics.median(timings), 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    distress_signals = create_distress_signals(args.count)
+    results = [
+        benchmark(
+            "legacy",
+            lambda x: x.to_dict(is_compact=False),
+            distress_signals,
+            args.repeat,
+        ),
+        benchmark("compact", lambda x: x.to_dict(), distress_signals, args.repeat),
+    ]
+    print(json.dumps(results, indent=4))
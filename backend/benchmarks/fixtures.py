@@ -0,0 +1,108 @@
+"""
+Synthetic documents derived from database/seed, for benchmarks.
+
+Every generator takes a random.Random so that the same seed always yields the
+same documents, and timings stay comparable across runs and machines.
+"""
+import json
+import os
+import random
+import uuid
+from typing import List
+
+from database.models import PWID, Distress, Location, Responder
+
+SEED_PATH = os.path.join(os.path.dirname(__file__), "..", "database", "seed")
+
+# Bounding box of Singapore
+SOUTH, WEST, NORTH, EAST = 1.24, 103.62, 1.47, 104.0
+
+
+def load_seed(filename: str) -> List[dict]:
+    with open(os.path.join(SEED_PATH, filename)) as file:
+        return json.load(file)
+
+
+def get_id(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128)))
+
+
+def get_location(rng: random.Random) -> dict:
+    return {
+        "latitude": rng.uniform(SOUTH, NORTH),
+        "longitude": rng.uniform(WEST, EAST),
+        "address": f"Blk {rng.randint(1, 999)}, SINGAPORE {rng.randint(10000, 829999):06d}",
+    }
+
+
+def create_pwid_payloads(count: int, rng: random.Random) -> List[dict]:
+    # As accepted by POST /pwid
+    seed = load_seed("pwid_dummy_data.json")
+    return [
+        {**seed[i % len(seed)], "name": f"PWID {i:06d}", "location": get_location(rng)}
+        for i in range(count)
+    ]
+
+
+def create_responder_payloads(
+    count: int, rng: random.Random, first_telegram_id: int = 100000
+) -> List[dict]:
+    # As accepted by POST /responder
+    seed = load_seed("responder_dummy_data.json")
+    return [
+        {
+            **seed[i % len(seed)],
+            "name": f"Responder {i:06d}",
+            "telegram_id": first_telegram_id + i,
+            "location": get_location(rng),
+        }
+        for i in range(count)
+    ]
+
+
+def create_pwids(count: int, rng: random.Random) -> List[PWID]:
+    return [
+        PWID.from_dict({**x, "id": get_id(rng)})
+        for x in create_pwid_payloads(count, rng)
+    ]
+
+
+def create_responders(count: int, rng: random.Random) -> List[Responder]:
+    return [
+        Responder.from_dict(
+            {
+                **x,
+                "id": get_id(rng),
+                "is_available": True,
+                "state": 0,
+                "message_id": -1,
+                "existing_medical_knowledge": [
+                    {"created_at": "", "description": "", **y}
+                    for y in x["existing_medical_knowledge"]
+                ],
+            }
+        )
+        for x in create_responder_payloads(count, rng)
+    ]
+
+
+def create_distress_signals(
+    count: int,
+    rng: random.Random,
+    pwids: List[PWID],
+    responders: List[Responder],
+) -> List[Distress]:
+    distress_signals = []
+    for i in range(count):
+        pwid = rng.choice(pwids)
+        distress_signals.append(
+            Distress(
+                id=get_id(rng),
+                group_chat_message_id=i,
+                message_id=i,
+                location=Location.from_dict(get_location(rng)),
+                pwid=pwid,
+                responder=rng.choice(responders) if rng.random() < 0.8 else None,
+            )
+        )
+    return distress_signals
@@ -0,0 +1,344 @@
+"""
+Measures how many concurrent distress signals the backend sustains, end to end.
+
+Starts the server with gunicorn on a local storage backend and a stand-in
+Telegram Bot API (see benchmarks.telegram), seeds PWIDs and responders over
+HTTP, then replays bursts of /sos requests from every PWID followed by a storm
+of webhook callbacks, one per responder accepting the signal offered to them.
+Reports throughput, SOS-to-notification and callback-to-reply latency and the
+Bot API calls made per request.
+
+Usage (from backend/):
+    python -m benchmarks.harness [--pwids 50] [--responders 200] [--bursts 5] \\
+        [--storage sqlite] [--server-mode wsgi] [--workers 2] [--latency 0.05] \\
+        [--output harness.json]
+
+Telegram's rate limits and the offer timeout are lifted unless they are set in
+the environment, e.g. TELEGRAM_GROUP_RATE_LIMIT=20 to measure with them.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+import aiohttp
+
+from benchmarks.fixtures import create_pwid_payloads, create_responder_payloads
+from benchmarks.telegram import FakeBotApi
+
+BACKEND_PATH = os.path.join(os.path.dirname(__file__), "..")
+
+API_TOKEN = "1:harness"
+GROUP_CHAT_ID = -100
+FIRST_TELEGRAM_ID = 100000
+
+# Defaults that keep Telegram's limits and expiring offers out of the results
+UNLIMITED_ENV = {
+    "TELEGRAM_RATE_LIMIT": "1000000",
+    "TELEGRAM_CHAT_RATE_LIMIT": "1000000",
+    "TELEGRAM_GROUP_RATE_LIMIT": "1000000",
+    "OFFER_TIMEOUT": "3600",
+}
+
+
+def _get_latency(timings: List[float]) -> Optional[dict]:
+    if not timings:
+        return None
+
+    timings = sorted(timings)
+
+    def get_percentile(percentile: float) -> float:
+        index = min(int(len(timings) * percentile), len(timings) - 1)
+        return round(timings[index], 2)
+
+    return {
+        "mean": round(statistics.mean(timings), 2),
+        "p50": get_percentile(0.5),
+        "p95": get_percentile(0.95),
+        "p99": get_percentile(0.99),
+    }
+
+
+def _get_calls_per_request(calls: List[dict], requests: int) -> Dict[str, float]:
+    counts = Counter(x["method"] for x in calls)
+    return {x: round(counts[x] / max(requests, 1), 2) for x in sorted(counts)}
+
+
+def _get_offer(call: dict) -> Optional[str]:
+    # Offers carry the accept button of the distress signal
+    for row in (call["reply_markup"] or {}).get("inline_keyboard", []):
+        for button in row:
+            callback_data = button["callback_data"].split(" ")
+            if callback_data[:2] == ["distress", "accept"]:
+                return callback_data[2]
+    return None
+
+
+def _create_callback_update(update_id: int, offer: dict, distress_id: str) -> dict:
+    chat = {"id": offer["chat_id"], "type": "private"}
+
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": {"id": offer["chat_id"], "is_bot": False, "first_name": "Load"},
+            "message": {
+                "message_id": offer["message_id"],
+                "date": int(time.time()),
+                "chat": chat,
+                "text": offer["text"],
+            },
+            "chat_instance": str(offer["chat_id"]),
+            "data": f"distress accept {distress_id}",
+        },
+    }
+
+
+async def _wait_for(predicate: Callable[[], bool], timeout: float) -> None:
+    deadline = time.perf_counter() + timeout
+    while not predicate() and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+
+
+async def _wait_for_server(session: aiohttp.ClientSession, url: str) -> None:
+    for _ in range(300):
+        try:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f"Server at {url} did not start")
+
+
+async def _seed(
+    session: aiohttp.ClientSession, url: str, pwids: List[dict], responders: List[dict]
+) -> None:
+    async def create(path: str, payload: dict) -> None:
+        async with session.post(f"{url}{path}", json=payload) as response:
+            response.raise_for_status()
+
+    await asyncio.gather(*[create("/pwid", x) for x in pwids])
+    await asyncio.gather(*[create("/responder", x) for x in responders])
+
+
+async def _run_sos(
+    session: aiohttp.ClientSession,
+    url: str,
+    api: FakeBotApi,
+    pwids: List[dict],
+    bursts: int,
+    timeout: float,
+) -> dict:
+    timings: List[float] = []
+    statuses: Counter = Counter()
+    start = time.perf_counter()
+
+    async def request(pwid: dict, i: int) -> dict:
+        sent_at = time.perf_counter()
+        async with session.get(
+            f"{url}/sos",
+            params={"name": pwid["name"]},
+            # Documentation range, answered by the stand-in ip-api
+            headers={"X-Forwarded-For": f"203.0.113.{i % 256}"},
+        ) as response:
+            await response.read()
+        statuses[response.status] += 1
+        return {"name": pwid["name"], "sent_at": sent_at, "status": response.status}
+
+    for _ in range(bursts):
+        burst_start = time.perf_counter()
+        requests = await asyncio.gather(*[request(x, i) for i, x in enumerate(pwids)])
+        expected = [x for x in requests if x["status"] == 200]
+
+        def get_notifications() -> Dict[str, float]:
+            notifications: Dict[str, float] = {}
+            for call in api.get_calls(burst_start):
+                if call["method"] != "sendMessage" or call["chat_id"] == GROUP_CHAT_ID:
+                    continue
+                for x in expected:
+                    if f"<b>{x['name']}</b>" in call["text"]:
+                        notifications.setdefault(x["name"], call["time"])
+            return notifications
+
+        # Responders may be notified after /sos returns, e.g. on fallbacks
+        await _wait_for(lambda: len(get_notifications()) >= len(expected), timeout)
+        notifications = get_notifications()
+        timings += [
+            (notifications[x["name"]] - x["sent_at"]) * 1000
+            for x in expected
+            if x["name"] in notifications
+        ]
+
+    elapsed = time.perf_counter() - start
+    total = len(pwids) * bursts
+    return {
+        "requests": total,
+        "statuses": dict(statuses),
+        "throughput": round(total / elapsed, 2),
+        "notified": len(timings),
+        "latency_ms": _get_latency(timings),
+        "calls_per_request": _get_calls_per_request(api.get_calls(start), total),
+    }
+
+
+async def _run_callbacks(
+    session: aiohttp.ClientSession, url: str, api: FakeBotApi, timeout: float
+) -> dict:
+    offers = [(x, _get_offer(x)) for x in api.get_calls()]
+    offers = [(x, distress_id) for x, distress_id in offers if distress_id]
+    statuses: Counter = Counter()
+    start = time.perf_counter()
+
+    async def request(i: int, offer: dict, distress_id: str) -> float:
+        sent_at = time.perf_counter()
+        async with session.post(
+            f"{url}/${API_TOKEN}",
+            json=_create_callback_update(i, offer, distress_id),
+        ) as response:
+            await response.read()
+        statuses[response.status] += 1
+        return sent_at
+
+    sent_at = await asyncio.gather(
+        *[request(i, x, distress_id) for i, (x, distress_id) in enumerate(offers)]
+    )
+
+    def get_replies() -> Dict[tuple, float]:
+        # The offer is edited once the responder's acknowledgement is stored
+        replies: Dict[tuple, float] = {}
+        for call in api.get_calls(start):
+            if call["method"] == "editMessageText":
+                replies.setdefault((call["chat_id"], call["message_id"]), call["time"])
+        return replies
+
+    keys = [(x["chat_id"], x["message_id"]) for x, _ in offers]
+    await _wait_for(lambda: all(x in get_replies() for x in keys), timeout)
+    elapsed = time.perf_counter() - start
+
+    replies = get_replies()
+    timings = [
+        (replies[key] - sent) * 1000
+        for key, sent in zip(keys, sent_at)
+        if key in replies
+    ]
+    return {
+        "requests": len(offers),
+        "responders": len({x["chat_id"] for x, _ in offers}),
+        "statuses": dict(statuses),
+        "throughput": round(len(offers) / elapsed, 2) if offers else 0,
+        "replied": len(timings),
+        "latency_ms": _get_latency(timings),
+        "calls_per_request": _get_calls_per_request(api.get_calls(start), len(offers)),
+    }
+
+
+async def run(args: argparse.Namespace, api: FakeBotApi) -> dict:
+    rng = random.Random(args.seed)
+    pwids = create_pwid_payloads(args.pwids, rng)
+    responders = create_responder_payloads(args.responders, rng, FIRST_TELEGRAM_ID)
+    url = f"http://127.0.0.1:{args.port}"
+
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await _wait_for_server(session, url)
+        await _seed(session, url, pwids, responders)
+
+        sos = await _run_sos(session, url, api, pwids, args.bursts, args.timeout)
+        callbacks = await _run_callbacks(session, url, api, args.timeout)
+
+    return {"sos": sos, "callbacks": callbacks}
+
+
+def main(args: argparse.Namespace) -> dict:
+    api = FakeBotApi(args.latency)
+    api.start_in_background("127.0.0.1", args.api_port)
+    api_url = f"http://127.0.0.1:{args.api_port}"
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = {
+            **UNLIMITED_ENV,
+            **os.environ,
+            "STORAGE_BACKEND": args.storage,
+            "SQLITE_PATH": os.path.join(directory, "harness.db"),
+            "SERVER_MODE": args.server_mode,
+            "TELEGRAM_API_URL": api_url,
+            "TELEGRAM_API_TOKEN": API_TOKEN,
+            "TELEGRAM_CHAT_ID": str(GROUP_CHAT_ID),
+            "IP_API_URL": api_url,
+            "SOS_DEBOUNCE_WINDOW": "0",
+        }
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "gunicorn",
+                "-c",
+                "gunicorn_config.py",
+                "--bind",
+                f"127.0.0.1:{args.port}",
+                "--workers",
+                str(args.workers),
+            ],
+            cwd=BACKEND_PATH,
+            env=env,
+            stdout=subprocess.DEVNULL if not args.verbose else None,
+            stderr=subprocess.DEVNULL if not args.verbose else None,
+        )
+        try:
+            results = asyncio.run(run(args, api))
+        finally:
+            server.terminate()
+            server.wait()
+
+    config = {
+        x: getattr(args, x)
+        for x in [
+            "pwids",
+            "responders",
+            "bursts",
+            "storage",
+            "server_mode",
+            "workers",
+            "latency",
+            "seed",
+        ]
+    }
+    return {"config": config, **results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pwids", type=int, default=50, help="SOS requests per burst")
+    parser.add_argument("--responders", type=int, default=200)
+    parser.add_argument("--bursts", type=int, default=5)
+    parser.add_argument("--storage", choices=["memory", "sqlite"], default="sqlite")
+    parser.add_argument("--server-mode", choices=["wsgi", "asgi"], default="wsgi")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.05, help="Bot API seconds")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=30, help="Seconds per phase")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--api-port", type=int, default=8091)
+    parser.add_argument("--output", default="harness.json")
+    parser.add_argument("--verbose", action="store_true", help="Show server logs")
+    args = parser.parse_args()
+
+    # Each worker would hold its own copy of the seeded documents
+    if args.storage == "memory" and args.workers > 1:
+        parser.error("--storage memory requires --workers 1")
+
+    results = main(args)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=4)
+    print(json.dumps(results, indent=4))
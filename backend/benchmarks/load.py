@@ -0,0 +1,113 @@
+"""
+Measures /sos and Telegram webhook latency of a running server, to compare the
+WSGI and ASGI serving modes under the same load.
+
+Usage (from backend/, against a server started with SERVER_MODE=wsgi or asgi):
+    gunicorn -c gunicorn_config.py
+    python -m benchmarks.load --url http://localhost:8080 --pwid "Tan Ah Kow" \\
+        --webhook-path '/$<TELEGRAM_API_TOKEN>' [--requests 500] [--concurrency 50]
+
+Start the server with SOS_DEBOUNCE_WINDOW=0, otherwise repeated requests for
+the same PWID are served from the first response. Pass --pwid several times to
+spread /sos requests across PWIDs.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Any, Callable, List
+
+import aiohttp
+
+
+def _get_percentile(timings: List[float], percentile: float) -> float:
+    timings = sorted(timings)
+    index = min(int(len(timings) * percentile), len(timings) - 1)
+    return round(timings[index], 2)
+
+
+def _create_update(update_id: int) -> dict:
+    # A plain text message from the dispatchers' chat, handled without replies
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": -1, "type": "group"},
+            "from": {"id": 1, "is_bot": False, "first_name": "Load"},
+            "text": "load test",
+        },
+    }
+
+
+async def _run(
+    total: int,
+    concurrency: int,
+    send: Callable[[aiohttp.ClientSession, int], Any],
+) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    timings: List[float] = []
+    statuses: dict = {}
+
+    async def request(session: aiohttp.ClientSession, i: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            async with send(session, i) as response:
+                await response.read()
+            timings.append((time.perf_counter() - start) * 1000)
+            statuses[response.status] = statuses.get(response.status, 0) + 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*[request(session, i) for i in range(total)])
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "statuses": statuses,
+        "throughput": round(total / elapsed, 2),
+        "mean_ms": round(statistics.mean(timings), 2),
+        "p50_ms": _get_percentile(timings, 0.5),
+        "p99_ms": _get_percentile(timings, 0.99),
+    }
+
+
+async def main(args: argparse.Namespace) -> List[dict]:
+    results = []
+
+    if args.pwid:
+        result = await _run(
+            args.requests,
+            args.concurrency,
+            lambda session, i: session.get(
+                f"{args.url}/sos", params={"name": args.pwid[i % len(args.pwid)]}
+            ),
+        )
+        results.append({"endpoint": "/sos", **result})
+
+    if args.webhook_path:
+        result = await _run(
+            args.requests,
+            args.concurrency,
+            lambda session, i: session.post(
+                f"{args.url}{args.webhook_path}", json=_create_update(i)
+            ),
+        )
+        results.append({"endpoint": "webhook", **result})
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--pwid", action="append", help="PWID name for /sos requests")
+    parser.add_argument("--webhook-path", help="Webhook path, i.e. /$<API token>")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(main(args)), indent=4))
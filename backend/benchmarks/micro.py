@@ -0,0 +1,265 @@
+"""
+Microbenchmarks of the hot pure-Python paths: responder matching, document
+serialisation, message rendering and the date of birth calendar.
+
+Usage (from backend/):
+    python -m benchmarks.micro [--filter matching] [--repeat 5]
+    python -m benchmarks.micro --save  # Overwrite the checked-in baseline
+
+Results are compared against benchmarks/baselines/micro.json, recorded on the
+machine named in it, so only compare ratios measured on similar hardware.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from functools import partial
+from typing import Any, Callable, Coroutine, Dict, List, Optional
+
+# Importing the routes rearms timers from storage, keep them off Firestore
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+
+from database.models import PWID, Distress, Responder
+from routes.sos import (
+    get_available_responders,
+    process_notify_dispatcher,
+    process_notify_responder,
+)
+from utils.calendar import Calendar
+from utils.spatial import ResponderIndex
+from utils.text import _get_pwid_contacts
+
+from benchmarks.fixtures import (
+    create_distress_signals,
+    create_pwids,
+    create_responders,
+)
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "micro.json")
+MATCHING_SIZES = [100, 1000, 10000, 100000]
+# PWIDs matched per call, some have no eligible responder nearby and widen the pool
+MATCHING_BATCH_SIZE = 5
+# Each repeat runs the benchmark for at least this many seconds
+MIN_REPEAT_TIME = 0.2
+
+# Benchmarks by name, each a setup returning the operation to time
+BENCHMARKS: Dict[str, Callable[[random.Random], Callable[[], Any]]] = {}
+
+
+def benchmark(name: str):
+    def register(setup: Callable[[random.Random], Callable[[], Any]]):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+def _cycle(items: List[Any]) -> Callable[[], Any]:
+    # Rotates through fixtures so that no single document is measured
+    state = {"index": -1}
+
+    def get_next() -> Any:
+        state["index"] = (state["index"] + 1) % len(items)
+        return items[state["index"]]
+
+    return get_next
+
+
+class _Message:
+    id = 1
+
+
+class _Bot:
+    # Serialises keyboards as the Bot API client would, without sending anything
+    async def send_message(self, **kwargs) -> _Message:
+        kwargs["reply_markup"].to_json()
+        return _Message()
+
+    async def edit_message_text(self, **kwargs) -> _Message:
+        kwargs["reply_markup"].to_json()
+        return _Message()
+
+
+def _run(coroutine: Coroutine) -> Any:
+    # The stub bot never suspends, so coroutines finish on their first step
+    try:
+        coroutine.send(None)
+    except StopIteration as e:
+        return e.value
+    raise RuntimeError("Coroutine suspended")
+
+
+def _setup_matching(size: int, rng: random.Random) -> Callable[[], Any]:
+    index = ResponderIndex(create_responders(size, rng))
+    # Every call matches the same batch, or repeats would time different PWIDs
+    pwids = create_pwids(MATCHING_BATCH_SIZE, rng)
+    return lambda: [get_available_responders(pwid=x, index=index) for x in pwids]
+
+
+for size in MATCHING_SIZES:
+    BENCHMARKS[f"matching/get_available_responders[{size}]"] = partial(
+        _setup_matching, size
+    )
+
+
+@benchmark("serialization/pwid")
+def _setup_pwid(rng: random.Random) -> Callable[[], Any]:
+    get_source = _cycle([x.to_dict() for x in create_pwids(100, rng)])
+    return lambda: PWID.from_dict(get_source()).to_dict()
+
+
+@benchmark("serialization/responder")
+def _setup_responder(rng: random.Random) -> Callable[[], Any]:
+    get_source = _cycle([x.to_dict() for x in create_responders(100, rng)])
+    return lambda: Responder.from_dict(get_source()).to_dict()
+
+
+def _create_distress_signals(rng: random.Random) -> List[Distress]:
+    return create_distress_signals(
+        100, rng, create_pwids(10, rng), create_responders(10, rng)
+    )
+
+
+@benchmark("serialization/distress")
+def _setup_distress(rng: random.Random) -> Callable[[], Any]:
+    get_source = _cycle([x.to_dict() for x in _create_distress_signals(rng)])
+    return lambda: Distress.from_dict(get_source()).to_dict()
+
+
+@benchmark("serialization/distress_legacy")
+def _setup_legacy_distress(rng: random.Random) -> Callable[[], Any]:
+    # Documents embedding the full PWID and responder, as before the migration
+    get_source = _cycle(
+        [x.to_dict(is_compact=False) for x in _create_distress_signals(rng)]
+    )
+    return lambda: Distress.from_dict(get_source()).to_dict(is_compact=False)
+
+
+@benchmark("text/pwid_contacts")
+def _setup_pwid_contacts(rng: random.Random) -> Callable[[], Any]:
+    get_pwid = _cycle(create_pwids(100, rng))
+    return lambda: _get_pwid_contacts(get_pwid())
+
+
+@benchmark("text/responder_message")
+def _setup_responder_message(rng: random.Random) -> Callable[[], Any]:
+    get_distress = _cycle([x for x in _create_distress_signals(rng) if x.responder])
+    bot = _Bot()
+    return lambda: _run(process_notify_responder(bot=bot, distress=get_distress()))
+
+
+@benchmark("text/dispatcher_message")
+def _setup_dispatcher_message(rng: random.Random) -> Callable[[], Any]:
+    get_distress = _cycle(_create_distress_signals(rng))
+    bot = _Bot()
+
+    def render() -> Any:
+        distress = get_distress()
+        return _run(
+            process_notify_dispatcher(
+                bot=bot, distress=distress, responder=distress.responder
+            )
+        )
+
+    return render
+
+
+@benchmark("calendar/create")
+def _setup_calendar(rng: random.Random) -> Callable[[], Any]:
+    calendar = Calendar()
+    # Fixed months, the current one would make runs incomparable over time
+    get_month = _cycle(
+        [(rng.randint(1, 12), rng.randint(1950, 2010)) for _ in range(100)]
+    )
+
+    def create() -> Any:
+        month, year = get_month()
+        return calendar.create(month=month, year=year).to_json()
+
+    return create
+
+
+def _time(operation: Callable[[], Any], repeat: int) -> dict:
+    # Calibrates the number of calls per repeat, as timeit.autorange does
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            operation()
+        if time.perf_counter() - start >= MIN_REPEAT_TIME:
+            break
+        number *= 2
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            operation()
+        timings.append((time.perf_counter() - start) / number * 1e6)
+
+    return {
+        "number": number,
+        "median_us": round(statistics.median(timings), 3),
+        "min_us": round(min(timings), 3),
+    }
+
+
+def run(names: List[str], repeat: int, seed: int) -> Dict[str, dict]:
+    results = {}
+    for name in names:
+        # Fixtures only depend on the seed and the benchmark, not on the others run
+        operation = BENCHMARKS[name](random.Random(f"{seed}:{name}"))
+        results[name] = _time(operation, repeat)
+        print(f"{name}: {results[name]['median_us']}us", file=sys.stderr)
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Optional[dict]) -> Dict[str, dict]:
+    # Ratios above 1 are slower than the baseline
+    benchmarks = (baseline or {}).get("benchmarks", {})
+    for name, result in results.items():
+        if name in benchmarks:
+            result["baseline_us"] = benchmarks[name]["median_us"]
+            result["ratio"] = round(result["median_us"] / result["baseline_us"], 3)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--filter", default="", help="Only run names containing it")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save", action="store_true", help="Write the baseline")
+    args = parser.parse_args()
+
+    names = [x for x in BENCHMARKS if args.filter in x]
+    results = run(names, args.repeat, args.seed)
+
+    if args.save:
+        baseline = {
+            "machine": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "processor": platform.machine(),
+            },
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "benchmarks": results,
+        }
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as file:
+            json.dump(baseline, file, indent=4)
+            file.write("\n")
+    else:
+        baseline = None
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as file:
+                baseline = json.load(file)
+        results = compare(results, baseline)
+
+    print(json.dumps(results, indent=4))
@@ -0,0 +1,124 @@
+"""
+Stand-in for the Telegram Bot API and ip-api, recording every call made by the
+backend. Point the backend at it with TELEGRAM_API_URL and IP_API_URL.
+
+Usage (from backend/):
+    python -m benchmarks.telegram [--port 8081] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import threading
+import time
+from typing import List, Optional
+from urllib.parse import parse_qsl
+
+from aiohttp import web
+
+# Methods answered with the Message they sent or edited, the rest with True
+MESSAGE_METHODS = ["sendMessage", "editMessageText", "editMessageReplyMarkup"]
+
+
+class FakeBotApi:
+    """
+    Answers Bot API requests after a fixed latency, as seen from the backend.
+
+    Calls are recorded with the time they arrived at, from time.perf_counter(),
+    so that they can be matched against requests made by the same process.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.calls: List[dict] = []
+        self._message_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle_bot_api(self, request: web.Request) -> web.Response:
+        params = dict(request.query)
+        # pyTelegramBotAPI sends form encoded bodies, even with GET
+        if request.content_type == "application/x-www-form-urlencoded":
+            params.update(parse_qsl(await request.text()))
+
+        method = request.match_info["method"]
+        call = {
+            "time": time.perf_counter(),
+            "method": method,
+            "chat_id": int(params["chat_id"]) if "chat_id" in params else None,
+            "message_id": int(params["message_id"]) if "message_id" in params else None,
+            "text": params.get("text", ""),
+            "reply_markup": json.loads(params.get("reply_markup", "null")),
+        }
+        await asyncio.sleep(self.latency)
+
+        if method not in MESSAGE_METHODS:
+            result = True
+        else:
+            if call["message_id"] is None:
+                call["message_id"] = next(self._message_ids)
+            result = {
+                "message_id": call["message_id"],
+                "date": int(time.time()),
+                "chat": {"id": call["chat_id"], "type": "private"},
+                "text": call["text"],
+            }
+
+        with self._lock:
+            self.calls.append(call)
+        return web.json_response({"ok": True, "result": result})
+
+    async def _handle_ip_api(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.latency)
+        return web.json_response(
+            {
+                "status": "success",
+                "district": "Bedok",
+                "zip": "460000",
+                "lat": 1.3236,
+                "lon": 103.9273,
+            }
+        )
+
+    async def start(self, host: str, port: int) -> None:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self._handle_bot_api)
+        app.router.add_get("/json/{ip}", self._handle_ip_api)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    def start_in_background(self, host: str, port: int) -> None:
+        # Serves from its own thread, so that it does not compete with the caller
+        is_ready = threading.Event()
+
+        def serve() -> None:
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start(host, port))
+            is_ready.set()
+            self._loop.run_forever()
+
+        threading.Thread(target=serve, daemon=True).start()
+        is_ready.wait()
+
+    def get_calls(self, since: float = 0.0) -> List[dict]:
+        with self._lock:
+            return [x for x in self.calls if x["time"] >= since]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds")
+    args = parser.parse_args()
+
+    api = FakeBotApi(args.latency)
+    api.start_in_background(args.host, args.port)
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print(json.dumps({"calls": len(api.get_calls())}))
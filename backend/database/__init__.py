@@ -1,18 +1,44 @@
-from typing import List
+import asyncio
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+from weakref import WeakKeyDictionary
 
 from firebase_admin.firestore import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
+from utils import get_storage_backend
+from utils.metrics import instrument_storage
+from utils.tracing import trace_storage
 
+from database.cache import responder_cache, responder_listener
 from database.errors import AlreadyExistsException, NotFoundException
-from database.models import PWID, Distress, Responder
+from database.memory import MemoryStorage
+from database.models import PWID, Distress, DistressStatus, Responder
 from database.singleton import SingletonClass
+from database.sqlite import SQLiteStorage
+from database.storage import DOCUMENT_ID, Storage
 
 
-class Firestore(SingletonClass):
+@instrument_storage
+@trace_storage
+class Firestore(Storage, SingletonClass):
+    # gRPC channels are bound to the loop that created them, so each event loop
+    # gets its own client which is then reused by every request on that loop
+    _clients: WeakKeyDictionary = WeakKeyDictionary()
+
     def __init__(self) -> None:
-        self.db = firestore.AsyncClient()
-        self.RESPONDER_COLLECTION = "responder"
-        self.PWID_COLLECTION = "pwid"
-        self.DISTRESS_COLLECTION = "distress"
+        super().__init__()
+        self.MAX_BATCH_SIZE = 500
+
+    @property
+    def db(self) -> firestore.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+
+        if client is None:
+            client = firestore.AsyncClient()
+            self._clients[loop] = client
+        return client
 
     def _validate_doc(
         self, doc: firestore.DocumentSnapshot, message: str, abort_if_created=False
@@ -31,7 +57,7 @@ class Firestore(SingletonClass):
         doc = await doc_ref.get()
 
         self._validate_doc(doc, f"{name} does not exist")
-        return PWID.from_dict(doc.to_dict())
+        return self._load(PWID, doc.to_dict())
 
     async def create_pwid(self, data: PWID) -> None:
         doc_ref = self._get_pwid_ref(data.name)
@@ -39,16 +65,25 @@ class Firestore(SingletonClass):
 
         self._validate_doc(doc, f"{data.name} already exists", True)
         await doc_ref.set(data.to_dict())
+        data.mark_clean()
 
     def _get_responder_ref(self, telegram_id: int) -> firestore.AsyncDocumentReference:
         return self.db.collection(self.RESPONDER_COLLECTION).document(str(telegram_id))
 
     async def get_responder(self, telegram_id: int) -> Responder:
+        responder_listener.start()
+        source = responder_cache.get(str(telegram_id))
+        if source is not None:
+            return self._load(Responder, source)
+
+        generation = responder_cache.get_generation()
         doc_ref = self._get_responder_ref(telegram_id)
         doc = await doc_ref.get()
 
         self._validate_doc(doc, f"{telegram_id} does not exist")
-        return Responder.from_dict(doc.to_dict())
+        source = doc.to_dict()
+        responder_cache.set(str(telegram_id), source, generation)
+        return self._load(Responder, source)
 
     async def create_responder(self, data: Responder) -> None:
         doc_ref = self._get_responder_ref(data.telegram_id)
@@ -56,6 +91,8 @@ class Firestore(SingletonClass):
 
         self._validate_doc(doc, f"{data.name} already exists", True)
         await doc_ref.set(data.to_dict())
+        data.mark_clean()
+        responder_cache.set(str(data.telegram_id), data.to_dict())
 
     async def get_responders(self) -> List[Responder]:
         docs = (
@@ -64,79 +101,284 @@ class Firestore(SingletonClass):
             .stream()
         )
 
+        generation = responder_cache.get_generation()
         responders = []
         async for x in docs:  # type: ignore
-            responders.append(Responder.from_dict(x.to_dict()))
+            source = x.to_dict()
+            responder_cache.set(x.id, source, generation)
+            responders.append(self._load(Responder, source))
 
         return responders
 
-    async def update_responder(self, data: Responder) -> None:
-        doc_ref = self._get_responder_ref(data.telegram_id)
-        await doc_ref.update(data.to_dict())
-
-    async def update_latest_bot_message(
-        self, data: Responder | int, message_id: int
-    ) -> None:
-        responder = (
-            await self.get_responder(data.telegram_id)
-            if isinstance(data, Responder)
-            else await self.get_responder(data)
-        )
-        responder.message_id = message_id
-
-        await self.update_responder(responder)
-
-    async def get_latest_bot_message(self, data: Responder) -> int:
-        responder = await self.get_responder(data.telegram_id)
-
-        return responder.message_id
+    async def update_responder_fields(self, telegram_id: int, fields: dict) -> None:
+        doc_ref = self._get_responder_ref(telegram_id)
+        await doc_ref.update(fields)
+        responder_cache.update(str(telegram_id), fields)
 
-    def _get_distress_ref(self, doc_id: int) -> firestore.AsyncDocumentReference:
+    def _get_distress_ref(self, doc_id: str) -> firestore.AsyncDocumentReference:
         return self.db.collection(self.DISTRESS_COLLECTION).document(str(doc_id))
 
     async def create_distress(self, data: Distress) -> None:
-        doc_ref = self._get_distress_ref(data.group_chat_message_id)
+        doc_ref = self._get_distress_ref(data.id)
+        data.updated_at = str(datetime.now())
         await doc_ref.set(data.to_dict())
+        data.mark_clean()
 
-    async def get_distress(self, group_chat_message_id: int) -> Distress:
-        doc_ref = self._get_distress_ref(group_chat_message_id)
+    async def get_distress(self, id: str) -> Distress:
+        doc_ref = self._get_distress_ref(id)
         doc = await doc_ref.get()
 
-        return Distress.from_dict(doc.to_dict())
+        self._validate_doc(doc, f"{id} does not exist")
+        return self._load(Distress, doc.to_dict())
 
     async def update_distress(self, data: Distress) -> None:
-        doc_ref = self._get_distress_ref(data.group_chat_message_id)
-        await doc_ref.update(data.to_dict())
-
-    async def get_all_pending_distress(self) -> List[Distress]:
-        docs = (
+        changes = self._get_distress_changes(data)
+        if not changes:
+            return
+
+        doc_ref = self._get_distress_ref(data.id)
+        await doc_ref.update(changes)
+        data.mark_clean()
+
+    async def update_distresses(self, data: List[Distress]) -> None:
+        changed = [(x, self._get_distress_changes(x)) for x in data]
+        changed = [(x, changes) for x, changes in changed if changes]
+
+        # Firestore caps a single batch at 500 writes
+        for i in range(0, len(changed), self.MAX_BATCH_SIZE):
+            batch = self.db.batch()
+            for distress, changes in changed[i : i + self.MAX_BATCH_SIZE]:
+                batch.update(self._get_distress_ref(distress.id), changes)
+            await batch.commit()
+
+        for distress, _ in changed:
+            distress.mark_clean()
+
+    def _get_pending_distress_query(self) -> firestore.AsyncQuery:
+        return (
             self.db.collection(self.DISTRESS_COLLECTION)
             .where("is_acknowledged", "==", False)
             .where("responder", "==", {})
-            .stream()
         )
 
+    def _get_incomplete_distress_query(self) -> firestore.AsyncQuery:
+        return self.db.collection(self.DISTRESS_COLLECTION).where(
+            "is_completed", "==", False
+        )
+
+    async def _count(self, query: firestore.AsyncQuery) -> int:
+        # Aggregated by Firestore, billed as one read per 1000 documents counted
+        results = await query.count().get()
+        return int(results[0][0].value)
+
+    async def get_all_pending_distress(self) -> List[Distress]:
+        docs = self._get_pending_distress_query().stream()
+
         distress_signals = []
         async for x in docs:  # type: ignore
-            distress_signals.append(Distress.from_dict(x.to_dict()))
+            distress_signals.append(self._load(Distress, x.to_dict()))
         return distress_signals
 
     async def get_all_incomplete_distress(self) -> List[Distress]:
-        docs = (
+        docs = self._get_incomplete_distress_query().stream()
+
+        distress_signals = []
+        async for x in docs:  # type: ignore
+            distress_signals.append(self._load(Distress, x.to_dict()))
+        return distress_signals
+
+    async def count_pending_distress(self) -> int:
+        return await self._count(self._get_pending_distress_query())
+
+    async def count_incomplete_distress(self) -> int:
+        return await self._count(self._get_incomplete_distress_query())
+
+    def _filter_distress_status(
+        self, query: firestore.AsyncQuery, status: Optional[DistressStatus]
+    ) -> firestore.AsyncQuery:
+        if status == DistressStatus.COMPLETED:
+            return query.where("is_completed", "==", True)
+        if status == DistressStatus.ACKNOWLEDGED:
+            return query.where("is_completed", "==", False).where(
+                "is_acknowledged", "==", True
+            )
+        if status == DistressStatus.PENDING:
+            return query.where("is_completed", "==", False).where(
+                "is_acknowledged", "==", False
+            )
+        return query
+
+    async def get_distress_in_bounds(
+        self,
+        south: float,
+        west: float,
+        north: float,
+        east: float,
+        status: Optional[DistressStatus] = None,
+    ) -> List[dict]:
+        # Firestore only allows range filters on a single field, so longitude is
+        # filtered after the latitude band is read
+        query = (
             self.db.collection(self.DISTRESS_COLLECTION)
-            .where("is_completed", "==", False)
+            .where("location.latitude", ">=", south)
+            .where("location.latitude", "<", north)
+        )
+        docs = (
+            self._filter_distress_status(query, status)
+            .select(["id", "location", "is_completed", "is_acknowledged"])
             .stream()
         )
 
         distress_signals = []
         async for x in docs:  # type: ignore
-            distress_signals.append(Distress.from_dict(x.to_dict()))
+            source = {**x.to_dict(), "id": x.id}
+            if west <= source["location"]["longitude"] < east:
+                distress_signals.append(source)
         return distress_signals
 
-    async def get_all_distress(self) -> List[Distress]:
-        docs = self.db.collection(self.DISTRESS_COLLECTION).stream()  # type: ignore
+    async def get_distress_page(
+        self,
+        limit: int,
+        cursor: Optional[dict] = None,
+        status: Optional[DistressStatus] = None,
+        pwid: Optional[str] = None,
+        created_after: Optional[str] = None,
+        created_before: Optional[str] = None,
+        updated_after: Optional[str] = None,
+        sort: str = "created_at",
+        is_descending: bool = True,
+        fields: Optional[List[str]] = None,
+    ) -> Tuple[List[dict], Optional[dict]]:
+        sort_fields = self._get_distress_sort_fields(
+            sort, created_after, created_before, updated_after
+        )
+        query = self.db.collection(self.DISTRESS_COLLECTION)
 
-        distress_signals = []
+        query = self._filter_distress_status(query, status)
+
+        if pwid:
+            query = query.where("pwid.name", "==", pwid)
+        if created_after:
+            query = query.where("created_at", ">=", created_after)
+        if created_before:
+            query = query.where("created_at", "<", created_before)
+        if updated_after:
+            query = query.where("updated_at", ">", updated_after)
+
+        direction = (
+            firestore.Query.DESCENDING if is_descending else firestore.Query.ASCENDING
+        )
+        for field in sort_fields:
+            query = query.order_by(field, direction=direction)
+        query = query.order_by(FieldPath.document_id(), direction=direction)
+
+        if fields is not None:
+            # Sorted fields are needed to build the next cursor
+            query = query.select(list(dict.fromkeys(fields + sort_fields)))
+        if cursor is not None:
+            query = query.start_after(cursor)
+
+        # One extra document tells whether there is a next page
+        docs = query.limit(limit + 1).stream()
+
+        snapshots = []
         async for x in docs:  # type: ignore
-            distress_signals.append(Distress.from_dict(x.to_dict()))
-        return distress_signals
+            snapshots.append(x)
+
+        next_cursor = None
+        if len(snapshots) > limit:
+            snapshots = snapshots[:limit]
+            last = snapshots[-1]
+            next_cursor = {x: last.get(x) for x in sort_fields}
+            next_cursor[DOCUMENT_ID] = last.id
+
+        return [x.to_dict() for x in snapshots], next_cursor
+
+    async def get_distress_watermark(self) -> Optional[str]:
+        # Latest update across all distress signals, a single document read
+        docs = (
+            self.db.collection(self.DISTRESS_COLLECTION)
+            .order_by("updated_at", direction=firestore.Query.DESCENDING)
+            .select(["updated_at"])
+            .limit(1)
+            .stream()
+        )
+
+        async for x in docs:  # type: ignore
+            return x.get("updated_at")
+        return None
+
+    def _get_sos_lock_ref(self, name: str) -> firestore.AsyncDocumentReference:
+        return self.db.collection(self.SOS_LOCK_COLLECTION).document(name)
+
+    async def claim_sos_request(self, name: str, window: float) -> bool:
+        doc_ref = self._get_sos_lock_ref(name)
+
+        @firestore.async_transactional
+        async def claim(transaction: firestore.AsyncTransaction) -> bool:
+            doc = await doc_ref.get(transaction=transaction)
+            now = time.time()
+
+            if doc.exists and now - doc.to_dict()["claimed_at"] < window:
+                return False
+
+            transaction.set(doc_ref, {"claimed_at": now})
+            return True
+
+        return await claim(self.db.transaction())
+
+    async def release_sos_request(self, name: str) -> None:
+        await self._get_sos_lock_ref(name).delete()
+
+    async def resolve_sos_request(self, name: str, response: Tuple[str, int]) -> None:
+        await self._get_sos_lock_ref(name).set({"response": list(response)}, merge=True)
+
+    async def get_sos_request(self, name: str) -> Optional[dict]:
+        doc = await self._get_sos_lock_ref(name).get()
+        return doc.to_dict() if doc.exists else None
+
+    def _get_distress_lease_ref(self, id: str) -> firestore.AsyncDocumentReference:
+        return self.db.collection(self.DISTRESS_LEASE_COLLECTION).document(id)
+
+    async def claim_distress_lease(self, id: str, owner: str, duration: float) -> bool:
+        doc_ref = self._get_distress_lease_ref(id)
+
+        @firestore.async_transactional
+        async def claim(transaction: firestore.AsyncTransaction) -> bool:
+            doc = await doc_ref.get(transaction=transaction)
+            now = time.time()
+
+            if doc.exists:
+                lease = doc.to_dict()
+                if lease["owner"] != owner and lease["expires_at"] > now:
+                    return False
+
+            transaction.set(doc_ref, {"owner": owner, "expires_at": now + duration})
+            return True
+
+        return await claim(self.db.transaction())
+
+    async def release_distress_lease(self, id: str, owner: str) -> None:
+        doc_ref = self._get_distress_lease_ref(id)
+
+        @firestore.async_transactional
+        async def release(transaction: firestore.AsyncTransaction) -> None:
+            doc = await doc_ref.get(transaction=transaction)
+
+            # An expired lease may have been claimed by another worker since
+            if doc.exists and doc.to_dict()["owner"] == owner:
+                transaction.delete(doc_ref)
+
+        await release(self.db.transaction())
+
+
+def get_database() -> Storage:
+    backend = get_storage_backend()
+
+    if backend == "firestore":
+        return Firestore()
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "sqlite":
+        return SQLiteStorage()
+    raise ValueError(f"Unknown storage backend {backend}")
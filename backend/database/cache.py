@@ -0,0 +1,214 @@
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from copy import deepcopy
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+
+from cachetools import TTLCache
+from firebase_admin.firestore import firestore
+from google.cloud.firestore_v1.watch import ChangeType
+from utils import get_responder_cache_size, get_responder_cache_ttl
+
+# Documents read while handling a single update, shared by the handler tasks
+_request_documents: ContextVar[Optional[Dict[str, dict]]] = ContextVar(
+    "request_documents", default=None
+)
+
+
+def apply_fields(source: dict, fields: dict) -> None:
+    # Applies dotted field paths, e.g. location.latitude, onto a nested dict
+    for path, value in fields.items():
+        *parents, key = path.split(".")
+        target = source
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[key] = deepcopy(value)
+
+
+class DocumentCache:
+    """
+    Read-through cache of raw documents with LRU + TTL eviction.
+
+    The process-wide entries are only served while they are kept in sync with
+    writes made by every worker, see CacheListener. Reads inside a request
+    scope are additionally memoized for the rest of the scope, so one update
+    never reads the same document twice. Entries are stored as dicts and
+    copied on the way in and out, so that callers never share mutable state
+    with the cache or with each other.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self._cache = TTLCache(maxsize=max_size, ttl=ttl)
+        self._lock = threading.Lock()
+        # Moves on every change, so reads that raced one are not cached
+        self._generation = 0
+        self.is_synced = False
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[dict]:
+        documents = _request_documents.get()
+        source = documents.get(key) if documents is not None else None
+
+        if source is None:
+            with self._lock:
+                source = self._cache.get(key) if self.is_synced else None
+                if source is None:
+                    self.misses += 1
+                    return None
+                self.hits += 1
+
+            if documents is not None:
+                documents[key] = source
+        return deepcopy(source)
+
+    def get_generation(self) -> int:
+        # Taken before reading a document to set() afterwards
+        return self._generation
+
+    def set(self, key: str, source: dict, generation: Optional[int] = None) -> None:
+        """
+        Caches a document read from or written to the database.
+        :param key: Key of the document.
+        :param source: The document.
+        :param generation: get_generation() from before the document was read,
+        the process-wide entry is skipped if anything changed since.
+        """
+        source = deepcopy(source)
+        with self._lock:
+            if self.is_synced and generation in (None, self._generation):
+                self._cache[key] = source
+
+        documents = _request_documents.get()
+        if documents is not None:
+            documents[key] = source
+
+    def update(self, key: str, fields: dict) -> None:
+        """
+        Writes through a partial update to the scope's copy of a document. The
+        process-wide copy is dropped until the committed document is seen.
+        :param key: Key of the document.
+        :param fields: Mapping of dotted field paths to their new values.
+        """
+        with self._lock:
+            self._cache.pop(key, None)
+            self._generation += 1
+
+        documents = _request_documents.get()
+        if documents is not None and key in documents:
+            # Memoized dicts are never mutated in place, callers may hold them
+            source = deepcopy(documents[key])
+            apply_fields(source, fields)
+            documents[key] = source
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._cache.pop(key, None)
+            self._generation += 1
+
+        documents = _request_documents.get()
+        if documents is not None:
+            documents.pop(key, None)
+
+    def apply_changes(self, sources: Dict[str, Optional[dict]]) -> None:
+        """
+        Replaces the process-wide copies of documents committed by any worker.
+        :param sources: Mapping of keys to their documents, None if deleted.
+        """
+        with self._lock:
+            for key, source in sources.items():
+                if source is None:
+                    self._cache.pop(key, None)
+                else:
+                    self._cache[key] = source
+            self._generation += 1
+
+    def set_synced(self, is_synced: bool) -> None:
+        with self._lock:
+            if not is_synced:
+                # Entries may miss changes while out of sync
+                self._cache.clear()
+            self._generation += 1
+            self.is_synced = is_synced
+
+    def get_metrics(self) -> dict:
+        return {
+            "is_synced": self.is_synced,
+            "size": len(self._cache),
+            "max_size": self._cache.maxsize,
+            "ttl": self._cache.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class CacheListener:
+    """
+    Keeps a DocumentCache in sync with a Firestore collection.
+
+    A snapshot listener on the collection delivers every document committed by
+    any worker in commit order, and replaces the cached copy with it. The
+    cache is only served once the first snapshot arrived, and is cleared and
+    bypassed whenever the listener has to be restarted.
+    """
+
+    def __init__(self, cache: DocumentCache, collection: str) -> None:
+        self.cache = cache
+        self.collection = collection
+        self._lock = threading.Lock()
+        self._watch = None
+
+    def start(self) -> None:
+        with self._lock:
+            if self._watch is not None and self._watch.is_active:
+                return
+            if self._watch is not None:
+                self._watch.unsubscribe()
+
+            self.cache.set_synced(False)
+            self._watch = (
+                firestore.Client()
+                .collection(self.collection)
+                .on_snapshot(self._on_snapshot)
+            )
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._watch is not None:
+                self._watch.unsubscribe()
+                self._watch = None
+            self.cache.set_synced(False)
+
+    def _on_snapshot(self, docs, changes, read_time: datetime) -> None:
+        # First snapshot after (re)subscribing replays every document as added
+        self.cache.apply_changes(
+            {
+                x.document.id: None
+                if x.type == ChangeType.REMOVED
+                else x.document.to_dict()
+                for x in changes
+            }
+        )
+        if not self.cache.is_synced:
+            self.cache.set_synced(True)
+
+
+@contextmanager
+def request_scope() -> Iterator[None]:
+    # Nested scopes reuse the outermost one
+    if _request_documents.get() is not None:
+        yield
+        return
+
+    token = _request_documents.set({})
+    try:
+        yield
+    finally:
+        _request_documents.reset(token)
+
+
+responder_cache = DocumentCache(
+    max_size=get_responder_cache_size(), ttl=get_responder_cache_ttl()
+)
+responder_listener = CacheListener(responder_cache, "responder")
@@ -0,0 +1,144 @@
+import threading
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from cachetools import LRUCache
+from firebase_admin.firestore import firestore
+from utils import get_delta_overlap
+from utils.events import Event, EventBroker, distress_events
+
+from database import get_database
+from database.singleton import SingletonClass
+from database.storage import LocalStorage
+
+# Distress signals whose last status is remembered to classify their changes
+MAX_TRACKED_DISTRESS = 10000
+
+
+def get_event_id(source: dict) -> str:
+    # "#" sorts before the fractional seconds, so IDs order like updated_at
+    return f"{source['updated_at']}#{source['id']}"
+
+
+def get_overlap_start(updated_at: str) -> str:
+    """
+    updated_at is set by each worker before its write commits, so a write
+    committed later may carry an earlier time than changes already read.
+    Changes are read again from DELTA_OVERLAP seconds earlier instead, and
+    clients skip those they already have.
+    :param updated_at: Time of the last change read, or an event ID.
+    """
+    updated_at = updated_at.split("#")[0]
+    overlap = timedelta(seconds=get_delta_overlap())
+    return str(datetime.fromisoformat(updated_at) - overlap)
+
+
+def get_event_type(previous: Optional[dict], current: dict, is_new: bool) -> str:
+    """
+    Classifies a change to a distress signal.
+    :param previous: Last seen state of the distress signal, None if unseen.
+    :param current: Current state of the distress signal.
+    :param is_new: Whether the distress signal was created after the feed started.
+    """
+    if previous is None:
+        if is_new:
+            return "created"
+        previous = {"is_completed": False, "is_acknowledged": False, "responder": {}}
+
+    if current["is_completed"] and not previous["is_completed"]:
+        # Dispatchers complete signals they acknowledge themselves
+        return "completed" if current["is_acknowledged"] else "cancelled"
+    if current["is_acknowledged"] and not previous["is_acknowledged"]:
+        return "acknowledged"
+    if current["responder"].get("id") != previous["responder"].get("id"):
+        return "assigned" if current["responder"] else "declined"
+    return "updated"
+
+
+class DistressFeed(SingletonClass):
+    """
+    Publishes distress lifecycle events to the process' event broker.
+
+    A single Firestore listener on recently updated distress signals feeds
+    every subscriber of the process, so each worker sees changes made by any
+    other worker without polling. Local backends have no listeners, their
+    writes are published as they are made and only reach the same process.
+    """
+
+    def __init__(self, broker: EventBroker = distress_events) -> None:
+        # Singleton is re-initialised on every instantiation
+        if hasattr(self, "_lock"):
+            return
+
+        self.DISTRESS_COLLECTION = "distress"
+        self.broker = broker
+        self._lock = threading.Lock()
+        self._watch = None
+        self._is_listening = False
+        self._started_at = str(datetime.now())
+        self._watermark = self._started_at
+        self._states = LRUCache(maxsize=MAX_TRACKED_DISTRESS)
+
+    def start(self) -> None:
+        database = get_database()
+        if isinstance(database, LocalStorage):
+            with self._lock:
+                if not self._is_listening:
+                    database.add_distress_listener(self._publish)
+                    self._is_listening = True
+            return
+
+        with self._lock:
+            if self._watch is not None and self._watch.is_active:
+                return
+            if self._watch is not None:
+                self._watch.unsubscribe()
+
+            # Resume from the last published change after a reconnect, changes
+            # already published are skipped by _publish()
+            query = (
+                firestore.Client()
+                .collection(self.DISTRESS_COLLECTION)
+                .where("updated_at", ">=", get_overlap_start(self._watermark))
+            )
+            self._watch = query.on_snapshot(self._on_snapshot)
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._watch is not None:
+                self._watch.unsubscribe()
+                self._watch = None
+
+    def _on_snapshot(self, docs, changes, read_time: datetime) -> None:
+        self._publish([{**x.document.to_dict(), "id": x.document.id} for x in changes])
+
+    def _publish(self, sources: List[dict]) -> None:
+        for source in sorted(sources, key=get_event_id):
+            # Snapshots after (re)subscribing replay documents already published
+            previous = self._states.get(source["id"])
+            if previous is not None and previous["updated_at"] >= source["updated_at"]:
+                continue
+
+            event_type = get_event_type(
+                previous, source, source["created_at"] >= self._started_at
+            )
+            self._states[source["id"]] = {
+                "is_completed": source["is_completed"],
+                "is_acknowledged": source["is_acknowledged"],
+                "responder": source["responder"],
+                "updated_at": source["updated_at"],
+            }
+            self._watermark = max(self._watermark, source["updated_at"])
+            self.broker.publish(Event(get_event_id(source), event_type, source))
+
+    def is_healthy(self) -> bool:
+        if self._is_listening:
+            return True
+        return self._watch is not None and self._watch.is_active
+
+    def get_metrics(self) -> dict:
+        return {
+            "is_healthy": self.is_healthy(),
+            "watermark": self._watermark,
+            **self.broker.get_metrics(),
+        }
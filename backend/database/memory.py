@@ -0,0 +1,320 @@
+import threading
+import time
+from copy import deepcopy
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.metrics import instrument_storage
+from utils.tracing import trace_storage
+
+from database.cache import apply_fields
+from database.errors import AlreadyExistsException, NotFoundException
+from database.models import PWID, Distress, DistressStatus, Responder
+from database.singleton import SingletonClass
+from database.storage import DOCUMENT_ID, LocalStorage, project
+
+
+def _matches_status(source: dict, status: Optional[DistressStatus]) -> bool:
+    if status == DistressStatus.COMPLETED:
+        return source["is_completed"]
+    if status == DistressStatus.ACKNOWLEDGED:
+        return not source["is_completed"] and source["is_acknowledged"]
+    if status == DistressStatus.PENDING:
+        return not source["is_completed"] and not source["is_acknowledged"]
+    return True
+
+
+def _is_pending(source: dict) -> bool:
+    # Neither acknowledged nor assigned to a responder
+    return not source["is_acknowledged"] and source["responder"] == {}
+
+
+def _is_incomplete(source: dict) -> bool:
+    return not source["is_completed"]
+
+
+@instrument_storage
+@trace_storage
+class MemoryStorage(LocalStorage, SingletonClass):
+    """
+    Keeps every collection in dicts of the process, e.g. for local development
+    and load tests without a Firestore project.
+
+    Documents are copied on the way in and out, as with a remote database.
+    Nothing is shared between workers or persisted across restarts.
+    """
+
+    def __init__(self) -> None:
+        # Singleton is re-initialised on every instantiation
+        if hasattr(self, "_lock"):
+            return
+
+        super().__init__()
+        self._lock = threading.Lock()
+        self._collections: Dict[str, Dict[str, dict]] = {
+            self.PWID_COLLECTION: {},
+            self.RESPONDER_COLLECTION: {},
+            self.DISTRESS_COLLECTION: {},
+            self.SOS_LOCK_COLLECTION: {},
+            self.DISTRESS_LEASE_COLLECTION: {},
+        }
+
+    def _get(self, collection: str, id: str, message: str) -> dict:
+        with self._lock:
+            source = self._collections[collection].get(id)
+        if source is None:
+            raise NotFoundException(message)
+        return deepcopy(source)
+
+    def _create(self, collection: str, id: str, source: dict, message: str) -> None:
+        source = deepcopy(source)
+        with self._lock:
+            if id in self._collections[collection]:
+                raise AlreadyExistsException(message)
+            self._collections[collection][id] = source
+
+    def _update(self, collection: str, changes: List[Tuple[str, dict]]) -> List[dict]:
+        # Applied together, none of them are if any document is missing
+        documents = self._collections[collection]
+        with self._lock:
+            for id, _ in changes:
+                if id not in documents:
+                    raise NotFoundException(f"{id} does not exist")
+
+            sources = []
+            for id, fields in changes:
+                source = deepcopy(documents[id])
+                apply_fields(source, fields)
+                documents[id] = source
+                sources.append({**deepcopy(source), "id": id})
+        return sources
+
+    def _count(self, collection: str, predicate: Callable[[dict], bool]) -> int:
+        with self._lock:
+            return sum(
+                1 for x in self._collections[collection].values() if predicate(x)
+            )
+
+    def _find(
+        self, collection: str, predicate: Callable[[dict], bool]
+    ) -> List[Tuple[str, dict]]:
+        # Ordered by document ID, as Firestore returns unordered queries
+        with self._lock:
+            documents = [
+                (id, x)
+                for id, x in self._collections[collection].items()
+                if predicate(x)
+            ]
+        return [(id, deepcopy(x)) for id, x in sorted(documents, key=lambda x: x[0])]
+
+    async def get_pwid(self, name: str) -> PWID:
+        source = self._get(self.PWID_COLLECTION, name, f"{name} does not exist")
+        return self._load(PWID, source)
+
+    async def create_pwid(self, data: PWID) -> None:
+        self._create(
+            self.PWID_COLLECTION,
+            data.name,
+            data.to_dict(),
+            f"{data.name} already exists",
+        )
+        data.mark_clean()
+
+    async def get_responder(self, telegram_id: int) -> Responder:
+        source = self._get(
+            self.RESPONDER_COLLECTION,
+            str(telegram_id),
+            f"{telegram_id} does not exist",
+        )
+        return self._load(Responder, source)
+
+    async def create_responder(self, data: Responder) -> None:
+        self._create(
+            self.RESPONDER_COLLECTION,
+            str(data.telegram_id),
+            data.to_dict(),
+            f"{data.name} already exists",
+        )
+        data.mark_clean()
+
+    async def get_responders(self) -> List[Responder]:
+        documents = self._find(self.RESPONDER_COLLECTION, lambda x: x["is_available"])
+        return [self._load(Responder, x) for _, x in documents]
+
+    async def update_responder_fields(self, telegram_id: int, fields: dict) -> None:
+        self._update(self.RESPONDER_COLLECTION, [(str(telegram_id), fields)])
+
+    async def create_distress(self, data: Distress) -> None:
+        data.updated_at = str(datetime.now())
+        source = data.to_dict()
+
+        with self._lock:
+            self._collections[self.DISTRESS_COLLECTION][str(data.id)] = deepcopy(source)
+        data.mark_clean()
+        self._notify_distress([{**source, "id": str(data.id)}])
+
+    async def get_distress(self, id: str) -> Distress:
+        source = self._get(self.DISTRESS_COLLECTION, str(id), f"{id} does not exist")
+        return self._load(Distress, source)
+
+    async def update_distress(self, data: Distress) -> None:
+        await self.update_distresses([data])
+
+    async def update_distresses(self, data: List[Distress]) -> None:
+        changed = [(x, self._get_distress_changes(x)) for x in data]
+        changed = [(x, changes) for x, changes in changed if changes]
+        if not changed:
+            return
+
+        sources = self._update(
+            self.DISTRESS_COLLECTION,
+            [(str(x.id), changes) for x, changes in changed],
+        )
+        for distress, _ in changed:
+            distress.mark_clean()
+        self._notify_distress(sources)
+
+    async def get_all_pending_distress(self) -> List[Distress]:
+        documents = self._find(self.DISTRESS_COLLECTION, _is_pending)
+        return [self._load(Distress, x) for _, x in documents]
+
+    async def get_all_incomplete_distress(self) -> List[Distress]:
+        documents = self._find(self.DISTRESS_COLLECTION, _is_incomplete)
+        return [self._load(Distress, x) for _, x in documents]
+
+    async def count_pending_distress(self) -> int:
+        return self._count(self.DISTRESS_COLLECTION, _is_pending)
+
+    async def count_incomplete_distress(self) -> int:
+        return self._count(self.DISTRESS_COLLECTION, _is_incomplete)
+
+    async def get_distress_in_bounds(
+        self,
+        south: float,
+        west: float,
+        north: float,
+        east: float,
+        status: Optional[DistressStatus] = None,
+    ) -> List[dict]:
+        documents = self._find(
+            self.DISTRESS_COLLECTION,
+            lambda x: south <= x["location"]["latitude"] < north
+            and west <= x["location"]["longitude"] < east
+            and _matches_status(x, status),
+        )
+
+        # Ordered by latitude, as Firestore orders by the range filtered field
+        documents.sort(key=lambda x: (x[1]["location"]["latitude"], x[0]))
+        fields = ["id", "location", "is_completed", "is_acknowledged"]
+        return [{**project(x, fields), "id": id} for id, x in documents]
+
+    async def get_distress_page(
+        self,
+        limit: int,
+        cursor: Optional[dict] = None,
+        status: Optional[DistressStatus] = None,
+        pwid: Optional[str] = None,
+        created_after: Optional[str] = None,
+        created_before: Optional[str] = None,
+        updated_after: Optional[str] = None,
+        sort: str = "created_at",
+        is_descending: bool = True,
+        fields: Optional[List[str]] = None,
+    ) -> Tuple[List[dict], Optional[dict]]:
+        sort_fields = self._get_distress_sort_fields(
+            sort, created_after, created_before, updated_after
+        )
+
+        def matches(source: dict) -> bool:
+            return (
+                # Documents missing a sorted field are left out, as by Firestore
+                all(source.get(x) is not None for x in sort_fields)
+                and _matches_status(source, status)
+                and (not pwid or source["pwid"].get("name") == pwid)
+                and (not created_after or source["created_at"] >= created_after)
+                and (not created_before or source["created_at"] < created_before)
+                and (not updated_after or source["updated_at"] > updated_after)
+            )
+
+        def get_key(id: str, source: dict) -> tuple:
+            return (*[source[x] for x in sort_fields], id)
+
+        documents = self._find(self.DISTRESS_COLLECTION, matches)
+        if cursor is not None:
+            start = (*[cursor[x] for x in sort_fields], cursor[DOCUMENT_ID])
+            documents = [
+                (id, x)
+                for id, x in documents
+                if (get_key(id, x) < start if is_descending else get_key(id, x) > start)
+            ]
+        documents.sort(key=lambda x: get_key(*x), reverse=is_descending)
+
+        next_cursor = None
+        if len(documents) > limit:
+            documents = documents[:limit]
+            last_id, last = documents[-1]
+            next_cursor = {x: last[x] for x in sort_fields}
+            next_cursor[DOCUMENT_ID] = last_id
+
+        if fields is not None:
+            fields = list(dict.fromkeys(fields + sort_fields))
+            return [project(x, fields) for _, x in documents], next_cursor
+        return [x for _, x in documents], next_cursor
+
+    async def get_distress_watermark(self) -> Optional[str]:
+        with self._lock:
+            return max(
+                (
+                    x["updated_at"]
+                    for x in self._collections[self.DISTRESS_COLLECTION].values()
+                    if x.get("updated_at") is not None
+                ),
+                default=None,
+            )
+
+    async def claim_sos_request(self, name: str, window: float) -> bool:
+        locks = self._collections[self.SOS_LOCK_COLLECTION]
+        now = time.time()
+
+        with self._lock:
+            if name in locks and now - locks[name]["claimed_at"] < window:
+                return False
+            locks[name] = {"claimed_at": now}
+            return True
+
+    async def release_sos_request(self, name: str) -> None:
+        with self._lock:
+            self._collections[self.SOS_LOCK_COLLECTION].pop(name, None)
+
+    async def resolve_sos_request(self, name: str, response: Tuple[str, int]) -> None:
+        locks = self._collections[self.SOS_LOCK_COLLECTION]
+
+        with self._lock:
+            if name in locks:
+                locks[name] = {**locks[name], "response": list(response)}
+
+    async def get_sos_request(self, name: str) -> Optional[dict]:
+        with self._lock:
+            return deepcopy(self._collections[self.SOS_LOCK_COLLECTION].get(name))
+
+    async def claim_distress_lease(self, id: str, owner: str, duration: float) -> bool:
+        leases = self._collections[self.DISTRESS_LEASE_COLLECTION]
+        now = time.time()
+
+        with self._lock:
+            lease = leases.get(id)
+            if (
+                lease is not None
+                and lease["owner"] != owner
+                and lease["expires_at"] > now
+            ):
+                return False
+            leases[id] = {"owner": owner, "expires_at": now + duration}
+            return True
+
+    async def release_distress_lease(self, id: str, owner: str) -> None:
+        leases = self._collections[self.DISTRESS_LEASE_COLLECTION]
+
+        with self._lock:
+            if id in leases and leases[id]["owner"] == owner:
+                del leases[id]
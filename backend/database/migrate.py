@@ -0,0 +1,96 @@
+"""
+Rewrites legacy distress documents, which embed the full PWID and responder,
+into the compact format that only stores their summaries.
+
+Usage (from backend/):
+    python -m database.migrate [--dry-run]
+"""
+import argparse
+import asyncio
+import os
+
+from dotenv import load_dotenv
+from firebase_admin import initialize_app
+
+from database import Firestore
+from database.models import Distress
+
+# Fixed overhead Firestore adds to every document, excluding its name
+DOCUMENT_OVERHEAD = 32
+
+
+def get_field_size(value) -> int:
+    # Storage size as documented at https://firebase.google.com/docs/firestore/storage-size
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 8
+    if isinstance(value, str):
+        return len(value.encode("utf-8")) + 1
+    if isinstance(value, list):
+        return sum(get_field_size(x) for x in value)
+    if isinstance(value, dict):
+        return sum(
+            len(k.encode("utf-8")) + 1 + get_field_size(v) for k, v in value.items()
+        )
+    raise TypeError(f"Unsupported field type {type(value).__name__}")
+
+
+def get_document_size(source: dict) -> int:
+    return get_field_size(source) + DOCUMENT_OVERHEAD
+
+
+async def migrate_distress(is_dry_run: bool = False) -> dict:
+    """
+    Migrates every legacy distress document.
+    :param is_dry_run: Only report what would be migrated.
+    :return: Number of documents scanned and migrated, and their size before and after.
+    """
+    database = Firestore()
+    docs = database.db.collection(database.DISTRESS_COLLECTION).stream()
+
+    result = {"scanned": 0, "migrated": 0, "bytes_before": 0, "bytes_after": 0}
+    pending = []
+
+    async for x in docs:  # type: ignore
+        result["scanned"] += 1
+        source = x.to_dict()
+        if not Distress.is_legacy(source):
+            continue
+
+        compact = Distress.from_dict(source).to_dict()
+        result["migrated"] += 1
+        result["bytes_before"] += get_document_size(source)
+        result["bytes_after"] += get_document_size(compact)
+        pending.append((x.reference, compact))
+
+    if is_dry_run:
+        return result
+
+    # Overwrite rather than update so that the embedded fields are dropped
+    for i in range(0, len(pending), database.MAX_BATCH_SIZE):
+        batch = database.db.batch()
+        for doc_ref, compact in pending[i : i + database.MAX_BATCH_SIZE]:
+            batch.set(doc_ref, compact)
+        await batch.commit()
+
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    load_dotenv()
+    os.environ.setdefault(
+        "GOOGLE_APPLICATION_CREDENTIALS", str(os.getenv("CREDENTIAL_PATH"))
+    )
+    initialize_app()
+
+    result = asyncio.run(migrate_distress(is_dry_run=args.dry_run))
+    print(
+        f"{result['migrated']}/{result['scanned']} distress signals "
+        f"{'would be ' if args.dry_run else ''}migrated, "
+        f"{result['bytes_before']} -> {result['bytes_after']} bytes"
+    )
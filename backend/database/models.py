@@ -1,6 +1,56 @@
+from abc import ABC, abstractmethod
+from copy import deepcopy
 from datetime import datetime
 from enum import Enum
 from typing import List, Optional
+from weakref import WeakKeyDictionary
+
+# Last persisted state of each loaded document, kept out of the instances' vars
+_snapshots: WeakKeyDictionary = WeakKeyDictionary()
+
+
+def _get_changed_fields(previous: dict, current: dict, prefix: str = "") -> dict:
+    changes = {}
+
+    for key, value in current.items():
+        path = f"{prefix}{key}"
+        old_value = previous.get(key)
+
+        # Nested maps are diffed into dotted field paths, e.g. location.latitude
+        if (
+            isinstance(value, dict)
+            and isinstance(old_value, dict)
+            and value
+            and old_value
+        ):
+            changes.update(_get_changed_fields(old_value, value, f"{path}."))
+        elif key not in previous or old_value != value:
+            changes[path] = value
+    return changes
+
+
+class Document(ABC):
+    @abstractmethod
+    def to_dict(self) -> dict:
+        raise NotImplementedError
+
+    def mark_clean(self) -> None:
+        # Called once the current state matches what is stored, copied so that
+        # in-place list mutations still show up as changes
+        _snapshots[self] = deepcopy(self.to_dict())
+
+    def get_changes(self) -> dict:
+        """
+        Returns the fields that differ from the last persisted state.
+        :return: Mapping of dotted field paths to their new values, or the whole
+        document if it was never loaded or persisted.
+        """
+        current = self.to_dict()
+        previous = _snapshots.get(self)
+
+        if previous is None:
+            return current
+        return _get_changed_fields(previous, current)
 
 
 class ExistingMedicalKnowledge:
@@ -93,7 +143,13 @@ class CustomStates(Enum):
     EXISTING_MEDICAL_KNOWLEDGE = 8
 
 
-class PWID:
+class DistressStatus(Enum):
+    PENDING = "pending"
+    ACKNOWLEDGED = "acknowledged"
+    COMPLETED = "completed"
+
+
+class PWID(Document):
     def __init__(
         self,
         id: str,
@@ -157,6 +213,32 @@ class PWID:
             "location": self.location.to_dict(),
         }
 
+    @staticmethod
+    def from_summary(source):
+        # Partial PWID until it is hydrated from the pwid collection
+        return PWID(
+            id=source["id"],
+            name=source["name"],
+            language_preference="",
+            phone_number=source["phone_number"],
+            medical_conditions=[],
+            nric="",
+            address="",
+            date_of_birth="",
+            gender="",
+            gender_preference="",
+            emergency_contacts=[],
+            location=Location.from_dict(source["location"]),
+        )
+
+    def to_summary(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "phone_number": self.phone_number,
+            "location": self.location.to_dict(),
+        }
+
     def __repr__(self) -> str:
         return str(vars(self))
 
@@ -177,7 +259,7 @@ class Acknowledgement:
         }
 
 
-class Responder:
+class Responder(Document):
     def __init__(
         self,
         id: str,
@@ -258,60 +340,134 @@ class Responder:
             # "distress_signals": [x.to_dict() for x in self.distress_signals],
         }
 
+    @staticmethod
+    def from_summary(source):
+        # Partial responder until it is hydrated from the responder collection
+        return Responder(
+            id=source["id"],
+            telegram_id=source["telegram_id"],
+            location=Location.from_dict(source["location"]),
+            name=source["name"],
+            phone_number=source["phone_number"],
+        )
+
+    def to_summary(self):
+        return {
+            "id": self.id,
+            "telegram_id": self.telegram_id,
+            "name": self.name,
+            "phone_number": self.phone_number,
+            "location": self.location.to_dict(),
+        }
+
     def __repr__(self) -> str:
         return str(vars(self))
 
 
-class Distress:
+class Distress(Document):
     def __init__(
         self,
+        id: str,
         group_chat_message_id: int,  # Group chat message ID
         message_id: int,
         location: Location,
         pwid: PWID,
         responder: Optional[Responder] = None,
-        created_at: str = str(datetime.now()),
+        created_at: str = "",
         acknowledged_at: str = "",
         is_completed: bool = False,
         is_acknowledged: bool = False,
+        updated_at: str = "",
+        offered_at: str = "",  # When the responder was offered the signal
+        attempts: int = 0,  # Offers made, including rounds without a responder
+        excluded_responders: Optional[List[int]] = None,
+        is_escalated: bool = False,
     ) -> None:
+        self.id = id
         self.group_chat_message_id = group_chat_message_id
         self.message_id = message_id
         self.location = location
         self.pwid = pwid
         self.responder = responder
-        self.created_at = created_at
+        self.created_at = created_at or str(datetime.now())
         self.acknowledged_at = acknowledged_at
         self.is_completed = is_completed
         self.is_acknowledged = is_acknowledged
+        self.updated_at = updated_at or self.created_at
+        self.offered_at = offered_at
+        self.attempts = attempts
+        # Telegram IDs of responders who let an offer lapse or declined it
+        self.excluded_responders = excluded_responders or []
+        self.is_escalated = is_escalated
+
+    @staticmethod
+    def is_legacy(source) -> bool:
+        # Legacy documents embed the full PWID and responder
+        return "emergency_contacts" in source["pwid"] or (
+            "existing_medical_knowledge" in source["responder"]
+        )
 
     @staticmethod
     def from_dict(source):
+        pwid = source["pwid"]
+        responder = source["responder"]
+
         return Distress(
+            # Legacy documents are keyed by their group chat message ID
+            id=source["id"] if "id" in source else str(source["group_chat_message_id"]),
             group_chat_message_id=source["group_chat_message_id"],
             message_id=source["message_id"],
             location=Location.from_dict(source["location"]),
-            pwid=PWID.from_dict(source["pwid"]),
-            responder=Responder.from_dict(source["responder"])
-            if source["responder"]
+            pwid=PWID.from_dict(pwid)
+            if "emergency_contacts" in pwid
+            else PWID.from_summary(pwid),
+            responder=(
+                Responder.from_dict(responder)
+                if "existing_medical_knowledge" in responder
+                else Responder.from_summary(responder)
+            )
+            if responder
             else None,
             created_at=source["created_at"],
             acknowledged_at=source["acknowledged_at"],
             is_completed=source["is_completed"],
             is_acknowledged=source["is_acknowledged"],
+            updated_at=source.get("updated_at", ""),
+            offered_at=source.get("offered_at", ""),
+            attempts=source.get("attempts", 0),
+            excluded_responders=source.get("excluded_responders", []),
+            is_escalated=source.get("is_escalated", False),
         )
 
-    def to_dict(self):
+    def to_dict(self, is_compact: bool = True):
+        """
+        Serialises the distress signal.
+        :param is_compact: Store only a summary of the PWID and responder, the
+        full documents are kept in their own collections.
+        """
+        pwid = self.pwid.to_summary() if is_compact else self.pwid.to_dict()
+        responder = {}
+        if self.responder is not None:
+            responder = (
+                self.responder.to_summary() if is_compact else self.responder.to_dict()
+            )
+
         return {
+            "id": self.id,
             "group_chat_message_id": self.group_chat_message_id,
             "message_id": self.message_id,
             "location": self.location.to_dict(),
-            "pwid": self.pwid.to_dict(),
-            "responder": self.responder.to_dict() if self.responder is not None else {},
+            "pwid": pwid,
+            "responder": responder,
             "created_at": self.created_at,
             "acknowledged_at": self.acknowledged_at,
             "is_completed": self.is_completed,
             "is_acknowledged": self.is_acknowledged,
+            "updated_at": self.updated_at,
+            "offered_at": self.offered_at,
+            "attempts": self.attempts,
+            "excluded_responders": self.excluded_responders,
+            "is_escalated": self.is_escalated,
         }
 
     def __repr__(self) -> str:
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from firebase_admin.firestore import firestore
+from google.cloud.firestore_v1.watch import ChangeType
+from utils import get_registry_max_staleness, get_registry_timeout
+from utils.spatial import ResponderIndex
+
+from database import Firestore, get_database
+from database.models import Responder
+from database.singleton import SingletonClass
+
+
+class ResponderRegistry(SingletonClass):
+    """
+    Process-local view of available responders kept current by a Firestore
+    snapshot listener.
+
+    The listener runs on a background thread owned by the Firestore client and
+    applies every change to a copy of the spatial index before swapping it in,
+    so matching reads a consistent index without any network round-trip.
+    """
+
+    def __init__(self) -> None:
+        # Singleton is re-initialised on every instantiation
+        if hasattr(self, "_lock"):
+            return
+
+        self.RESPONDER_COLLECTION = "responder"
+        self._lock = threading.Lock()
+        self._is_ready = threading.Event()
+        self._index = ResponderIndex()
+        self._watch = None
+        self.last_snapshot_at: Optional[float] = None
+        self.listener_lag = 0.0
+        self.snapshot_count = 0
+        self.fallback_count = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._watch is not None and self._watch.is_active:
+                return
+            if self._watch is not None:
+                self._watch.unsubscribe()
+
+            self._is_ready.clear()
+            query = (
+                firestore.Client()
+                .collection(self.RESPONDER_COLLECTION)
+                .where("is_available", "==", True)
+            )
+            self._watch = query.on_snapshot(self._on_snapshot)
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._watch is not None:
+                self._watch.unsubscribe()
+                self._watch = None
+            self._is_ready.clear()
+
+    def _on_snapshot(self, docs, changes, read_time: datetime) -> None:
+        # First snapshot after (re)subscribing replays every document as added
+        index = self._index.copy() if self._is_ready.is_set() else ResponderIndex()
+
+        for change in changes:
+            if change.type == ChangeType.REMOVED:
+                index.remove(int(change.document.id))
+            else:
+                index.add(Responder.from_dict(change.document.to_dict()))
+
+        with self._lock:
+            self._index = index
+            self.last_snapshot_at = time.time()
+            self.listener_lag = (datetime.now(timezone.utc) - read_time).total_seconds()
+            self.snapshot_count += 1
+        self._is_ready.set()
+
+    def get_staleness(self) -> float:
+        # Seconds since the listener last delivered a snapshot
+        if self.last_snapshot_at is None:
+            return float("inf")
+        return time.time() - self.last_snapshot_at
+
+    def is_healthy(self) -> bool:
+        return (
+            self._is_ready.is_set()
+            and self._watch is not None
+            and self._watch.is_active
+        )
+
+    async def get_index(self) -> ResponderIndex:
+        database = get_database()
+        if not isinstance(database, Firestore):
+            # Local backends have no snapshot listeners and are cheap to read
+            return ResponderIndex(await database.get_responders())
+
+        self.start()
+
+        if not self._is_ready.is_set():
+            await asyncio.to_thread(self._is_ready.wait, get_registry_timeout())
+
+        # Listener is down and the snapshot has aged out, read directly instead
+        if (
+            not self.is_healthy()
+            and self.get_staleness() > get_registry_max_staleness()
+        ):
+            self.fallback_count += 1
+            return ResponderIndex(await database.get_responders())
+
+        return self._index
+
+    async def get_responders(self) -> List[Responder]:
+        return list(await self.get_index())
+
+    def get_metrics(self) -> dict:
+        return {
+            "is_healthy": self.is_healthy(),
+            "responders": len(self._index),
+            "staleness": self.get_staleness() if self.last_snapshot_at else None,
+            "listener_lag": self.listener_lag,
+            "snapshot_count": self.snapshot_count,
+            "fallback_count": self.fallback_count,
+        }
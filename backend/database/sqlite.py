@@ -0,0 +1,490 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+from utils import get_sqlite_path
+from utils.metrics import instrument_storage
+from utils.tracing import trace_storage
+
+from database.cache import apply_fields
+from database.errors import AlreadyExistsException, NotFoundException
+from database.models import PWID, Distress, DistressStatus, Responder
+from database.singleton import SingletonClass
+from database.storage import DOCUMENT_ID, LocalStorage, project
+
+# Seconds a write waits for another connection's write to finish
+BUSY_TIMEOUT = 5
+
+# Documents are stored as JSON, queried fields are generated columns so that
+# they can be indexed without a schema per model
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pwid (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS responder (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    is_available INTEGER AS (json_extract(data, '$.is_available'))
+);
+CREATE INDEX IF NOT EXISTS responder_is_available ON responder (is_available);
+CREATE TABLE IF NOT EXISTS distress (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    pwid_name TEXT AS (json_extract(data, '$.pwid.name')),
+    latitude REAL AS (json_extract(data, '$.location.latitude')),
+    longitude REAL AS (json_extract(data, '$.location.longitude')),
+    has_responder INTEGER AS (json_extract(data, '$.responder') != '{}'),
+    is_completed INTEGER AS (json_extract(data, '$.is_completed')),
+    is_acknowledged INTEGER AS (json_extract(data, '$.is_acknowledged')),
+    created_at TEXT AS (json_extract(data, '$.created_at')),
+    updated_at TEXT AS (json_extract(data, '$.updated_at'))
+);
+CREATE INDEX IF NOT EXISTS distress_status
+    ON distress (is_completed, is_acknowledged, created_at, id);
+CREATE INDEX IF NOT EXISTS distress_pending
+    ON distress (is_acknowledged, has_responder);
+CREATE INDEX IF NOT EXISTS distress_pwid_name ON distress (pwid_name, created_at, id);
+CREATE INDEX IF NOT EXISTS distress_created_at ON distress (created_at, id);
+CREATE INDEX IF NOT EXISTS distress_updated_at ON distress (updated_at, id);
+CREATE INDEX IF NOT EXISTS distress_latitude ON distress (latitude);
+CREATE TABLE IF NOT EXISTS lock (
+    collection TEXT NOT NULL,
+    id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (collection, id)
+);
+"""
+
+# Neither acknowledged nor assigned to a responder
+PENDING_CONDITIONS = ["is_acknowledged = 0", "has_responder = 0"]
+INCOMPLETE_CONDITIONS = ["is_completed = 0"]
+
+
+def _filter_distress_status(status: Optional[DistressStatus]) -> List[str]:
+    if status == DistressStatus.COMPLETED:
+        return ["is_completed = 1"]
+    if status == DistressStatus.ACKNOWLEDGED:
+        return ["is_completed = 0", "is_acknowledged = 1"]
+    if status == DistressStatus.PENDING:
+        return ["is_completed = 0", "is_acknowledged = 0"]
+    return []
+
+
+@instrument_storage
+@trace_storage
+class SQLiteStorage(LocalStorage, SingletonClass):
+    """
+    Stores every collection in a single SQLite file, e.g. for a single host
+    deployment without a Firestore project.
+
+    The database runs in WAL mode, so readers never block on the writer and
+    every worker on the host shares the same documents. Queries run on the
+    default executor, each of its threads keeping its own connection.
+    """
+
+    def __init__(self) -> None:
+        # Singleton is re-initialised on every instantiation
+        if hasattr(self, "_local"):
+            return
+
+        super().__init__()
+        self.path = get_sqlite_path()
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Transactions are managed explicitly, see _transaction()
+            connection = sqlite3.connect(
+                self.path, timeout=BUSY_TIMEOUT, isolation_level=None
+            )
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # Takes the write lock upfront, reads within see no concurrent writes
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def _get(self, table: str, id: str, message: str) -> dict:
+        row = (
+            self._connect()
+            .execute(f"SELECT data FROM {table} WHERE id = ?", (id,))
+            .fetchone()
+        )
+        if row is None:
+            raise NotFoundException(message)
+        return json.loads(row[0])
+
+    def _create(self, table: str, id: str, source: dict, message: str) -> None:
+        try:
+            self._connect().execute(
+                f"INSERT INTO {table} (id, data) VALUES (?, ?)",
+                (id, json.dumps(source)),
+            )
+        except sqlite3.IntegrityError:
+            raise AlreadyExistsException(message)
+
+    def _update(self, table: str, changes: List[Tuple[str, dict]]) -> List[dict]:
+        # Applied in a single transaction, none of them are if any is missing
+        sources = []
+        with self._transaction() as connection:
+            for id, fields in changes:
+                row = connection.execute(
+                    f"SELECT data FROM {table} WHERE id = ?", (id,)
+                ).fetchone()
+                if row is None:
+                    raise NotFoundException(f"{id} does not exist")
+
+                source = json.loads(row[0])
+                apply_fields(source, fields)
+                connection.execute(
+                    f"UPDATE {table} SET data = ? WHERE id = ?",
+                    (json.dumps(source), id),
+                )
+                sources.append({**source, "id": id})
+        return sources
+
+    def _find(
+        self,
+        table: str,
+        conditions: List[str],
+        params: Optional[list] = None,
+        order: str = "id",
+        limit: Optional[int] = None,
+    ) -> List[Tuple[str, dict]]:
+        query = f"SELECT id, data FROM {table}"
+        if conditions:
+            query += f" WHERE {' AND '.join(conditions)}"
+        query += f" ORDER BY {order}"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+
+        rows = self._connect().execute(query, params or []).fetchall()
+        return [(id, json.loads(data)) for id, data in rows]
+
+    def _count(self, table: str, conditions: List[str]) -> int:
+        # Answered from the indexes on the generated columns
+        query = f"SELECT COUNT(*) FROM {table} WHERE {' AND '.join(conditions)}"
+        return self._connect().execute(query).fetchone()[0]
+
+    async def get_pwid(self, name: str) -> PWID:
+        source = await asyncio.to_thread(
+            self._get, self.PWID_COLLECTION, name, f"{name} does not exist"
+        )
+        return self._load(PWID, source)
+
+    async def create_pwid(self, data: PWID) -> None:
+        await asyncio.to_thread(
+            self._create,
+            self.PWID_COLLECTION,
+            data.name,
+            data.to_dict(),
+            f"{data.name} already exists",
+        )
+        data.mark_clean()
+
+    async def get_responder(self, telegram_id: int) -> Responder:
+        source = await asyncio.to_thread(
+            self._get,
+            self.RESPONDER_COLLECTION,
+            str(telegram_id),
+            f"{telegram_id} does not exist",
+        )
+        return self._load(Responder, source)
+
+    async def create_responder(self, data: Responder) -> None:
+        await asyncio.to_thread(
+            self._create,
+            self.RESPONDER_COLLECTION,
+            str(data.telegram_id),
+            data.to_dict(),
+            f"{data.name} already exists",
+        )
+        data.mark_clean()
+
+    async def get_responders(self) -> List[Responder]:
+        documents = await asyncio.to_thread(
+            self._find, self.RESPONDER_COLLECTION, ["is_available = 1"]
+        )
+        return [self._load(Responder, x) for _, x in documents]
+
+    async def update_responder_fields(self, telegram_id: int, fields: dict) -> None:
+        await asyncio.to_thread(
+            self._update, self.RESPONDER_COLLECTION, [(str(telegram_id), fields)]
+        )
+
+    async def create_distress(self, data: Distress) -> None:
+        data.updated_at = str(datetime.now())
+        source = data.to_dict()
+
+        def create() -> None:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO distress (id, data) VALUES (?, ?)",
+                (str(data.id), json.dumps(source)),
+            )
+
+        await asyncio.to_thread(create)
+        data.mark_clean()
+        self._notify_distress([{**source, "id": str(data.id)}])
+
+    async def get_distress(self, id: str) -> Distress:
+        source = await asyncio.to_thread(
+            self._get, self.DISTRESS_COLLECTION, str(id), f"{id} does not exist"
+        )
+        return self._load(Distress, source)
+
+    async def update_distress(self, data: Distress) -> None:
+        await self.update_distresses([data])
+
+    async def update_distresses(self, data: List[Distress]) -> None:
+        changed = [(x, self._get_distress_changes(x)) for x in data]
+        changed = [(x, changes) for x, changes in changed if changes]
+        if not changed:
+            return
+
+        sources = await asyncio.to_thread(
+            self._update,
+            self.DISTRESS_COLLECTION,
+            [(str(x.id), changes) for x, changes in changed],
+        )
+        for distress, _ in changed:
+            distress.mark_clean()
+        self._notify_distress(sources)
+
+    async def get_all_pending_distress(self) -> List[Distress]:
+        documents = await asyncio.to_thread(
+            self._find, self.DISTRESS_COLLECTION, PENDING_CONDITIONS
+        )
+        return [self._load(Distress, x) for _, x in documents]
+
+    async def get_all_incomplete_distress(self) -> List[Distress]:
+        documents = await asyncio.to_thread(
+            self._find, self.DISTRESS_COLLECTION, INCOMPLETE_CONDITIONS
+        )
+        return [self._load(Distress, x) for _, x in documents]
+
+    async def count_pending_distress(self) -> int:
+        return await asyncio.to_thread(
+            self._count, self.DISTRESS_COLLECTION, PENDING_CONDITIONS
+        )
+
+    async def count_incomplete_distress(self) -> int:
+        return await asyncio.to_thread(
+            self._count, self.DISTRESS_COLLECTION, INCOMPLETE_CONDITIONS
+        )
+
+    async def get_distress_in_bounds(
+        self,
+        south: float,
+        west: float,
+        north: float,
+        east: float,
+        status: Optional[DistressStatus] = None,
+    ) -> List[dict]:
+        documents = await asyncio.to_thread(
+            self._find,
+            self.DISTRESS_COLLECTION,
+            [
+                "latitude >= ?",
+                "latitude < ?",
+                "longitude >= ?",
+                "longitude < ?",
+                *_filter_distress_status(status),
+            ],
+            [south, north, west, east],
+            "latitude, id",
+        )
+
+        fields = ["id", "location", "is_completed", "is_acknowledged"]
+        return [{**project(x, fields), "id": id} for id, x in documents]
+
+    async def get_distress_page(
+        self,
+        limit: int,
+        cursor: Optional[dict] = None,
+        status: Optional[DistressStatus] = None,
+        pwid: Optional[str] = None,
+        created_after: Optional[str] = None,
+        created_before: Optional[str] = None,
+        updated_after: Optional[str] = None,
+        sort: str = "created_at",
+        is_descending: bool = True,
+        fields: Optional[List[str]] = None,
+    ) -> Tuple[List[dict], Optional[dict]]:
+        sort_fields = self._get_distress_sort_fields(
+            sort, created_after, created_before, updated_after
+        )
+
+        # Documents missing a sorted field are left out, as by Firestore
+        conditions = [f"{x} IS NOT NULL" for x in sort_fields]
+        conditions += _filter_distress_status(status)
+        params: list = []
+
+        if pwid:
+            conditions.append("pwid_name = ?")
+            params.append(pwid)
+        if created_after:
+            conditions.append("created_at >= ?")
+            params.append(created_after)
+        if created_before:
+            conditions.append("created_at < ?")
+            params.append(created_before)
+        if updated_after:
+            conditions.append("updated_at > ?")
+            params.append(updated_after)
+
+        columns = sort_fields + ["id"]
+        if cursor is not None:
+            placeholders = ", ".join("?" for _ in columns)
+            conditions.append(
+                f"({', '.join(columns)}) {'<' if is_descending else '>'} "
+                f"({placeholders})"
+            )
+            params += [cursor[x] for x in sort_fields] + [cursor[DOCUMENT_ID]]
+
+        direction = "DESC" if is_descending else "ASC"
+        # One extra document tells whether there is a next page
+        documents = await asyncio.to_thread(
+            self._find,
+            self.DISTRESS_COLLECTION,
+            conditions,
+            params,
+            ", ".join(f"{x} {direction}" for x in columns),
+            limit + 1,
+        )
+
+        next_cursor = None
+        if len(documents) > limit:
+            documents = documents[:limit]
+            last_id, last = documents[-1]
+            next_cursor = {x: last[x] for x in sort_fields}
+            next_cursor[DOCUMENT_ID] = last_id
+
+        if fields is not None:
+            fields = list(dict.fromkeys(fields + sort_fields))
+            return [project(x, fields) for _, x in documents], next_cursor
+        return [x for _, x in documents], next_cursor
+
+    async def get_distress_watermark(self) -> Optional[str]:
+        def get_watermark() -> Optional[str]:
+            return (
+                self._connect()
+                .execute("SELECT MAX(updated_at) FROM distress")
+                .fetchone()[0]
+            )
+
+        return await asyncio.to_thread(get_watermark)
+
+    def _get_lock(
+        self, connection: sqlite3.Connection, collection: str, id: str
+    ) -> Optional[dict]:
+        row = connection.execute(
+            "SELECT data FROM lock WHERE collection = ? AND id = ?", (collection, id)
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def _set_lock(
+        self, connection: sqlite3.Connection, collection: str, id: str, data: dict
+    ) -> None:
+        connection.execute(
+            "INSERT OR REPLACE INTO lock (collection, id, data) VALUES (?, ?, ?)",
+            (collection, id, json.dumps(data)),
+        )
+
+    async def claim_sos_request(self, name: str, window: float) -> bool:
+        def claim() -> bool:
+            with self._transaction() as connection:
+                lock = self._get_lock(connection, self.SOS_LOCK_COLLECTION, name)
+                now = time.time()
+
+                if lock is not None and now - lock["claimed_at"] < window:
+                    return False
+
+                self._set_lock(
+                    connection, self.SOS_LOCK_COLLECTION, name, {"claimed_at": now}
+                )
+                return True
+
+        return await asyncio.to_thread(claim)
+
+    async def release_sos_request(self, name: str) -> None:
+        def release() -> None:
+            self._connect().execute(
+                "DELETE FROM lock WHERE collection = ? AND id = ?",
+                (self.SOS_LOCK_COLLECTION, name),
+            )
+
+        await asyncio.to_thread(release)
+
+    async def resolve_sos_request(self, name: str, response: Tuple[str, int]) -> None:
+        def resolve() -> None:
+            with self._transaction() as connection:
+                lock = self._get_lock(connection, self.SOS_LOCK_COLLECTION, name)
+                if lock is None:
+                    return
+
+                self._set_lock(
+                    connection,
+                    self.SOS_LOCK_COLLECTION,
+                    name,
+                    {**lock, "response": list(response)},
+                )
+
+        await asyncio.to_thread(resolve)
+
+    async def get_sos_request(self, name: str) -> Optional[dict]:
+        def get() -> Optional[dict]:
+            return self._get_lock(self._connect(), self.SOS_LOCK_COLLECTION, name)
+
+        return await asyncio.to_thread(get)
+
+    async def claim_distress_lease(self, id: str, owner: str, duration: float) -> bool:
+        def claim() -> bool:
+            with self._transaction() as connection:
+                lease = self._get_lock(connection, self.DISTRESS_LEASE_COLLECTION, id)
+                now = time.time()
+
+                if lease is not None:
+                    if lease["owner"] != owner and lease["expires_at"] > now:
+                        return False
+
+                self._set_lock(
+                    connection,
+                    self.DISTRESS_LEASE_COLLECTION,
+                    id,
+                    {"owner": owner, "expires_at": now + duration},
+                )
+                return True
+
+        return await asyncio.to_thread(claim)
+
+    async def release_distress_lease(self, id: str, owner: str) -> None:
+        def release() -> None:
+            with self._transaction() as connection:
+                lease = self._get_lock(connection, self.DISTRESS_LEASE_COLLECTION, id)
+
+                # An expired lease may have been claimed by another worker since
+                if lease is not None and lease["owner"] == owner:
+                    connection.execute(
+                        "DELETE FROM lock WHERE collection = ? AND id = ?",
+                        (self.DISTRESS_LEASE_COLLECTION, id),
+                    )
+
+        await asyncio.to_thread(release)
@@ -0,0 +1,315 @@
+from abc import ABC, abstractmethod
+import asyncio
+import threading
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Tuple, Type, TypeVar
+
+from database.errors import NotFoundException
+from database.models import PWID, Distress, DistressStatus, Responder
+
+T = TypeVar("T", PWID, Responder, Distress)
+
+# Key of the document ID in page cursors, as Firestore names it
+DOCUMENT_ID = "__name__"
+
+
+class Storage(ABC):
+    """
+    Persistence used by the routes and bot handlers.
+
+    Backends implement the reads and writes below, queries return the same
+    documents in the same order regardless of the backend.
+    """
+
+    def __init__(self) -> None:
+        self.RESPONDER_COLLECTION = "responder"
+        self.PWID_COLLECTION = "pwid"
+        self.DISTRESS_COLLECTION = "distress"
+        self.SOS_LOCK_COLLECTION = "sos_lock"
+        self.DISTRESS_LEASE_COLLECTION = "distress_lease"
+        # Fields each sort orders by, the document ID breaks any remaining ties
+        self.DISTRESS_SORT_FIELDS = {
+            "created_at": ["created_at"],
+            "status": ["is_completed", "is_acknowledged", "created_at"],
+            "updated_at": ["updated_at"],
+        }
+
+    def _load(self, model: Type[T], source: dict) -> T:
+        document = model.from_dict(source)
+
+        # Legacy distress documents are rewritten whole on their next update
+        if not (model is Distress and Distress.is_legacy(source)):
+            document.mark_clean()
+        return document
+
+    @abstractmethod
+    async def get_pwid(self, name: str) -> PWID:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def create_pwid(self, data: PWID) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_responder(self, telegram_id: int) -> Responder:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def create_responder(self, data: Responder) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_responders(self) -> List[Responder]:
+        # Available responders only
+        raise NotImplementedError
+
+    async def update_responder(self, data: Responder) -> None:
+        # Only fields changed since the responder was loaded are written
+        changes = data.get_changes()
+        if not changes:
+            return
+
+        await self.update_responder_fields(data.telegram_id, changes)
+        data.mark_clean()
+
+    @abstractmethod
+    async def update_responder_fields(self, telegram_id: int, fields: dict) -> None:
+        # Nested fields are addressed with dotted paths, e.g. location.latitude
+        raise NotImplementedError
+
+    async def update_latest_bot_message(
+        self, data: Responder | int, message_id: int
+    ) -> None:
+        telegram_id = data.telegram_id if isinstance(data, Responder) else data
+        await self.update_responder_fields(telegram_id, {"message_id": message_id})
+
+    async def get_latest_bot_message(self, data: Responder) -> int:
+        responder = await self.get_responder(data.telegram_id)
+
+        return responder.message_id
+
+    @abstractmethod
+    async def create_distress(self, data: Distress) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_distress(self, id: str) -> Distress:
+        raise NotImplementedError
+
+    async def hydrate_distress(self, data: Distress) -> Distress:
+        """
+        Replaces the PWID and responder summaries with their full documents.
+        :param data: Distress signal loaded from storage.
+        :return: The same distress signal, hydrated in place.
+        """
+
+        async def get_pwid() -> PWID:
+            try:
+                pwid = await self.get_pwid(data.pwid.name)
+            except NotFoundException:
+                return data.pwid
+
+            # The stored location is where the signal was raised from
+            pwid.location = data.pwid.location
+            return pwid
+
+        async def get_responder() -> Responder | None:
+            if data.responder is None or data.responder.telegram_id < 0:
+                return data.responder
+
+            try:
+                responder = await self.get_responder(data.responder.telegram_id)
+            except NotFoundException:
+                return data.responder
+            return responder
+
+        data.pwid, data.responder = await asyncio.gather(get_pwid(), get_responder())
+        return data
+
+    async def hydrate_distresses(self, data: List[Distress]) -> List[Distress]:
+        await asyncio.gather(*[self.hydrate_distress(x) for x in data])
+        return data
+
+    def _get_distress_changes(self, data: Distress) -> dict:
+        changes = data.get_changes()
+
+        # Only stamped on actual writes, so that deltas follow real changes
+        if changes:
+            data.updated_at = str(datetime.now())
+            changes["updated_at"] = data.updated_at
+        return changes
+
+    @abstractmethod
+    async def update_distress(self, data: Distress) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_distresses(self, data: List[Distress]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_all_pending_distress(self) -> List[Distress]:
+        # Neither acknowledged nor assigned to a responder
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_all_incomplete_distress(self) -> List[Distress]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def count_pending_distress(self) -> int:
+        # Counted without reading the distress signals, e.g. for metrics
+        raise NotImplementedError
+
+    @abstractmethod
+    async def count_incomplete_distress(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_distress_in_bounds(
+        self,
+        south: float,
+        west: float,
+        north: float,
+        east: float,
+        status: Optional[DistressStatus] = None,
+    ) -> List[dict]:
+        """
+        Lists distress signals within a bounding box.
+        :return: Distress signals with only their id, location and status fields.
+        """
+        raise NotImplementedError
+
+    def _get_distress_sort_fields(
+        self,
+        sort: str,
+        created_after: Optional[str],
+        created_before: Optional[str],
+        updated_after: Optional[str],
+    ) -> List[str]:
+        if sort not in self.DISTRESS_SORT_FIELDS:
+            raise ValueError(f"Unable to sort by {sort}")
+
+        # Firestore only allows a range filter on the first sorted field
+        sort_fields = self.DISTRESS_SORT_FIELDS[sort]
+        if (created_after or created_before) and sort_fields[0] != "created_at":
+            raise ValueError(
+                f"Unable to filter by creation time when sorting by {sort}"
+            )
+        if updated_after and sort_fields[0] != "updated_at":
+            raise ValueError(f"Unable to filter by update time when sorting by {sort}")
+        return sort_fields
+
+    @abstractmethod
+    async def get_distress_page(
+        self,
+        limit: int,
+        cursor: Optional[dict] = None,
+        status: Optional[DistressStatus] = None,
+        pwid: Optional[str] = None,
+        created_after: Optional[str] = None,
+        created_before: Optional[str] = None,
+        updated_after: Optional[str] = None,
+        sort: str = "created_at",
+        is_descending: bool = True,
+        fields: Optional[List[str]] = None,
+    ) -> Tuple[List[dict], Optional[dict]]:
+        """
+        Lists one page of distress signals.
+        :param limit: Maximum number of distress signals to return.
+        :param cursor: Cursor returned with the previous page.
+        :param status: Only return distress signals with this status.
+        :param pwid: Only return distress signals raised by this PWID.
+        :param created_after: Only return distress signals created at or after this time.
+        :param created_before: Only return distress signals created before this time.
+        :param updated_after: Only return distress signals updated after this time.
+        :param sort: One of DISTRESS_SORT_FIELDS.
+        :param is_descending: Sort direction.
+        :param fields: Fields to project, every field if None.
+        :return: Tuple of (distress signals, cursor of the next page or None).
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_distress_watermark(self) -> Optional[str]:
+        # Latest update across all distress signals
+        raise NotImplementedError
+
+    @abstractmethod
+    async def claim_sos_request(self, name: str, window: float) -> bool:
+        # Shared across workers, only one request per PWID may claim a window
+        raise NotImplementedError
+
+    @abstractmethod
+    async def release_sos_request(self, name: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def resolve_sos_request(self, name: str, response: Tuple[str, int]) -> None:
+        # Shares the claiming request's response with duplicates on other workers
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_sos_request(self, name: str) -> Optional[dict]:
+        """
+        Reads a PWID's SOS claim.
+        :return: Claim with its response once resolved, None if released.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def claim_distress_lease(self, id: str, owner: str, duration: float) -> bool:
+        # Shared across workers, only the owner may act on the distress signal
+        raise NotImplementedError
+
+    @abstractmethod
+    async def release_distress_lease(self, id: str, owner: str) -> None:
+        raise NotImplementedError
+
+
+def get_field(source: dict, path: str) -> Any:
+    # Reads a dotted field path, None if any part of it is missing
+    value: Any = source
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def project(source: dict, fields: List[str]) -> dict:
+    # Keeps only the given dotted field paths, as a Firestore projection does
+    projection: dict = {}
+    for path in fields:
+        *parents, key = path.split(".")
+        parent = get_field(source, ".".join(parents)) if parents else source
+        if not isinstance(parent, dict) or key not in parent:
+            continue
+
+        target = projection
+        for name in parents:
+            target = target.setdefault(name, {})
+        target[key] = parent[key]
+    return projection
+
+
+class LocalStorage(Storage):
+    """
+    Base of backends living next to the process, i.e. without snapshot
+    listeners. Writes to distress signals are pushed to listeners instead.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._listeners: List[Callable[[List[dict]], None]] = []
+        self._listener_lock = threading.Lock()
+
+    def add_distress_listener(self, listener: Callable[[List[dict]], None]) -> None:
+        with self._listener_lock:
+            self._listeners.append(listener)
+
+    def _notify_distress(self, sources: List[dict]) -> None:
+        # Serialised so that listeners see changes in the order they were written
+        with self._listener_lock:
+            for listener in self._listeners:
+                listener(sources)
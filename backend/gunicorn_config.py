@@ -1,2 +1,15 @@
+from utils import get_server_mode, get_server_threads
+
 bind = "0.0.0.0:8080"
 workers = 2
+threads = get_server_threads()
+
+if get_server_mode() == "asgi":
+    # One long-lived event loop per worker, see asgi.py
+    wsgi_app = "asgi:app"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "app:app"
+    # Each open /distress/stream holds a thread for as long as the dashboard is
+    # open, up to MAX_EVENT_STREAMS of them per worker
+    worker_class = "gthread"
@@ -3,13 +3,16 @@ from flask import Flask
 from flask_cors import CORS
 
 app = Flask(__name__)
-CORS(app)
+# The dashboard reads ETags to revalidate its listing
+CORS(app, expose_headers=["ETag"])
 
+import routes.metrics
 import routes.pwid
 import routes.responder
 import routes.scheduler
 import routes.sos
 import routes.telegram
+import routes.tracing
 import routes.web
 
 # @app.errorhandler(Exception)
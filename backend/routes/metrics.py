@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+from database import get_database
+from database.registry import ResponderRegistry
+from flask import Response, g, request
+from prometheus_client import CONTENT_TYPE_LATEST
+from utils.metrics import REQUEST_LATENCY, generate_metrics
+
+from routes import app
+from routes.telegram import WEBHOOK_URL_PATH
+
+
+def get_route() -> str:
+    # Labelled by rule rather than path, so IDs in the URL don't add series
+    if request.url_rule is None:
+        return "<unmatched>"
+    # The webhook is served under the bot token, which must not be exported
+    if request.url_rule.rule == WEBHOOK_URL_PATH:
+        return "/<token>"
+    return request.url_rule.rule
+
+
+@app.before_request
+def start_request_timer() -> None:
+    g.started_at = time.perf_counter()
+
+
+@app.after_request
+def observe_request(response: Response) -> Response:
+    REQUEST_LATENCY.labels(
+        method=request.method, route=get_route(), status=str(response.status_code)
+    ).observe(time.perf_counter() - g.started_at)
+    return response
+
+
+@app.route("/metrics", methods=["GET"])
+async def get_metrics() -> Response:
+    database = get_database()
+    pending, incomplete, index = await asyncio.gather(
+        database.count_pending_distress(),
+        database.count_incomplete_distress(),
+        ResponderRegistry().get_index(),
+    )
+
+    body = generate_metrics(
+        {
+            "pending_distress": pending,
+            "incomplete_distress": incomplete,
+            "available_responders": len(index),
+        }
+    )
+    return Response(body, content_type=CONTENT_TYPE_LATEST)
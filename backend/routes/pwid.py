@@ -1,6 +1,6 @@
 import uuid
 
-from database import Firestore
+from database import get_database
 from database.errors import NotFoundException
 from database.models import PWID, Responder
 from flask import Response, jsonify, request
@@ -10,7 +10,7 @@ from routes import app
 
 @app.route("/pwid/<id>", methods=["GET"])
 async def get_pwid(id: str) -> Response:
-    database = Firestore()
+    database = get_database()
     pwid = await database.get_pwid(id)
     return jsonify(pwid)
 
@@ -24,7 +24,7 @@ async def create_pwid() -> Response:
     payload["id"] = str(uuid.uuid4())
     pwid = PWID.from_dict(payload)
 
-    database = Firestore()
+    database = get_database()
     await database.create_pwid(pwid)
 
     return jsonify(f"Succesfully created pwid - {pwid.name}")
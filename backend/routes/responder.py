@@ -1,8 +1,10 @@
 import uuid
 from datetime import datetime
 
-from database import Firestore
+from database import get_database
+from database.cache import responder_cache
 from database.models import CustomStates, Responder
+from database.registry import ResponderRegistry
 from flask import Response, jsonify, request
 
 from routes import app
@@ -10,11 +12,22 @@ from routes import app
 
 @app.route("/responder/<id>", methods=["GET"])
 async def get_responder(telegram_id: int) -> Response:
-    database = Firestore()
+    database = get_database()
     responder = await database.get_responder(telegram_id)
     return jsonify(responder)
 
 
+@app.route("/responder/registry", methods=["GET"])
+async def get_responder_registry() -> Response:
+    registry = ResponderRegistry()
+    return jsonify(registry.get_metrics())
+
+
+@app.route("/responder/cache", methods=["GET"])
+async def get_responder_cache() -> Response:
+    return jsonify(responder_cache.get_metrics())
+
+
 @app.route("/responder", methods=["POST"])
 async def create_responder() -> Response:
     if not request.is_json:
@@ -29,7 +42,7 @@ async def create_responder() -> Response:
     payload["message_id"] = -1
     responder = Responder.from_dict(payload)
 
-    database = Firestore()
+    database = get_database()
     await database.create_responder(responder)
 
     return jsonify(f"Succesfully created responder - {responder.name}")
@@ -1,14 +1,29 @@
 import asyncio
 import atexit
+import time
+from datetime import datetime
+from typing import List, Optional, cast
 
 from apscheduler.schedulers.background import BackgroundScheduler
-from database import Firestore
-from flask import jsonify
-from utils import get_group_chat_id
+from database import Storage, get_database
+from database.models import Distress, Responder
+from database.registry import ResponderRegistry
+from flask import Response, jsonify
+from telebot import types
+from telebot.asyncio_helper import ApiTelegramException
+from utils import get_group_chat_id, get_max_offer_attempts
+from utils.assignment import assign_responders
+from utils.background import on_startup
+from utils.deferred import NOTIFICATION_DELAY, deferred
+from utils.escalation import get_offer_deadline, offer_timers
+from utils.ratelimit import Priority, priority
+from utils.text import _get_pwid_contacts
+from utils.url import _get_google_maps_link
 
 from routes import app
 from routes.sos import (
-    get_available_responder,
+    _notify_first_reachable_responder,
+    get_available_responders,
     process_notify_dispatcher,
     process_notify_responder,
 )
@@ -17,38 +32,209 @@ from routes.telegram import bot
 
 @app.route("/process", methods=["GET"])
 async def process_pending_distress_signals():
-    database = Firestore()
+    database = get_database()
     pending_distress_signals = await database.get_all_pending_distress()
+    # Escalated signals are left to the dispatchers
+    pending_ids = [x.id for x in pending_distress_signals if not x.is_escalated]
 
-    if len(pending_distress_signals) == 0:
+    if len(pending_ids) == 0:
         return jsonify("No pending signals")
 
-    responders = await database.get_responders()
-    for distress_signal in pending_distress_signals:
-        available_responder = get_available_responder(
-            pwid=distress_signal.pwid, responders=responders
-        )
+    # Signals whose offer is being settled elsewhere are left to the next run
+    async with offer_timers.hold_free(pending_ids) as held_ids:
+        assigned_distress_signals = await _assign_responders(database, held_ids)
+
+    for distress_signal in assigned_distress_signals:
+        offer_timers.arm(distress_signal.id, get_offer_deadline(distress_signal))
+    return jsonify(f"{len(pending_ids)} signals processed")
+
+
+def _is_pending(distress: Distress) -> bool:
+    return (
+        distress.responder is None
+        and not distress.is_acknowledged
+        and not distress.is_escalated
+    )
 
+
+async def _assign_responders(
+    database: Storage, distress_ids: List[str]
+) -> List[Distress]:
+    # Read again under the leases, they may have been settled since
+    pending_distress_signals = [
+        x
+        for x in await asyncio.gather(*[database.get_distress(x) for x in distress_ids])
+        if _is_pending(x)
+    ]
+    if len(pending_distress_signals) == 0:
+        return []
+
+    # Matching needs the full PWID, e.g. language and medical conditions
+    await database.hydrate_distresses(pending_distress_signals)
+
+    index = await ResponderRegistry().get_index()
+    assignments = assign_responders(
+        pwids=[x.pwid for x in pending_distress_signals],
+        index=index,
+        excluded_responders=[x.excluded_responders for x in pending_distress_signals],
+    )
+
+    assigned_distress_signals = []
+    for distress_signal, available_responder in zip(
+        pending_distress_signals, assignments
+    ):
         if available_responder is None:
             continue
 
         print(f"Found {available_responder.name} for {distress_signal.pwid.name}")
 
         distress_signal.responder = available_responder
-        await database.update_distress(distress_signal)
+        distress_signal.offered_at = str(datetime.now())
+        distress_signal.attempts += 1
+        assigned_distress_signals.append(distress_signal)
+
+    # Persist assignments before notifying so that callbacks see the responder
+    await database.update_distresses(assigned_distress_signals)
+
+    with priority(Priority.DISTRESS):
+        message_ids = await asyncio.gather(
+            *[
+                _notify_assignment(distress_signal)
+                for distress_signal in assigned_distress_signals
+            ]
+        )
+    for distress_signal, message_id in zip(assigned_distress_signals, message_ids):
+        distress_signal.message_id = message_id
+
+    await database.update_distresses(assigned_distress_signals)
+    return assigned_distress_signals
 
-        # Notify responder
-        await process_notify_responder(bot=bot, distress=distress_signal)
 
+async def _notify_assignment(distress: Distress) -> int:
+    message_id, _ = await asyncio.gather(
+        # Notify responder
+        process_notify_responder(bot=bot, distress=distress),
         # Responder group chat message
-        await process_notify_dispatcher(
-            bot=bot,
-            responder=distress_signal.responder,
-            pwid=distress_signal.pwid,
-            address=distress_signal.location.address,
-            distress=distress_signal,
+        process_notify_dispatcher(
+            bot=bot, distress=distress, responder=distress.responder, is_edit=True
+        ),
+    )
+    return message_id
+
+
+async def process_expired_offer(distress_id: str) -> Optional[float]:
+    """
+    Re-offers a distress signal whose responder did not acknowledge it in time
+    to the next ranked responder, or escalates it to the dispatchers once it
+    has been offered too many times.
+    :param distress_id: ID of the distress signal whose offer expired.
+    :return: Unix time at which the new offer expires, None if settled.
+    """
+    database = get_database()
+    distress = await database.get_distress(distress_id)
+
+    if distress.is_acknowledged or distress.is_completed or distress.is_escalated:
+        return None
+
+    deadline = get_offer_deadline(distress)
+    if deadline > time.time():
+        # Offered again since this timer was armed
+        return deadline
+
+    await database.hydrate_distress(distress)
+
+    with priority(Priority.DISTRESS):
+        previous_responder = distress.responder
+        if previous_responder is not None:
+            distress.excluded_responders.append(previous_responder.telegram_id)
+            await _notify_expired_offer(distress)
+
+        if distress.attempts >= get_max_offer_attempts():
+            distress.responder = None
+            distress.message_id = -1
+            distress.is_escalated = True
+            await database.update_distress(distress)
+            await _notify_escalation(distress)
+            return None
+
+        index = await ResponderRegistry().get_index()
+        candidates = get_available_responders(
+            pwid=distress.pwid,
+            index=index,
+            excluded_responders=distress.excluded_responders,
+        )
+        responder, message_id = await _notify_first_reachable_responder(
+            bot=bot, distress=distress, candidates=candidates
+        )
+
+        distress.responder = responder
+        distress.message_id = message_id
+        distress.offered_at = str(datetime.now())
+        distress.attempts += 1
+        await database.update_distress(distress)
+
+        if responder is not None or previous_responder is not None:
+            await process_notify_dispatcher(
+                bot=bot, distress=distress, responder=responder, is_edit=True
+            )
+
+    return get_offer_deadline(distress)
+
+
+async def _notify_expired_offer(distress: Distress) -> None:
+    responder = cast(Responder, distress.responder)
+
+    try:
+        await bot.edit_message_text(
+            chat_id=responder.telegram_id,
+            message_id=distress.message_id,
+            text="This distress signal has been offered to another responder as it was not acknowledged in time.",
         )
-    return jsonify(f"{len(pending_distress_signals)} signals processed")
+    except ApiTelegramException as e:
+        print(f"Unable to withdraw offer from {responder.name}", e)
+        return
+
+    deferred.schedule(
+        NOTIFICATION_DELAY,
+        bot.delete_message,
+        chat_id=responder.telegram_id,
+        message_id=distress.message_id,
+    )
+
+
+async def _notify_escalation(distress: Distress) -> None:
+    address = distress.location.address
+    keyboard = types.InlineKeyboardMarkup()
+    accept = types.InlineKeyboardButton(
+        text="✅ Accept", callback_data=f"dispatcher accept {distress.id}"
+    )
+    decline = types.InlineKeyboardButton(
+        text="❌ Cancel", callback_data=f"dispatcher cancel {distress.id}"
+    )
+    keyboard.add(accept, decline, row_width=2)
+
+    text = "<b>❗ Distress Signal ❗</b>\n\n"
+    text += "<b>Status: </b> 🔴 Escalated\n\n"
+    text += _get_pwid_contacts(distress.pwid)
+    text += f"No responder has acknowledged this signal to assist <b>{distress.pwid.name}</b> at <a href='{_get_google_maps_link(address)}'>{address}</a> after {distress.attempts} attempts.\n\n"
+    text += "<b>Kindly handle this signal manually.</b>"
+
+    await bot.edit_message_text(
+        chat_id=get_group_chat_id(),
+        message_id=distress.group_chat_message_id,
+        text=text,
+        parse_mode="HTML",
+        reply_markup=keyboard,
+    )
+
+
+@app.route("/process/timers", methods=["GET"])
+def get_offer_timers() -> Response:
+    return jsonify(offer_timers.get_metrics())
+
+
+offer_timers.set_handler(process_expired_offer)
+on_startup(offer_timers.restore)
 
 
 def wrap_async_func():
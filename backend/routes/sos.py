@@ -1,79 +1,87 @@
-import sys
-from typing import List, cast
-
-import requests
-from database import Firestore
-from database.models import PWID, Distress, Location, Responder
+import asyncio
+import time
+import uuid
+from datetime import datetime
+from typing import List, Optional, Tuple, cast
+
+from database import Storage, get_database
+from database.models import PWID, Distress, Responder
+from database.registry import ResponderRegistry
 from flask import jsonify, request
 from telebot import types
 from telebot.async_telebot import AsyncTeleBot
-from utils import get_group_chat_id, get_is_mock_location
-from utils.medical import _get_list_of_existing_experience
+from telebot.asyncio_helper import ApiTelegramException
+from utils import (
+    get_group_chat_id,
+    get_is_mock_location,
+    get_is_sos_debounce_shared,
+    get_offer_timeout,
+    get_sos_debounce_window,
+)
+from utils.debounce import sos_debouncer
+from utils.escalation import get_offer_deadline, offer_timers
+from utils.geolocation import geolocation_service, get_fallback_location
+from utils.metrics import SOS_OUTCOMES, SOS_STAGE_LATENCY, observe
+from utils.ratelimit import Priority, priority
+from utils.scoring import ResponderMatrix
+from utils.spatial import ResponderIndex
 from utils.text import _get_pwid_contacts
+from utils.tracing import start_span, traced
 from utils.url import _get_google_maps_link
 
 from routes import app
 from routes.telegram import bot
 
+MAX_CANDIDATES = 5
+CANDIDATE_POOL_SIZE = 64
+SOS_RESPONSE_POLL_INTERVAL = 0.2  # Seconds between reads of another worker's claim
 
-def _get_location_of_ip_address(ip_address: str) -> Location:
-    fields = [
-        "status",
-        "message",
-        "regionName",
-        "district",
-        "zip",
-        "lat",
-        "lon",
-        "query",
-    ]
-    response = requests.get(
-        f"http://ip-api.com/json/{ip_address}?fields={','.join(fields)}"
-    )
-    result = response.json()
-    print(result)
-
-    return Location(
-        longitude=result["lon"],
-        latitude=result["lat"],
-        address=f"{result['district']}, (S){result['zip']}",
-    )
-
-
-def get_available_responder(
-    pwid: PWID, responders: List[Responder]
-) -> Responder | None:
-    available_responder = None
-    pwid_latitude = pwid.location.latitude
-    pwid_longitude = pwid.location.longitude
-
-    smallest_latitude, smallest_longitude, largest_intersection = (
-        sys.maxsize - pwid_latitude,
-        sys.maxsize - pwid_longitude,
-        0,
-    )
-
-    for responder in responders:
-        if responder.is_available:
-            latitude = abs(pwid_latitude - responder.location.latitude)
-            longitude = abs(pwid_longitude - responder.location.longitude)
-            intersections = set(
-                _get_list_of_existing_experience(responder)
-            ).intersection(pwid.medical_conditions)
-            matches_language_preference = (
-                pwid.language_preference in responder.languages
-            )
-            matches_gender_preference = pwid.gender_preference == responder.gender
 
-            if (
-                latitude < smallest_latitude
-                and longitude < smallest_longitude
-                and len(intersections) > largest_intersection
-                and matches_language_preference
-                and matches_gender_preference
-            ):
-                available_responder = responder
-    return available_responder
+def get_available_responders(
+    pwid: PWID,
+    index: ResponderIndex,
+    k: int = MAX_CANDIDATES,
+    excluded_responders: Optional[List[int]] = None,
+) -> List[Responder]:
+    # Score the nearest pool first and only widen it if too few are eligible
+    excluded_responders = excluded_responders or []
+    pool_size = max(k, CANDIDATE_POOL_SIZE)
+    while True:
+        pool = index.nearest(
+            latitude=pwid.location.latitude,
+            longitude=pwid.location.longitude,
+            k=pool_size,
+        )
+        ranked = ResponderMatrix(
+            [
+                responder
+                for _, responder in pool
+                if responder.telegram_id not in excluded_responders
+            ]
+        ).rank(pwid, k)
+
+        if len(ranked) >= k or len(pool) < pool_size:
+            return ranked
+        pool_size *= 2
+
+
+def _to_response(body: str, status: int):
+    return (body, status) if status == 200 else (jsonify(body), status)
+
+
+async def _wait_for_shared_response(
+    database: Storage, name: str
+) -> Optional[Tuple[str, int]]:
+    # Duplicates on other workers reuse the claiming request's response as well
+    deadline = time.monotonic() + get_sos_debounce_window()
+    while time.monotonic() < deadline:
+        claim = await database.get_sos_request(name)
+        if claim is None:
+            return None
+        if "response" in claim:
+            return cast(Tuple[str, int], tuple(claim["response"]))
+        await asyncio.sleep(SOS_RESPONSE_POLL_INTERVAL)
+    return ("Distress signal is already being processed", 202)
 
 
 @app.route("/sos", methods=["GET"])
@@ -84,9 +92,6 @@ async def request_help():
     if not name:
         return jsonify("Missing query parameters"), 400
 
-    database = Firestore()
-    pwid = await database.get_pwid(name)
-
     pwid_ip_address = (
         request.environ["REMOTE_ADDR"]
         if request.environ.get("HTTP_X_FORWARDED_FOR") is None
@@ -99,52 +104,153 @@ async def request_help():
     if not pwid_ip_address:
         return jsonify("Unable to retrieve IP address"), 400
 
-    location = _get_location_of_ip_address(pwid_ip_address)
+    # Devices repeat the same signal in bursts, reuse the first request's response
+    future, is_owner = sos_debouncer.claim(name)
+    if not is_owner:
+        SOS_OUTCOMES.labels(outcome="duplicate").inc()
+        response = await sos_debouncer.wait(future)
+        if response is None:
+            return jsonify("Unable to process distress signal, kindly try again"), 500
+        return _to_response(*response)
+
+    database = get_database()
+    is_shared = get_is_sos_debounce_shared()
+    is_claimed = False
+    try:
+        if is_shared and not await database.claim_sos_request(
+            name, get_sos_debounce_window()
+        ):
+            SOS_OUTCOMES.labels(outcome="duplicate").inc()
+            shared_response = await _wait_for_shared_response(database, name)
+            if shared_response is None:
+                # The claiming request failed, let the next attempt claim it
+                sos_debouncer.release(name)
+                return (
+                    jsonify("Unable to process distress signal, kindly try again"),
+                    500,
+                )
+            response = shared_response
+        else:
+            is_claimed = is_shared
+            with priority(Priority.DISTRESS):
+                response = await process_distress_signal(
+                    database=database, name=name, ip_address=pwid_ip_address
+                )
+            outcome = "matched" if response[1] == 200 else "unmatched"
+            SOS_OUTCOMES.labels(outcome=outcome).inc()
+            if is_shared:
+                await database.resolve_sos_request(name, response)
+    except BaseException:
+        # Cancelled requests too, otherwise duplicates would wait on them forever
+        SOS_OUTCOMES.labels(outcome="failed").inc()
+        sos_debouncer.release(name)
+        # Only the claiming worker may release it, duplicates leave it be
+        if is_claimed:
+            await database.release_sos_request(name)
+        raise
+
+    sos_debouncer.resolve(name, response)
+    return _to_response(*response)
+
+
+@traced("sos.process")
+async def process_distress_signal(
+    database: Storage, name: str, ip_address: str
+) -> Tuple[str, int]:
+    pwid = await database.get_pwid(name)
+
+    with observe(SOS_STAGE_LATENCY, stage="geolocation"), start_span("sos.geolocation"):
+        location = await geolocation_service.locate(
+            ip_address, fallback=get_fallback_location(pwid)
+        )
     pwid.location = location
-    responders = await database.get_responders()
 
-    available_responder = get_available_responder(pwid=pwid, responders=responders)
-
-    group_chat_message_id = await process_notify_dispatcher(
-        bot=bot, responder=available_responder, pwid=pwid, address=location.address
-    )
+    with observe(SOS_STAGE_LATENCY, stage="matching"):
+        with start_span("sos.responders"):
+            index = await ResponderRegistry().get_index()
+        with start_span("sos.matching") as span:
+            candidates = get_available_responders(pwid=pwid, index=index)
+            span.set_attribute("sos.responders", len(index))
+            span.set_attribute("sos.candidates", len(candidates))
+    available_responder = candidates[0] if candidates else None
 
     distress = Distress(
-        group_chat_message_id=group_chat_message_id,
+        id=str(uuid.uuid4()),
+        group_chat_message_id=-1,
         message_id=-1,
         location=location,
         pwid=pwid,
         responder=available_responder,
     )
 
-    if not available_responder:
-        await database.create_distress(distress)
-        return jsonify("Unable to find an available responder right now"), 400
+    # Callbacks are keyed on the distress ID, so both chats can be notified at once
+    with observe(SOS_STAGE_LATENCY, stage="notification"), start_span(
+        "sos.notification", **{"distress.id": distress.id}
+    ):
+        group_chat_message_id, (responder, message_id) = await asyncio.gather(
+            process_notify_dispatcher(
+                bot=bot, distress=distress, responder=available_responder
+            ),
+            _notify_first_reachable_responder(
+                bot=bot, distress=distress, candidates=candidates
+            ),
+        )
+        distress.group_chat_message_id = group_chat_message_id
+        distress.responder = responder
+        distress.message_id = message_id
 
-    message_id = await process_notify_responder(bot=bot, distress=distress)
-    distress.message_id = message_id
+        if responder is not available_responder:
+            await process_notify_dispatcher(
+                bot=bot, distress=distress, responder=responder, is_edit=True
+            )
+
+    # Without a responder, the search is retried once the offer would expire
+    distress.offered_at = str(datetime.now())
+    distress.attempts = 1
     await database.create_distress(distress)
+    offer_timers.arm(distress.id, get_offer_deadline(distress))
+
+    if distress.responder is None:
+        return "Unable to find an available responder right now", 400
+
+    return distress.responder.name, 200
 
-    return available_responder.name
+
+async def _notify_first_reachable_responder(
+    bot: AsyncTeleBot, distress: Distress, candidates: List[Responder]
+) -> Tuple[Responder | None, int]:
+    # Fall back to the next ranked responder if the bot is unable to reach one
+    for candidate in candidates:
+        try:
+            message_id = await process_notify_responder(
+                bot=bot, distress=distress, responder=candidate
+            )
+            return candidate, message_id
+        except ApiTelegramException as e:
+            print(f"Unable to notify {candidate.name}", e)
+    return None, -1
 
 
-async def process_notify_responder(bot: AsyncTeleBot, distress: Distress) -> int:
+async def process_notify_responder(
+    bot: AsyncTeleBot, distress: Distress, responder: Responder | None = None
+) -> int:
+    responder = responder if responder is not None else distress.responder
     keyboard = types.InlineKeyboardMarkup()
     accept = types.InlineKeyboardButton(
         text="✅ Accept",
-        callback_data=f"distress accept {distress.group_chat_message_id}",
+        callback_data=f"distress accept {distress.id}",
     )
     decline = types.InlineKeyboardButton(
         text="❌ Decline",
-        callback_data=f"distress decline {distress.group_chat_message_id}",
+        callback_data=f"distress decline {distress.id}",
     )
     keyboard.add(accept, decline, row_width=2)
 
     text = "<b>❗ Distress Signal ❗</b>\n\n"
-    text += f"<b>{distress.pwid.name}</b> is in need of help now. He's currently located at <a href='{_get_google_maps_link(distress.pwid.location.address)}'>{distress.pwid.location.address}</a>. Kindly acknowledge this message within 30 seconds."
+    text += f"<b>{distress.pwid.name}</b> is in need of help now. He's currently located at <a href='{_get_google_maps_link(distress.pwid.location.address)}'>{distress.pwid.location.address}</a>. Kindly acknowledge this message within {get_offer_timeout():g} seconds."
 
     message = await bot.send_message(
-        chat_id=cast(Responder, distress.responder).telegram_id,
+        chat_id=cast(Responder, responder).telegram_id,
         text=text,
         parse_mode="HTML",
         reply_markup=keyboard,
@@ -154,20 +260,18 @@ async def process_notify_responder(bot: AsyncTeleBot, distress: Distress) -> int
 
 async def process_notify_dispatcher(
     bot: AsyncTeleBot,
+    distress: Distress,
     responder: Responder | None,
-    pwid: PWID,
-    address: str,
-    distress: Distress | None = None,
+    is_edit: bool = False,
 ) -> int:
-    group_chat_message_id = (
-        distress.group_chat_message_id if distress is not None else -1
-    )
+    pwid = distress.pwid
+    address = distress.location.address
     keyboard = types.InlineKeyboardMarkup()
     accept = types.InlineKeyboardButton(
-        text="✅ Accept", callback_data=f"dispatcher accept {group_chat_message_id}"
+        text="✅ Accept", callback_data=f"dispatcher accept {distress.id}"
     )
     decline = types.InlineKeyboardButton(
-        text="❌ Cancel", callback_data=f"dispatcher cancel {group_chat_message_id}"
+        text="❌ Cancel", callback_data=f"dispatcher cancel {distress.id}"
     )
     keyboard.add(accept, decline, row_width=2)
 
@@ -182,7 +286,7 @@ async def process_notify_dispatcher(
         text += f"A message has been sent out to <b>{responder.name}</b> to request for assistance."
     text += "\n\n<i>If you think that this is a false signal, please proceed to cancel this signal.</i>"
 
-    if distress is not None:
+    if is_edit:
         await bot.edit_message_text(
             chat_id=get_group_chat_id(),
             message_id=distress.group_chat_message_id,
@@ -190,7 +294,7 @@ async def process_notify_dispatcher(
             parse_mode="HTML",
             reply_markup=keyboard,
         )
-        return -1
+        return distress.group_chat_message_id
 
     message = await bot.send_message(
         chat_id=get_group_chat_id(),
@@ -198,33 +302,4 @@ async def process_notify_dispatcher(
         parse_mode="HTML",
         reply_markup=keyboard,
     )
-
-    # Hacky method to include message id in payload
-    keyboard = types.InlineKeyboardMarkup()
-    accept = types.InlineKeyboardButton(
-        text="✅ Accept", callback_data=f"dispatcher accept {message.id}"
-    )
-    decline = types.InlineKeyboardButton(
-        text="❌ Cancel", callback_data=f"dispatcher cancel {message.id}"
-    )
-    keyboard.add(accept, decline, row_width=2)
-
-    text = "<b>❗ Distress Signal ❗</b>\n\n"
-    text += "<b>Status: </b> 🔴 Not Acknowledged\n\n"
-    text += _get_pwid_contacts(pwid)
-    text += f"<b>{pwid.name}</b> is in need of help now. He's currently located at <a href='{_get_google_maps_link(address)}'>{address}</a>.\n\n"
-
-    if responder is None:
-        text += "There's no responders available at this moment. Kindly handle this signal manually or wait for the system to look for a responder."
-    else:
-        text += f"A message has been sent out to <b>{responder.name}</b> to request for assistance."
-    text += "\n\n<i>If you think that this is a false signal, please proceed to cancel this signal.</i>"
-
-    await bot.edit_message_text(
-        chat_id=get_group_chat_id(),
-        message_id=message.id,
-        text=text,
-        parse_mode="HTML",
-        reply_markup=keyboard,
-    )
     return message.id
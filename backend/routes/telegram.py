@@ -1,14 +1,23 @@
 import os
-from typing import NoReturn
+from typing import List, NoReturn, Tuple
 
-from database import Firestore
+from database import get_database
+from database.cache import request_scope
 from database.models import CustomStates, Responder
-from flask import abort, request
-from telebot import types
+from flask import Response, abort, jsonify, request
+from opentelemetry import trace
+from telebot import asyncio_helper, types
 from telebot.async_telebot import AsyncTeleBot
 from telebot.asyncio_storage import StateMemoryStorage
-from utils import get_is_dev_env
+from utils import (
+    get_is_dev_env,
+    get_telegram_api_url,
+    get_webhook_queue_size,
+    get_webhook_workers,
+)
+from utils.background import on_startup
 from utils.calendar import Calendar, CallbackFactory
+from utils.deferred import deferred
 from utils.dispatcher import process_false_distress, process_manual_acknowledge_distress
 from utils.form import (
     process_address,
@@ -22,6 +31,8 @@ from utils.form import (
     process_welcome_message,
 )
 from utils.handlers import process_cancel, process_profile, process_welcome_message
+from utils.http import connection_pool, use_for_telegram
+from utils.ingestion import RaisingExceptionHandler, UpdateQueue
 from utils.location import process_check_in, process_check_out, process_location
 from utils.medical import (
     process_add_medical_condition,
@@ -32,7 +43,9 @@ from utils.medical import (
     process_skip_description,
     process_welcome_message,
 )
+from utils.ratelimit import Priority, priority, rate_limiter
 from utils.responder import process_acknowledge_distress, process_reject_distress
+from utils.tracing import traced
 
 from routes import app
 
@@ -44,11 +57,34 @@ WEBHOOK_URL_BASE = (
 )
 WEBHOOK_URL_PATH = f"/${API_TOKEN}"
 
-bot = AsyncTeleBot(API_TOKEN, state_storage=StateMemoryStorage())
+# Overridable to run against a stand-in Bot API, see benchmarks.harness
+asyncio_helper.API_URL = f"{get_telegram_api_url()}/bot{{0}}/{{1}}"
+bot = AsyncTeleBot(
+    API_TOKEN,
+    state_storage=StateMemoryStorage(),
+    exception_handler=RaisingExceptionHandler(),
+)
+use_for_telegram(connection_pool, rate_limiter)
 calendar = Calendar()
 calendar_callback = CallbackFactory("calendar", "action", "day", "month", "day")
 
 
+async def process_updates(updates: List[types.Update]) -> None:
+    # Handlers of an update share their reads, e.g. process_welcome_message
+    with request_scope():
+        await bot.process_new_updates(updates)
+
+
+update_queue = UpdateQueue(
+    handler=process_updates,
+    workers=get_webhook_workers(),
+    max_size=get_webhook_queue_size(),
+)
+
+# Re-arm deletes and edits that were still pending when the process stopped
+on_startup(lambda: deferred.restore(bot))
+
+
 @app.route("/setWebhook", methods=["GET"])
 async def setWebhook() -> str:
     print(WEBHOOK_URL_BASE + WEBHOOK_URL_PATH)
@@ -65,24 +101,37 @@ async def setWebhook() -> str:
 
 
 @app.route(WEBHOOK_URL_PATH, methods=["POST"])
-async def webhook() -> str | NoReturn:
+def webhook() -> str | Tuple[str, int] | NoReturn:
     if request.headers.get("content-type") == "application/json":
         json_string = request.get_data().decode("utf-8")
         update = types.Update.de_json(json_string)
 
-        if update:
-            await bot.process_new_updates([update])
+        # Acknowledge immediately, Telegram retries the update if we push back
+        if update and not update_queue.submit(update):
+            return "", 429
         return ""
     else:
         abort(403)
 
 
+@app.route("/webhook/queue", methods=["GET"])
+def get_webhook_queue() -> Response:
+    return jsonify(update_queue.get_metrics())
+
+
+@app.route("/telegram/rate-limit", methods=["GET"])
+def get_rate_limit() -> Response:
+    return jsonify(rate_limiter.get_metrics())
+
+
 @bot.callback_query_handler(func=lambda call: True)
+@traced("telegram.callback")
 async def callback_handler(call: types.CallbackQuery) -> None:
     # callback_data are separated by <action> <payload>
     callback_data = call.data.split(" ") if " " in call.data else [call.data]
     action = callback_data[0]
-    database = Firestore()
+    trace.get_current_span().set_attribute("telegram.callback.action", action)
+    database = get_database()
     print(callback_data)
 
     match action:
@@ -152,52 +201,54 @@ async def callback_handler(call: types.CallbackQuery) -> None:
             )
         case "distress":
             option = callback_data[1]
-            group_chat_message_id = callback_data[2]
+            distress_id = callback_data[2]
 
-            if option == "accept":
-                await process_acknowledge_distress(
-                    bot=bot,
-                    database=database,
-                    callback=call,
-                    group_chat_message_id=int(group_chat_message_id),
-                )
-            else:
-                await process_reject_distress(
-                    bot=bot,
-                    database=database,
-                    callback=call,
-                    group_chat_message_id=int(group_chat_message_id),
-                )
+            with priority(Priority.DISTRESS):
+                if option == "accept":
+                    await process_acknowledge_distress(
+                        bot=bot,
+                        database=database,
+                        callback=call,
+                        distress_id=distress_id,
+                    )
+                else:
+                    await process_reject_distress(
+                        bot=bot,
+                        database=database,
+                        callback=call,
+                        distress_id=distress_id,
+                    )
         case "dispatcher":
             option = callback_data[1]
+            distress_id = callback_data[2]
 
-            if option == "accept":
-                group_chat_message_id = callback_data[2]
-                await process_manual_acknowledge_distress(
-                    bot=bot,
-                    database=database,
-                    callback=call,
-                    group_chat_message_id=int(group_chat_message_id),
-                )
-            else:
-                await process_false_distress(
-                    bot=bot,
-                    database=database,
-                    callback=call,
-                    group_chat_message_id=call.message.id,
-                )
+            with priority(Priority.DISTRESS):
+                if option == "accept":
+                    await process_manual_acknowledge_distress(
+                        bot=bot,
+                        database=database,
+                        callback=call,
+                        distress_id=distress_id,
+                    )
+                else:
+                    await process_false_distress(
+                        bot=bot,
+                        database=database,
+                        callback=call,
+                        distress_id=distress_id,
+                    )
 
 
 @bot.message_handler(commands=["start"])
 async def welcome_message(message: types.Message) -> None:
-    database = Firestore()
+    database = get_database()
     await process_welcome_message(bot=bot, database=database, message=message)
     await bot.delete_message(chat_id=message.chat.id, message_id=message.id)
 
 
 @bot.message_handler(func=lambda message: True, content_types=["location"])
 async def location_handler(message: types.Message) -> None:
-    database = Firestore()
+    database = get_database()
     await process_location(bot=bot, database=database, message=message)
     await bot.delete_message(chat_id=message.chat.id, message_id=message.id)
 
@@ -207,7 +258,7 @@ async def message_handler(message: types.Message):
     if not message.text or message.from_user.is_bot:
         return
     if not message.text.startswith("/"):
-        database = Firestore()
+        database = get_database()
 
         # Ignore messages sent by users that have yet to onboard
         try:
@@ -0,0 +1,42 @@
+from typing import Optional
+
+from flask import Response, g, request
+from opentelemetry import context, trace
+from opentelemetry.trace import SpanKind
+from utils.tracing import set_error, setup_tracing, tracer
+
+from routes import app
+from routes.metrics import get_route
+
+setup_tracing()
+
+
+@app.before_request
+def start_request_span() -> None:
+    # Views run their coroutines in a copy of this context, so their spans nest
+    route = get_route()
+    g.span = tracer.start_span(
+        f"{request.method} {route}",
+        kind=SpanKind.SERVER,
+        attributes={"http.method": request.method, "http.route": route},
+    )
+    g.span_token = context.attach(trace.set_span_in_context(g.span))
+
+
+@app.after_request
+def set_request_span_status(response: Response) -> Response:
+    g.span.set_attribute("http.status_code", response.status_code)
+    if response.status_code >= 500:
+        set_error(g.span, response.status)
+    return response
+
+
+@app.teardown_request
+def end_request_span(exception: Optional[BaseException]) -> None:
+    if "span" not in g:
+        return
+
+    if exception is not None:
+        g.span.record_exception(exception)
+    g.span.end()
+    context.detach(g.span_token)
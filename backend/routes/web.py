@@ -1,42 +1,299 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
 from datetime import datetime
+from typing import Iterator, Optional
 
-from database import Firestore
-from database.models import Location, Responder
-from flask import jsonify, request
+from database import get_database
+from database.feed import DistressFeed, get_event_id, get_overlap_start
+from database.models import DistressStatus, Location, Responder
+from flask import Response, jsonify, request
+from utils.clustering import (
+    MAX_TILES,
+    MAX_ZOOM,
+    Tile,
+    aggregate_tile,
+    get_tile_bounds,
+    get_tiles,
+    tile_cache,
+    to_features,
+)
+from utils.escalation import offer_timers
+from utils.events import Event, distress_events
 
 from routes import app
 
 SYSTEM = Responder(id="-1", telegram_id=-1, location=Location(-1, -1), name="System")
 
+STREAM_RETRY_INTERVAL = 3000  # Milliseconds before EventSource reconnects
+STREAM_HEARTBEAT_INTERVAL = 15
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+DISTRESS_FIELDS = {
+    "id",
+    "group_chat_message_id",
+    "message_id",
+    "location",
+    "pwid",
+    "responder",
+    "created_at",
+    "acknowledged_at",
+    "is_completed",
+    "is_acknowledged",
+    "updated_at",
+}
+# Fields shown on the dashboard listing
+DEFAULT_FIELDS = [
+    "id",
+    "group_chat_message_id",
+    "location",
+    "pwid",
+    "responder",
+    "created_at",
+    "is_completed",
+    "is_acknowledged",
+    "updated_at",
+]
+
+
+def _encode_cursor(cursor: Optional[dict]) -> Optional[str]:
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> dict:
+    return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+
+def _parse_time(value: Optional[str]) -> Optional[str]:
+    # Stored as str(datetime), which sorts lexicographically
+    return str(datetime.fromisoformat(value)) if value else None
+
+
+def _get_etag(*parts: Optional[str]) -> str:
+    return hashlib.sha1("|".join(str(x) for x in parts).encode()).hexdigest()
+
+
+def _get_not_modified(etag: str) -> Response:
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
 
 @app.route("/distress", methods=["GET"])
 async def get_all_distress_signals():
-    database = Firestore()
-    distress_signals = await database.get_all_distress()
+    args = request.args
 
-    return jsonify([distress.to_dict() for distress in distress_signals])
+    try:
+        limit = min(int(args.get("limit", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        cursor = _decode_cursor(args["cursor"]) if args.get("cursor") else None
+        status = DistressStatus(args["status"]) if args.get("status") else None
+        created_after = _parse_time(args.get("created_after"))
+        created_before = _parse_time(args.get("created_before"))
+        since = _parse_time(args.get("since"))
+    except (ValueError, binascii.Error):
+        return jsonify("Invalid query parameters"), 400
 
+    fields = args["fields"].split(",") if args.get("fields") else DEFAULT_FIELDS
+    if limit < 1 or any(x.split(".")[0] not in DISTRESS_FIELDS for x in fields):
+        return jsonify("Invalid query parameters"), 400
 
-@app.route("/distress/accept/<id>", methods=["POST"])
-async def accept_distress_signals(id: int):
-    database = Firestore()
+    database = get_database()
+
+    try:
+        distress_signals, next_cursor = await database.get_distress_page(
+            limit=limit,
+            cursor=cursor,
+            status=status,
+            pwid=args.get("pwid"),
+            created_after=created_after,
+            created_before=created_before,
+            # Deltas are returned oldest change first, so that the last
+            # signal's update time is the next watermark
+            updated_after=get_overlap_start(since) if since else None,
+            sort="updated_at" if since else args.get("sort", "created_at"),
+            is_descending=False if since else args.get("order", "desc") != "asc",
+            fields=fields,
+        )
+    except ValueError as e:
+        return jsonify(str(e)), 400
+
+    if since:
+        next_watermark = since
+        if distress_signals:
+            next_watermark = max(since, distress_signals[-1]["updated_at"])
+    else:
+        # Full listings hand out the current watermark to poll deltas from
+        next_watermark = await database.get_distress_watermark()
+
+    # A late write may not move the watermark, so responses are compared by
+    # the signals returned
+    etag = _get_etag(
+        request.query_string.decode(),
+        next_watermark,
+        *[f"{x.get('id')}@{x.get('updated_at')}" for x in distress_signals],
+    )
+    if request.if_none_match.contains(etag):
+        return _get_not_modified(etag)
+
+    response = jsonify(
+        {
+            "data": distress_signals,
+            "next_cursor": _encode_cursor(next_cursor),
+            "watermark": next_watermark,
+        }
+    )
+    response.set_etag(etag)
+    # Browsers must revalidate instead of serving a stale listing
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.route("/distress/stream", methods=["GET"])
+async def stream_distress_signals():
+    # EventSource resends the last ID as a header, the query is for first connects
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get(
+        "last_event_id"
+    )
+    DistressFeed().start()
+
+    # Events are published in commit order, so one committed late may have a
+    # lower ID than the last event received
+    resume_from = get_overlap_start(last_event_id) if last_event_id else None
+    backlog, sequence = distress_events.replay(resume_from)
+    if backlog is None:
+        # Resuming from before the replay buffer, catch up from the database instead
+        distress_signals, next_cursor = await get_database().get_distress_page(
+            limit=MAX_PAGE_SIZE,
+            updated_after=resume_from,
+            sort="updated_at",
+            is_descending=False,
+        )
+        backlog = [Event(get_event_id(x), "updated", x) for x in distress_signals]
+        if next_cursor is not None:
+            # Too far behind, the client should reload its listing
+            backlog = [Event(backlog[-1].id, "resync")]
+
+    # Every open stream holds one of the worker's threads
+    if not distress_events.subscribe():
+        return jsonify("Too many open event streams, poll /distress instead"), 503
+
+    def generate() -> Iterator[str]:
+        events, position, is_behind = backlog, sequence, False
+        try:
+            yield f"retry: {STREAM_RETRY_INTERVAL}\n\n"
+            while True:
+                if is_behind:
+                    yield Event(events[0].id if events else "", "resync").to_sse()
+                for event in events:
+                    yield event.to_sse()
+                if not events:
+                    # Keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+
+                events, position, is_behind = distress_events.listen(
+                    position, STREAM_HEARTBEAT_INTERVAL
+                )
+        finally:
+            distress_events.unsubscribe()
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/distress/stream/metrics", methods=["GET"])
+async def get_distress_stream_metrics():
+    return jsonify(DistressFeed().get_metrics())
+
+
+@app.route("/distress/geo", methods=["GET"])
+async def get_distress_clusters():
+    args = request.args
+
+    try:
+        south, west, north, east = [
+            float(args[x]) for x in ["south", "west", "north", "east"]
+        ]
+        zoom = int(args["zoom"])
+        status = DistressStatus(args["status"]) if args.get("status") else None
+    except (KeyError, ValueError):
+        return jsonify("Invalid query parameters"), 400
+
+    if not 0 <= zoom <= MAX_ZOOM or south >= north or west >= east:
+        return jsonify("Invalid query parameters"), 400
+
+    tiles = get_tiles(south, west, north, east, zoom)
+    if len(tiles) > MAX_TILES:
+        return jsonify("Bounding box is too large for this zoom level"), 400
+
+    # Changes to distress signals evict their tiles through the feed
+    DistressFeed().start()
+    database = get_database()
+    status_filter = status.value if status is not None else None
+
+    async def get_cells(tile: Tile) -> dict:
+        cells = tile_cache.get(tile, status_filter)
+        if cells is None:
+            generation = tile_cache.get_generation()
+            distress_signals = await database.get_distress_in_bounds(
+                *get_tile_bounds(tile), status=status
+            )
+            cells = aggregate_tile(tile, distress_signals)
+            tile_cache.set(tile, status_filter, cells, generation)
+        return cells
+
+    features = []
+    for cells in await asyncio.gather(*[get_cells(x) for x in tiles]):
+        features += to_features(cells.values())
+
+    return jsonify({"type": "FeatureCollection", "features": features})
+
+
+@app.route("/distress/geo/metrics", methods=["GET"])
+async def get_distress_clusters_metrics():
+    return jsonify(tile_cache.get_metrics())
+
+
+@app.route("/distress/<id>", methods=["GET"])
+async def get_distress_signal(id: str):
+    database = get_database()
     distress_signal = await database.get_distress(id)
-    distress_signal.acknowledged_at = str(datetime.now())
-    distress_signal.is_acknowledged = True
-    distress_signal.responder = SYSTEM
+    await database.hydrate_distress(distress_signal)
 
-    await database.update_distress(distress_signal)
+    return jsonify(distress_signal.to_dict(is_compact=False))
+
+
+@app.route("/distress/accept/<id>", methods=["POST"])
+async def accept_distress_signals(id: str):
+    database = get_database()
+    # Settled under the lease so that an expiring offer is not re-offered
+    async with offer_timers.hold(id):
+        distress_signal = await database.get_distress(id)
+        distress_signal.acknowledged_at = str(datetime.now())
+        distress_signal.is_acknowledged = True
+        distress_signal.responder = SYSTEM
+
+        await database.update_distress(distress_signal)
+    offer_timers.cancel(id)
 
     return jsonify({"message": f"Distress signal {id} has been acknowledged"})
 
 
 @app.route("/distress/cancel/<id>", methods=["POST"])
-async def cancel_distress_signals(id: int):
-    database = Firestore()
-    distress_signal = await database.get_distress(id)
-    distress_signal.is_completed = True
-    distress_signal.responder = SYSTEM
+async def cancel_distress_signals(id: str):
+    database = get_database()
+    async with offer_timers.hold(id):
+        distress_signal = await database.get_distress(id)
+        distress_signal.is_completed = True
+        distress_signal.responder = SYSTEM
 
-    await database.update_distress(distress_signal)
+        await database.update_distress(distress_signal)
+    offer_timers.cancel(id)
 
     return jsonify({"message": f"Distress signal {id} has been cancelled"})
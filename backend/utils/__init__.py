@@ -20,3 +20,140 @@ def get_is_dev_env() -> bool:
 
 def get_is_mock_location() -> bool:
     return bool(os.getenv("MOCK_LOCATION", False))
+
+
+def get_registry_timeout() -> float:
+    return float(os.getenv("REGISTRY_TIMEOUT", 5))
+
+
+def get_registry_max_staleness() -> float:
+    return float(os.getenv("REGISTRY_MAX_STALENESS", 60))
+
+
+def get_geolocation_timeout() -> float:
+    return float(os.getenv("GEOLOCATION_TIMEOUT", 2))
+
+
+def get_geolocation_cache_size() -> int:
+    return int(os.getenv("GEOLOCATION_CACHE_SIZE", 1024))
+
+
+def get_geolocation_cache_ttl() -> float:
+    return float(os.getenv("GEOLOCATION_CACHE_TTL", 3600))
+
+
+def get_geoip_database_path() -> str:
+    return os.getenv("GEOIP_DATABASE_PATH", "")
+
+
+def get_sos_debounce_window() -> float:
+    return float(os.getenv("SOS_DEBOUNCE_WINDOW", 30))
+
+
+def get_is_sos_debounce_shared() -> bool:
+    return bool(os.getenv("SOS_DEBOUNCE_SHARED", False))
+
+
+def get_deferred_actions_path() -> str:
+    return os.getenv("DEFERRED_ACTIONS_PATH", "")
+
+
+def get_webhook_workers() -> int:
+    return int(os.getenv("WEBHOOK_WORKERS", 8))
+
+
+def get_webhook_queue_size() -> int:
+    return int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))
+
+
+def get_responder_cache_size() -> int:
+    return int(os.getenv("RESPONDER_CACHE_SIZE", 1024))
+
+
+def get_responder_cache_ttl() -> float:
+    return float(os.getenv("RESPONDER_CACHE_TTL", 60))
+
+
+def get_event_buffer_size() -> int:
+    return int(os.getenv("EVENT_BUFFER_SIZE", 1000))
+
+
+def get_delta_overlap() -> float:
+    return float(os.getenv("DELTA_OVERLAP", 10))
+
+
+def get_max_event_streams() -> int:
+    # Half of the threads by default, the rest are left to other requests
+    return int(os.getenv("MAX_EVENT_STREAMS", get_server_threads() // 2))
+
+
+def get_geo_tile_cache_size() -> int:
+    return int(os.getenv("GEO_TILE_CACHE_SIZE", 4096))
+
+
+def get_geo_tile_cache_ttl() -> float:
+    return float(os.getenv("GEO_TILE_CACHE_TTL", 300))
+
+
+def get_server_mode() -> str:
+    return os.getenv("SERVER_MODE", "wsgi").lower()
+
+
+def get_server_threads() -> int:
+    return int(os.getenv("GUNICORN_THREADS", 32))
+
+
+def get_http_pool_size() -> int:
+    return int(os.getenv("HTTP_POOL_SIZE", 100))
+
+
+def get_http_pool_size_per_host() -> int:
+    return int(os.getenv("HTTP_POOL_SIZE_PER_HOST", 50))
+
+
+def get_http_keepalive_timeout() -> float:
+    return float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 60))
+
+
+def get_telegram_rate_limit() -> float:
+    return float(os.getenv("TELEGRAM_RATE_LIMIT", 30))
+
+
+def get_telegram_chat_rate_limit() -> float:
+    return float(os.getenv("TELEGRAM_CHAT_RATE_LIMIT", 1))
+
+
+def get_telegram_group_rate_limit() -> float:
+    return float(os.getenv("TELEGRAM_GROUP_RATE_LIMIT", 20))
+
+
+def get_offer_timeout() -> float:
+    return float(os.getenv("OFFER_TIMEOUT", 30))
+
+
+def get_max_offer_attempts() -> int:
+    return int(os.getenv("MAX_OFFER_ATTEMPTS", 3))
+
+
+def get_storage_backend() -> str:
+    return os.getenv("STORAGE_BACKEND", "firestore").lower()
+
+
+def get_sqlite_path() -> str:
+    return os.getenv("SQLITE_PATH", get_file_path("connectid.db"))
+
+
+def get_telegram_api_url() -> str:
+    return os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+
+
+def get_ip_api_url() -> str:
+    return os.getenv("IP_API_URL", "http://ip-api.com")
+
+
+def get_tracing_exporter() -> str:
+    return os.getenv("TRACING_EXPORTER", "none").lower()
+
+
+def get_tracing_file_path() -> str:
+    return os.getenv("TRACING_FILE_PATH", get_file_path("traces.jsonl"))
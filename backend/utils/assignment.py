@@ -0,0 +1,105 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from database.models import PWID, Responder
+from utils.scoring import ResponderMatrix
+from utils.spatial import ResponderIndex
+
+CANDIDATE_POOL_SIZE = 32
+OVERLAP_DISTANCE_KM = 0.5  # Each shared medical condition is worth 500m of travel
+INFEASIBLE = 1e9
+
+
+def build_cost_matrix(
+    pwids: List[PWID],
+    matrix: ResponderMatrix,
+    excluded_responders: Optional[List[List[int]]] = None,
+) -> np.ndarray:
+    # Rows are PWIDs, columns are responders, ineligible pairs are infeasible
+    costs = np.full((len(pwids), len(matrix)), INFEASIBLE)
+    excluded_responders = excluded_responders or [[] for _ in pwids]
+
+    for row, (pwid, excluded) in enumerate(zip(pwids, excluded_responders)):
+        is_eligible, distances, overlaps = matrix.score(pwid)
+        is_eligible &= np.fromiter(
+            (x.telegram_id not in excluded for x in matrix.responders),
+            dtype=bool,
+            count=len(matrix),
+        )
+        costs[row] = np.where(
+            is_eligible, distances - OVERLAP_DISTANCE_KM * overlaps, INFEASIBLE
+        )
+    return costs
+
+
+def _get_candidates(
+    pwid: PWID,
+    index: ResponderIndex,
+    excluded: List[int],
+    pool_size: int,
+    required: int,
+) -> List[Responder]:
+    # Widen the nearest pool until enough are eligible or the index is exhausted
+    while True:
+        pool = [
+            responder
+            for _, responder in index.nearest(
+                latitude=pwid.location.latitude,
+                longitude=pwid.location.longitude,
+                k=pool_size,
+                predicate=lambda x: x.is_available and x.telegram_id not in excluded,
+            )
+        ]
+        if len(pool) == 0:
+            return []
+
+        matrix = ResponderMatrix(pool)
+        is_eligible, _, _ = matrix.score(pwid)
+        eligible = [pool[i] for i in np.flatnonzero(is_eligible)]
+
+        if len(eligible) >= required or len(pool) < pool_size:
+            return eligible
+        pool_size *= 2
+
+
+def assign_responders(
+    pwids: List[PWID],
+    index: ResponderIndex,
+    excluded_responders: Optional[List[List[int]]] = None,
+    pool_size: int = CANDIDATE_POOL_SIZE,
+) -> List[Responder | None]:
+    """
+    Assigns at most one responder to each PWID so that total cost is minimised.
+    :param pwids: PWIDs of the pending distress signals.
+    :param index: Spatial index of available responders.
+    :param excluded_responders: Telegram IDs that may not be assigned, per PWID.
+    :param pool_size: Number of nearest responders first considered per PWID.
+    :return: Assigned responder for each PWID, None if no responder is eligible.
+    """
+    if len(pwids) == 0:
+        return []
+
+    excluded_responders = excluded_responders or [[] for _ in pwids]
+    # With as many eligible candidates as PWIDs, each of them can be assigned
+    required = min(len(pwids), pool_size)
+
+    # Only the union of each PWID's eligible candidates enters the matrix
+    candidates: Dict[int, Responder] = {}
+    for pwid, excluded in zip(pwids, excluded_responders):
+        for responder in _get_candidates(pwid, index, excluded, pool_size, required):
+            candidates[responder.telegram_id] = responder
+
+    assignments: List[Responder | None] = [None] * len(pwids)
+    if len(candidates) == 0:
+        return assignments
+
+    matrix = ResponderMatrix(list(candidates.values()))
+    costs = build_cost_matrix(pwids, matrix, excluded_responders)
+    rows, columns = linear_sum_assignment(costs)
+
+    for row, column in zip(rows, columns):
+        if costs[row, column] < INFEASIBLE:
+            assignments[row] = matrix.responders[column]
+    return assignments
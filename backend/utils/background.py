@@ -0,0 +1,55 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Coroutine, List, Optional
+
+from utils import get_server_mode
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_lock = threading.Lock()
+_startup_hooks: List[Callable[[], None]] = []
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    # Started lazily so that every gunicorn worker owns its own loop after forking
+    global _loop
+
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name="background-loop", daemon=True
+            ).start()
+    return _loop
+
+
+def set_background_loop(loop: asyncio.AbstractEventLoop) -> None:
+    # Servers with their own long-lived loop (ASGI mode) run background work on it
+    global _loop
+
+    with _lock:
+        _loop = loop
+        hooks = _startup_hooks[:]
+        _startup_hooks.clear()
+
+    for hook in hooks:
+        hook()
+
+
+def on_startup(hook: Callable[[], None]) -> None:
+    """
+    Runs work that needs the background loop once the worker's loop is known,
+    e.g. re-arming timers after a restart. In ASGI mode that is at lifespan
+    startup, otherwise right away.
+    :param hook: Called without arguments on the worker's startup.
+    """
+    if get_server_mode() != "asgi":
+        hook()
+        return
+
+    with _lock:
+        _startup_hooks.append(hook)
+
+
+def run_in_background(coroutine: Coroutine[Any, Any, Any]) -> Future:
+    return asyncio.run_coroutine_threadsafe(coroutine, get_background_loop())
@@ -0,0 +1,239 @@
+import math
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from cachetools import LRUCache, TTLCache
+
+from utils import get_geo_tile_cache_size, get_geo_tile_cache_ttl
+from utils.events import Event, distress_events
+
+MAX_ZOOM = 20
+GRID_SIZE = 8  # Each tile is clustered into GRID_SIZE x GRID_SIZE cells
+MAX_TILES = 64  # Tiles a single bounding box may cover
+COORDINATE_PRECISION = 5  # ~1m, enough for a marker
+
+STATUS_FILTERS = [None, "pending", "acknowledged", "completed"]
+
+Tile = Tuple[int, int, int]  # zoom, x, y
+
+
+def _get_tile_position(
+    latitude: float, longitude: float, zoom: int
+) -> Tuple[float, float]:
+    # Fractional Web Mercator tile coordinates, as used by map tiles
+    n = 2**zoom
+    latitude = max(min(latitude, 85.0511), -85.0511)
+    x = (longitude + 180) / 360 * n
+    y = (1 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2 * n
+    return min(max(x, 0), n - 1e-9), min(max(y, 0), n - 1e-9)
+
+
+def get_tile(latitude: float, longitude: float, zoom: int) -> Tile:
+    x, y = _get_tile_position(latitude, longitude, zoom)
+    return zoom, int(x), int(y)
+
+
+def get_tile_bounds(tile: Tile) -> Tuple[float, float, float, float]:
+    """
+    :return: Tuple of (south, west, north, east) in degrees.
+    """
+    zoom, x, y = tile
+    n = 2**zoom
+
+    def get_latitude(y: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+
+    return (
+        get_latitude(y + 1),
+        x / n * 360 - 180,
+        get_latitude(y),
+        (x + 1) / n * 360 - 180,
+    )
+
+
+def get_tiles(
+    south: float, west: float, north: float, east: float, zoom: int
+) -> List[Tile]:
+    # Bounding boxes crossing the antimeridian are not supported
+    _, min_x, min_y = get_tile(north, west, zoom)
+    _, max_x, max_y = get_tile(south, east, zoom)
+    return [
+        (zoom, x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)
+    ]
+
+
+def get_status(source: dict) -> str:
+    if source["is_completed"]:
+        return "completed"
+    if source["is_acknowledged"]:
+        return "acknowledged"
+    return "pending"
+
+
+def aggregate_tile(
+    tile: Tile, distress_signals: Iterable[dict]
+) -> Dict[Tuple[int, int], dict]:
+    """
+    Groups distress signals within a tile into grid cells.
+    :param tile: Tile the distress signals are in.
+    :param distress_signals: Distress signals with at least id, location and status fields.
+    :return: Mapping of grid cells to their aggregate.
+    """
+    zoom, tile_x, tile_y = tile
+    cells: Dict[Tuple[int, int], dict] = {}
+
+    for x in distress_signals:
+        latitude = x["location"]["latitude"]
+        longitude = x["location"]["longitude"]
+        position_x, position_y = _get_tile_position(latitude, longitude, zoom)
+        if int(position_x) != tile_x or int(position_y) != tile_y:
+            continue
+
+        cell = (
+            int((position_x - tile_x) * GRID_SIZE),
+            int((position_y - tile_y) * GRID_SIZE),
+        )
+        aggregate = cells.setdefault(
+            cell,
+            {
+                "count": 0,
+                "latitude": 0.0,
+                "longitude": 0.0,
+                "pending": 0,
+                "acknowledged": 0,
+                "completed": 0,
+                "id": x["id"],
+            },
+        )
+        aggregate["count"] += 1
+        aggregate["latitude"] += latitude
+        aggregate["longitude"] += longitude
+        aggregate[get_status(x)] += 1
+
+    return cells
+
+
+def to_features(cells: Iterable[dict]) -> List[dict]:
+    # Clusters sit at the centroid of their signals, single signals keep their ID
+    features = []
+    for x in cells:
+        properties = {
+            "count": x["count"],
+            "pending": x["pending"],
+            "acknowledged": x["acknowledged"],
+            "completed": x["completed"],
+        }
+        if x["count"] == 1:
+            properties["id"] = x["id"]
+
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [
+                        round(x["longitude"] / x["count"], COORDINATE_PRECISION),
+                        round(x["latitude"] / x["count"], COORDINATE_PRECISION),
+                    ],
+                },
+                "properties": properties,
+            }
+        )
+    return features
+
+
+class TileCache:
+    """
+    Cluster aggregates per tile and status filter.
+
+    A change to a distress signal only evicts the tiles containing it, one per
+    zoom level, while the TTL bounds staleness if change events are missed.
+    Tiles read from storage are not cached if they were evicted during the read.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self._cache = TTLCache(maxsize=max_size, ttl=ttl)
+        self._lock = threading.Lock()
+        # Generation of the last eviction of each tile, older ones are folded
+        # into _evicted_generation once they fall out
+        self._generation = 0
+        self._tile_generations = LRUCache(maxsize=max_size)
+        self._evicted_generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, tile: Tile, status: Optional[str]) -> Optional[Dict]:
+        with self._lock:
+            cells = self._cache.get((tile, status))
+            if cells is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return cells
+
+    def get_generation(self) -> int:
+        # Taken before reading a tile to set() afterwards
+        return self._generation
+
+    def set(
+        self,
+        tile: Tile,
+        status: Optional[str],
+        cells: Dict,
+        generation: Optional[int] = None,
+    ) -> None:
+        """
+        Caches the clusters of a tile.
+        :param tile: The tile.
+        :param status: Status filter the clusters were aggregated with.
+        :param cells: The clusters.
+        :param generation: get_generation() from before the tile was read, the
+        clusters are skipped if the tile was evicted since.
+        """
+        with self._lock:
+            if generation is not None:
+                evicted = self._tile_generations.get(tile, self._evicted_generation)
+                if evicted > generation:
+                    return
+            self._cache[(tile, status)] = cells
+
+    def _set_tile_generation(self, tile: Tile) -> None:
+        if (
+            tile not in self._tile_generations
+            and len(self._tile_generations) >= self._tile_generations.maxsize
+        ):
+            _, generation = self._tile_generations.popitem()
+            self._evicted_generation = max(self._evicted_generation, generation)
+        self._tile_generations[tile] = self._generation
+
+    def invalidate(self, latitude: float, longitude: float) -> None:
+        tiles = [get_tile(latitude, longitude, zoom) for zoom in range(MAX_ZOOM + 1)]
+
+        with self._lock:
+            self._generation += 1
+            for tile in tiles:
+                self._set_tile_generation(tile)
+                for status in STATUS_FILTERS:
+                    if self._cache.pop((tile, status), None) is not None:
+                        self.invalidations += 1
+
+    def get_metrics(self) -> dict:
+        return {
+            "tiles": len(self._cache),
+            "max_size": self._cache.maxsize,
+            "ttl": self._cache.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+def _invalidate_tiles(event: Event) -> None:
+    location = event.data.get("location")
+    if location is not None:
+        tile_cache.invalidate(location["latitude"], location["longitude"])
+
+
+tile_cache = TileCache(max_size=get_geo_tile_cache_size(), ttl=get_geo_tile_cache_ttl())
+distress_events.add_listener(_invalidate_tiles)
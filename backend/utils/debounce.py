@@ -0,0 +1,89 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Deque, Dict, Tuple
+
+from utils import get_sos_debounce_window
+
+
+class SOSDebouncer:
+    """
+    Coalesces bursts of SOS requests from the same PWID.
+
+    The first request within a window claims the PWID and does the work, any
+    duplicate waits on (or immediately reuses) the claimed request's response.
+    Entries live in a plain dict keyed by PWID name, so lookups are O(1), and
+    in a queue ordered by claim time, so eviction only looks at expired ones.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[float, Future]] = {}
+        self._claims: Deque[Tuple[float, str, Future]] = deque()
+
+    def _evict_expired(self, now: float, window: float) -> None:
+        in_flight = []
+        while self._claims and now - self._claims[0][0] > window:
+            claim = self._claims.popleft()
+            _, name, future = claim
+            # Requests still in flight keep their entry, later ones are evicted
+            if not future.done():
+                in_flight.append(claim)
+                continue
+
+            entry = self._entries.get(name)
+            # Released PWIDs may have been claimed again since
+            if entry is not None and entry[1] is future:
+                del self._entries[name]
+
+        self._claims.extendleft(reversed(in_flight))
+
+    def claim(self, name: str) -> Tuple[Future, bool]:
+        """
+        Claims a PWID for the current window.
+        :param name: Name of the PWID.
+        :return: Tuple of (future holding the response, whether this request owns it).
+        """
+        now = time.monotonic()
+        window = get_sos_debounce_window()
+
+        with self._lock:
+            self._evict_expired(now, window)
+            entry = self._entries.get(name)
+
+            # Responses are only reused within the window, in-flight requests
+            # are waited on however long they take
+            if entry is not None and (not entry[1].done() or now - entry[0] <= window):
+                return entry[1], False
+
+            future = Future()
+            self._entries[name] = (now, future)
+            self._claims.append((now, name, future))
+            return future, True
+
+    def resolve(self, name: str, response: Any) -> None:
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is not None and not entry[1].done():
+            entry[1].set_result(response)
+
+    def release(self, name: str) -> None:
+        # Failed requests should not suppress the next attempt
+        with self._lock:
+            entry = self._entries.pop(name, None)
+        if entry is not None and not entry[1].done():
+            entry[1].cancel()
+
+    async def wait(self, future: Future) -> Any:
+        # Returns None if the owning request failed
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if future.cancelled():
+                return None
+            raise
+
+
+sos_debouncer = SOSDebouncer()
@@ -0,0 +1,191 @@
+import asyncio
+import glob
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List
+
+from telebot.async_telebot import AsyncTeleBot
+
+from utils import get_deferred_actions_path
+from utils.background import get_background_loop
+from utils.ratelimit import Priority, priority
+
+NOTIFICATION_DELAY = 3
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _get_orphaned_paths(path: str) -> List[str]:
+    # Files of workers that are gone, or of an earlier process with this PID.
+    # Includes files claimed by a worker that exited before restoring them.
+    paths = []
+    for worker_path in glob.glob(f"{glob.escape(path)}*"):
+        suffix = worker_path[len(path) :]
+        match = re.fullmatch(r"\.(\d+)(\.[0-9a-f-]+\.claimed)?", suffix)
+        if suffix == "":
+            # Written before files were kept per worker
+            paths.append(worker_path)
+        elif match is not None:
+            pid = int(match.group(1))
+            if pid == os.getpid() or not _is_alive(pid):
+                paths.append(worker_path)
+    return paths
+
+
+class DeferredActions:
+    """
+    Runs actions after a delay on the background event loop so that handlers can
+    return immediately instead of sleeping inside the webhook request.
+
+    Timers are kept in the loop's own scheduling heap. Bot API calls scheduled
+    with keyword arguments only are also written to DEFERRED_ACTIONS_PATH,
+    suffixed with the worker's PID, so pending deletes and edits can be
+    restored after a restart. Each worker only rewrites its own file, and the
+    files of exited workers, or files they had claimed themselves, are claimed
+    by exactly one worker on restore.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._persisted: Dict[str, dict] = {}
+
+    def _is_persistable(self, action: Callable, args: tuple, kwargs: dict) -> bool:
+        if not get_deferred_actions_path() or args:
+            return False
+        if not isinstance(getattr(action, "__self__", None), AsyncTeleBot):
+            return False
+
+        try:
+            json.dumps(kwargs)
+        except TypeError:
+            return False
+        return True
+
+    def _get_path(self) -> str:
+        return f"{get_deferred_actions_path()}.{os.getpid()}"
+
+    def _save(self) -> None:
+        path = self._get_path()
+        temporary_path = f"{path}.tmp"
+
+        with open(temporary_path, "w") as file:
+            json.dump(list(self._persisted.values()), file)
+        os.replace(temporary_path, path)
+
+    def schedule(
+        self,
+        delay: float,
+        action: Callable[..., Awaitable[Any]],
+        *args,
+        **kwargs,
+    ) -> str:
+        """
+        Schedules an action to be awaited after a delay.
+        :param delay: Seconds to wait before running the action.
+        :param action: Coroutine function, e.g. bot.delete_message.
+        :return: ID of the scheduled action.
+        """
+        action_id = str(uuid.uuid4())
+        due = time.time() + delay
+
+        if self._is_persistable(action, args, kwargs):
+            with self._lock:
+                self._persisted[action_id] = {
+                    "id": action_id,
+                    "due": due,
+                    "method": action.__name__,
+                    "kwargs": kwargs,
+                }
+                self._save()
+
+        loop = get_background_loop()
+        loop.call_soon_threadsafe(self._arm, loop, action_id, due, action, args, kwargs)
+        return action_id
+
+    def _arm(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        action_id: str,
+        due: float,
+        action: Callable[..., Awaitable[Any]],
+        args: tuple,
+        kwargs: dict,
+    ) -> None:
+        loop.call_later(
+            max(0.0, due - time.time()),
+            lambda: loop.create_task(self._run(action_id, action, args, kwargs)),
+        )
+
+    async def _run(
+        self,
+        action_id: str,
+        action: Callable[..., Awaitable[Any]],
+        args: tuple,
+        kwargs: dict,
+    ) -> None:
+        try:
+            with priority(Priority.BACKGROUND):
+                await action(*args, **kwargs)
+        except Exception as e:
+            print(f"Deferred action {getattr(action, '__name__', action)} failed", e)
+        finally:
+            with self._lock:
+                if self._persisted.pop(action_id, None) is not None:
+                    self._save()
+
+    def _claim(self, path: str) -> List[dict]:
+        # Renaming is atomic, so only one worker can take over an orphaned file
+        claimed_path = f"{self._get_path()}.{uuid.uuid4()}.claimed"
+        try:
+            os.rename(path, claimed_path)
+        except FileNotFoundError:
+            return []
+
+        with open(claimed_path) as file:
+            records = json.load(file)
+
+        # Written to this worker's own file before the claimed one is dropped
+        with self._lock:
+            for record in records:
+                self._persisted[record["id"]] = record
+            self._save()
+        os.remove(claimed_path)
+        return records
+
+    def restore(self, bot: AsyncTeleBot) -> None:
+        # Re-arms persisted bot actions, overdue ones run immediately
+        path = get_deferred_actions_path()
+        if not path:
+            return
+
+        records = []
+        for orphaned_path in _get_orphaned_paths(path):
+            records += self._claim(orphaned_path)
+
+        loop = get_background_loop()
+
+        for record in records:
+            loop.call_soon_threadsafe(
+                self._arm,
+                loop,
+                record["id"],
+                record["due"],
+                getattr(bot, record["method"]),
+                (),
+                record["kwargs"],
+            )
+
+
+deferred = DeferredActions()
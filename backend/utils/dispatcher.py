@@ -1,12 +1,13 @@
-import asyncio
 from datetime import datetime
 
-from database import Firestore
+from database import Storage
 from database.models import Distress, Responder
 from telebot import types
 from telebot.async_telebot import AsyncTeleBot
 
 from utils import get_group_chat_id
+from utils.deferred import NOTIFICATION_DELAY, deferred
+from utils.escalation import offer_timers
 from utils.text import _get_pwid_contacts
 from utils.url import _get_google_maps_link
 
@@ -17,16 +18,21 @@ def _get_anchor_tag(distress: Distress) -> str:
 
 async def process_manual_acknowledge_distress(
     bot: AsyncTeleBot,
-    database: Firestore,
+    database: Storage,
     callback: types.CallbackQuery,
-    group_chat_message_id: int,
+    distress_id: str,
 ) -> None:
-    distress = await database.get_distress(group_chat_message_id)
-    distress.is_acknowledged = True
-    distress.acknowledged_at = str(datetime.now())
-    distress.is_completed = True
-
-    await database.update_distress(distress)
+    # Taken over under the lease, otherwise an expiring offer may re-offer it
+    async with offer_timers.hold(distress_id):
+        distress = await database.get_distress(distress_id)
+        # Emergency contacts are only kept on the PWID document
+        await database.hydrate_distress(distress)
+        distress.is_acknowledged = True
+        distress.acknowledged_at = str(datetime.now())
+        distress.is_completed = True
+
+        await database.update_distress(distress)
+    offer_timers.cancel(distress.id)
 
     # Responder message
     if distress.responder is not None:
@@ -35,9 +41,11 @@ async def process_manual_acknowledge_distress(
             message_id=distress.message_id,
             text=f"This distress signal has been taken over by the dispatchers.",
         )
-        await asyncio.sleep(3)
-        await bot.delete_message(
-            chat_id=distress.responder.telegram_id, message_id=distress.message_id
+        deferred.schedule(
+            NOTIFICATION_DELAY,
+            bot.delete_message,
+            chat_id=distress.responder.telegram_id,
+            message_id=distress.message_id,
         )
 
     # Dispatcher group chat message
@@ -56,16 +64,18 @@ async def process_manual_acknowledge_distress(
 
 async def process_false_distress(
     bot: AsyncTeleBot,
-    database: Firestore,
+    database: Storage,
     callback: types.CallbackQuery,
-    group_chat_message_id: int,
+    distress_id: str,
 ) -> None:
-    distress = await database.get_distress(group_chat_message_id)
-    distress.is_acknowledged = True
-    distress.acknowledged_at = str(datetime.now())
-    distress.is_completed = True
+    async with offer_timers.hold(distress_id):
+        distress = await database.get_distress(distress_id)
+        distress.is_acknowledged = True
+        distress.acknowledged_at = str(datetime.now())
+        distress.is_completed = True
 
-    await database.update_distress(distress)
+        await database.update_distress(distress)
+    offer_timers.cancel(distress.id)
 
     # Responder message
     if distress.responder is not None:
@@ -74,9 +84,11 @@ async def process_false_distress(
             message_id=distress.message_id,
             text=f"This distress signal is deemed to be a false signal by the dispatchers. Apologies for any inconvenience caused.",
         )
-        await asyncio.sleep(3)
-        await bot.delete_message(
-            chat_id=distress.responder.telegram_id, message_id=distress.message_id
+        deferred.schedule(
+            NOTIFICATION_DELAY,
+            bot.delete_message,
+            chat_id=distress.responder.telegram_id,
+            message_id=distress.message_id,
         )
 
     # Dispatcher group chat message
@@ -86,7 +98,7 @@ async def process_false_distress(
 
     await bot.edit_message_text(
         chat_id=get_group_chat_id(),
-        message_id=group_chat_message_id,
+        message_id=distress.group_chat_message_id,
         text=text,
         parse_mode="HTML",
     )
@@ -0,0 +1,182 @@
+import asyncio
+import os
+import socket
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from database import get_database
+from database.models import Distress
+
+from utils import get_offer_timeout
+from utils.background import get_background_loop, run_in_background
+
+# Seconds a worker may act on an expired offer before another worker takes over
+LEASE_DURATION = 60
+# Seconds before retrying an expired offer whose handler failed
+RETRY_DELAY = 10
+# Seconds between attempts to claim a lease held by another handler
+LEASE_POLL_INTERVAL = 0.2
+
+
+def get_offer_deadline(distress: Distress) -> float:
+    """
+    :return: Unix time at which the current offer expires, 0 if no offer is
+    outstanding and the distress signal should be offered right away.
+    """
+    if not distress.offered_at:
+        return 0
+    offered_at = datetime.fromisoformat(distress.offered_at).timestamp()
+    return offered_at + get_offer_timeout()
+
+
+def _get_owner() -> str:
+    # Unique per claim, so handlers within a worker exclude each other too
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+
+
+class OfferTimers:
+    """
+    Fires when a responder's offer to a distress signal expires.
+
+    Timers live on the background loop's scheduling heap. Every worker may arm
+    a timer for the same distress signal, e.g. after rebuilding them at
+    startup, so the worker whose timer fires first takes a lease on the signal
+    in the database and the others only re-arm for the lease's expiry.
+    Callbacks settling an offer hold the same lease, see hold().
+    """
+
+    def __init__(self) -> None:
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._handler: Optional[Callable[[str], Awaitable[Optional[float]]]] = None
+
+    def set_handler(self, handler: Callable[[str], Awaitable[Optional[float]]]) -> None:
+        """
+        :param handler: Called with the ID of a distress signal whose offer
+        expired, returns the Unix time to fire again or None once it is settled.
+        """
+        self._handler = handler
+
+    def arm(self, distress_id: str, due: float) -> None:
+        loop = get_background_loop()
+        loop.call_soon_threadsafe(self._arm, loop, distress_id, due)
+
+    def cancel(self, distress_id: str) -> None:
+        get_background_loop().call_soon_threadsafe(self._cancel, distress_id)
+
+    def _arm(
+        self, loop: asyncio.AbstractEventLoop, distress_id: str, due: float
+    ) -> None:
+        self._cancel(distress_id)
+        self._timers[distress_id] = loop.call_later(
+            max(0.0, due - time.time()),
+            lambda: loop.create_task(self._expire(distress_id)),
+        )
+
+    def _cancel(self, distress_id: str) -> None:
+        timer = self._timers.pop(distress_id, None)
+        if timer is not None:
+            timer.cancel()
+
+    @asynccontextmanager
+    async def hold(self, distress_id: str) -> AsyncIterator[None]:
+        """
+        Holds the lease on a distress signal for the block, e.g. while a
+        responder acknowledges it, so that an expiring offer cannot re-offer it
+        in the meantime. Waits for a handler holding the lease to finish first.
+        :param distress_id: ID of the distress signal to hold.
+        """
+        database = get_database()
+        owner = _get_owner()
+
+        # Leases expire, so this ends even if the holding worker died
+        while not await database.claim_distress_lease(
+            distress_id, owner, LEASE_DURATION
+        ):
+            await asyncio.sleep(LEASE_POLL_INTERVAL)
+
+        try:
+            yield
+        finally:
+            await database.release_distress_lease(distress_id, owner)
+
+    @asynccontextmanager
+    async def hold_free(self, distress_ids: List[str]) -> AsyncIterator[List[str]]:
+        """
+        Holds the leases on whichever distress signals are free for the block,
+        without waiting for the others, e.g. for a batch that retries them later.
+        :param distress_ids: IDs of the distress signals to hold.
+        :return: IDs of the distress signals held.
+        """
+        database = get_database()
+        owner = _get_owner()
+
+        is_owner = await asyncio.gather(
+            *[
+                database.claim_distress_lease(x, owner, LEASE_DURATION)
+                for x in distress_ids
+            ],
+            return_exceptions=True,
+        )
+        held = [x for x, y in zip(distress_ids, is_owner) if y is True]
+
+        try:
+            yield held
+        finally:
+            await asyncio.gather(
+                *[database.release_distress_lease(x, owner) for x in held]
+            )
+
+    async def _expire(self, distress_id: str) -> None:
+        self._timers.pop(distress_id, None)
+        database = get_database()
+        owner = _get_owner()
+        loop = asyncio.get_running_loop()
+
+        try:
+            is_owner = await database.claim_distress_lease(
+                distress_id, owner, LEASE_DURATION
+            )
+        except Exception as e:
+            print(f"Unable to claim lease for {distress_id}", e)
+            self._arm(loop, distress_id, time.time() + RETRY_DELAY)
+            return
+
+        if not is_owner:
+            # Check again in case the owning worker dies before settling it
+            self._arm(loop, distress_id, time.time() + LEASE_DURATION)
+            return
+
+        try:
+            due = await self._handler(distress_id)
+        except Exception as e:
+            print(f"Unable to process expired offer for {distress_id}", e)
+            due = time.time() + RETRY_DELAY
+        finally:
+            await database.release_distress_lease(distress_id, owner)
+
+        if due is not None and distress_id not in self._timers:
+            self._arm(loop, distress_id, due)
+
+    async def _restore(self) -> None:
+        distress_signals = await get_database().get_all_incomplete_distress()
+        loop = asyncio.get_running_loop()
+
+        for distress in distress_signals:
+            # Acknowledged signals have a responder on the way
+            if distress.is_acknowledged or distress.is_escalated:
+                continue
+            self._arm(loop, distress.id, get_offer_deadline(distress))
+        print(f"Restored {len(self._timers)} offer timers")
+
+    def restore(self) -> None:
+        # Rebuilds timers of outstanding offers after a restart
+        run_in_background(self._restore())
+
+    def get_metrics(self) -> dict:
+        return {"timers": len(self._timers)}
+
+
+offer_timers = OfferTimers()
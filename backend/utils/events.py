@@ -0,0 +1,114 @@
+import json
+import threading
+from collections import deque
+from typing import Callable, Deque, List, Optional, Tuple
+
+from utils import get_event_buffer_size, get_max_event_streams
+
+
+class Event:
+    def __init__(self, id: str, type: str, data: Optional[dict] = None) -> None:
+        self.id = id  # Ordered, clients resume from the last ID they received
+        self.type = type
+        self.data = data if data is not None else {}
+
+    def to_sse(self) -> str:
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data)}\n\n"
+
+    def __repr__(self) -> str:
+        return str(vars(self))
+
+
+class EventBroker:
+    """
+    In-process fan-out of events to any number of subscribers.
+
+    Events are appended once to a bounded replay buffer and every subscriber
+    reads the buffer from its own position, so publishing costs the same
+    regardless of how many subscribers are listening. Each subscriber blocks
+    a thread while it listens, so their number is capped.
+    """
+
+    def __init__(self, buffer_size: int, max_subscribers: int) -> None:
+        self._condition = threading.Condition()
+        self._events: Deque[Tuple[int, Event]] = deque(maxlen=buffer_size)
+        self._sequence = 0
+        self._evicted_id: Optional[str] = None
+        self._listeners: List[Callable[[Event], None]] = []
+        self.subscribers = 0
+        self.max_subscribers = max_subscribers
+        self.refused = 0
+
+    def add_listener(self, listener: Callable[[Event], None]) -> None:
+        # Listeners are called on the publishing thread and must not block
+        self._listeners.append(listener)
+
+    def publish(self, event: Event) -> None:
+        with self._condition:
+            if len(self._events) == self._events.maxlen:
+                # Events are published in commit order, not in ID order
+                evicted_id = self._events[0][1].id
+                self._evicted_id = max(self._evicted_id or evicted_id, evicted_id)
+
+            self._sequence += 1
+            self._events.append((self._sequence, event))
+            self._condition.notify_all()
+
+        for listener in self._listeners:
+            listener(event)
+
+    def replay(self, after_id: Optional[str]) -> Tuple[Optional[List[Event]], int]:
+        """
+        Returns the buffered events with a greater ID.
+        :param after_id: ID to replay from, e.g. before the last event received.
+        :return: Tuple of (events with a greater ID, or None if some were
+        already evicted, sequence to listen from).
+        """
+        with self._condition:
+            if after_id is None:
+                return [], self._sequence
+            if self._evicted_id is not None and self._evicted_id > after_id:
+                return None, self._sequence
+            return [x for _, x in self._events if x.id > after_id], self._sequence
+
+    def listen(self, sequence: int, timeout: float) -> Tuple[List[Event], int, bool]:
+        """
+        Waits for events published after a sequence.
+        :param sequence: Sequence returned by the previous call.
+        :param timeout: Seconds to wait before returning no events.
+        :return: Tuple of (events, next sequence, whether events were missed).
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._sequence > sequence, timeout)
+
+            events = [x for seq, x in self._events if seq > sequence]
+            oldest = self._events[0][0] if self._events else self._sequence + 1
+            return events, self._sequence, oldest > sequence + 1
+
+    def subscribe(self) -> bool:
+        # False once the maximum number of subscribers are listening
+        with self._condition:
+            if self.subscribers >= self.max_subscribers:
+                self.refused += 1
+                return False
+            self.subscribers += 1
+            return True
+
+    def unsubscribe(self) -> None:
+        with self._condition:
+            self.subscribers -= 1
+
+    def get_metrics(self) -> dict:
+        return {
+            "subscribers": self.subscribers,
+            "max_subscribers": self.max_subscribers,
+            "refused": self.refused,
+            "published": self._sequence,
+            "buffered": len(self._events),
+            "buffer_size": self._events.maxlen,
+        }
+
+
+distress_events = EventBroker(
+    buffer_size=get_event_buffer_size(), max_subscribers=get_max_event_streams()
+)
@@ -1,14 +1,14 @@
-import asyncio
 import uuid
 from datetime import datetime
 from typing import List
 
-from database import Firestore
+from database import Storage
 from database.models import CustomStates, Location, Responder
 from telebot import types
 from telebot.async_telebot import AsyncTeleBot
 
 from utils.calendar import Calendar, CallbackFactory
+from utils.deferred import NOTIFICATION_DELAY, deferred
 from utils.handlers import process_welcome_message
 from utils.text import format_form_text
 
@@ -18,7 +18,7 @@ def _retrieve_next_state(responder: Responder) -> CustomStates:
 
 
 async def process_onboard(
-    bot: AsyncTeleBot, database: Firestore, callback: types.CallbackQuery
+    bot: AsyncTeleBot, database: Storage, callback: types.CallbackQuery
 ) -> None:
     # User might not have granted location permissions
     latitude, longitude = 0.0, 0.0
@@ -76,7 +76,7 @@ async def process_name(
 
 async def process_language(
     bot: AsyncTeleBot,
-    database: Firestore,
+    database: Storage,
     callback: types.CallbackQuery,
     languages: list[str],
 ) -> None:
@@ -98,7 +98,7 @@ async def process_language(
 
 
 async def process_phone_number(
-    bot: AsyncTeleBot, database: Firestore, responder: Responder, message: types.Message
+    bot: AsyncTeleBot, database: Storage, responder: Responder, message: types.Message
 ) -> bool:
     # Handle phone number input
     if not message.text:
@@ -176,7 +176,7 @@ async def process_address(
 
 async def process_date_of_birth(
     bot: AsyncTeleBot,
-    database: Firestore,
+    database: Storage,
     callback: types.CallbackQuery,
     calendar: Calendar,
     callback_data: List[str],
@@ -222,7 +222,7 @@ async def process_date_of_birth(
 
 async def process_gender(
     bot: AsyncTeleBot,
-    database: Firestore,
+    database: Storage,
     callback: types.CallbackQuery,
     gender: str,
 ) -> None:
@@ -248,5 +248,6 @@ async def process_gender(
         parse_mode="HTML",
     )
 
-    await asyncio.sleep(3)
-    await process_welcome_message(bot, callback.message, True)
+    deferred.schedule(
+        NOTIFICATION_DELAY, process_welcome_message, bot, callback.message, True
+    )
@@ -0,0 +1,165 @@
+from abc import ABC, abstractmethod
+import asyncio
+import bisect
+import csv
+import ipaddress
+import threading
+from typing import List, Optional
+
+from cachetools import TTLCache
+
+from database.models import PWID, Location
+from utils import (
+    get_geoip_database_path,
+    get_geolocation_cache_size,
+    get_geolocation_cache_ttl,
+    get_geolocation_timeout,
+    get_ip_api_url,
+)
+from utils.http import connection_pool
+
+IP_API_FIELDS = ["status", "message", "district", "zip", "lat", "lon"]
+
+# Addresses within the same prefix are treated as the same location
+IPV4_PREFIX_LENGTH = 24
+IPV6_PREFIX_LENGTH = 48
+
+
+def _format_address(district: str, zip_code: str) -> str:
+    return f"{district}, (S){zip_code}"
+
+
+def _get_cache_key(ip_address: str) -> str:
+    address = ipaddress.ip_address(ip_address)
+    prefix_length = IPV4_PREFIX_LENGTH if address.version == 4 else IPV6_PREFIX_LENGTH
+    return str(ipaddress.ip_network(f"{address}/{prefix_length}", strict=False))
+
+
+class GeolocationProvider(ABC):
+    @abstractmethod
+    async def locate(self, ip_address: str) -> Optional[Location]:
+        raise NotImplementedError
+
+
+class IpApiProvider(GeolocationProvider):
+    async def locate(self, ip_address: str) -> Optional[Location]:
+        url = f"{get_ip_api_url()}/json/{ip_address}?fields={','.join(IP_API_FIELDS)}"
+        result = await connection_pool.get_json(url, get_geolocation_timeout())
+
+        if result.get("status") != "success":
+            print("Unable to locate IP address", result)
+            return None
+
+        return Location(
+            longitude=result["lon"],
+            latitude=result["lat"],
+            address=_format_address(result["district"], result["zip"]),
+        )
+
+
+class LocalGeoIPProvider(GeolocationProvider):
+    """
+    Offline lookup against a CSV range table with the columns
+    start_ip, end_ip, latitude, longitude, district, zip.
+
+    Ranges are sorted by their start address once at load time, lookups are a
+    binary search over the range starts.
+    """
+
+    def __init__(self, path: str) -> None:
+        rows = []
+        with open(path, newline="") as file:
+            for row in csv.DictReader(file):
+                rows.append(
+                    (
+                        int(ipaddress.ip_address(row["start_ip"])),
+                        int(ipaddress.ip_address(row["end_ip"])),
+                        Location(
+                            longitude=float(row["longitude"]),
+                            latitude=float(row["latitude"]),
+                            address=_format_address(row["district"], row["zip"]),
+                        ),
+                    )
+                )
+        rows.sort(key=lambda x: x[0])
+
+        self._starts = [x[0] for x in rows]
+        self._ranges = rows
+
+    def lookup(self, ip_address: str) -> Optional[Location]:
+        address = int(ipaddress.ip_address(ip_address))
+        position = bisect.bisect_right(self._starts, address) - 1
+
+        if position < 0:
+            return None
+
+        _, end, location = self._ranges[position]
+        return location if address <= end else None
+
+    async def locate(self, ip_address: str) -> Optional[Location]:
+        return self.lookup(ip_address)
+
+
+class GeolocationService:
+    """
+    Resolves IP addresses through a chain of providers with an LRU + TTL cache
+    keyed by network prefix. Falls back to a default location if every provider
+    fails or times out.
+    """
+
+    def __init__(self, providers: List[GeolocationProvider]) -> None:
+        self.providers = providers
+        self._cache = TTLCache(
+            maxsize=get_geolocation_cache_size(), ttl=get_geolocation_cache_ttl()
+        )
+        self._lock = threading.Lock()
+
+    async def locate(self, ip_address: str, fallback: Location) -> Location:
+        try:
+            key = _get_cache_key(ip_address)
+        except ValueError:
+            return fallback
+
+        with self._lock:
+            location = self._cache.get(key)
+        if location is not None:
+            return location
+
+        for provider in self.providers:
+            try:
+                location = await asyncio.wait_for(
+                    provider.locate(ip_address), timeout=get_geolocation_timeout()
+                )
+            except Exception as e:
+                print(f"{type(provider).__name__} failed to locate {ip_address}", e)
+                continue
+
+            if location is not None:
+                with self._lock:
+                    self._cache[key] = location
+                return location
+
+        return fallback
+
+
+def _create_geolocation_service() -> GeolocationService:
+    providers: List[GeolocationProvider] = []
+
+    path = get_geoip_database_path()
+    if path:
+        providers.append(LocalGeoIPProvider(path))
+    providers.append(IpApiProvider())
+
+    return GeolocationService(providers)
+
+
+geolocation_service = _create_geolocation_service()
+
+
+def get_fallback_location(pwid: PWID) -> Location:
+    # Stored PWID locations may not carry an address, default to their home address
+    return Location(
+        longitude=pwid.location.longitude,
+        latitude=pwid.location.latitude,
+        address=pwid.location.address or pwid.address,
+    )
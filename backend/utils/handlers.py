@@ -1,6 +1,6 @@
 from typing import Optional, cast
 
-from database import Firestore
+from database import Storage
 from database.models import CustomStates, Responder
 from telebot import types
 from telebot.async_telebot import AsyncTeleBot
@@ -13,7 +13,7 @@ async def process_welcome_message(
     message: types.Message | int,
     is_edit=False,
     is_delete=False,
-    database: Optional[Firestore] = None,
+    database: Optional[Storage] = None,
     chat_id: Optional[int] = None,
     responder_id: Optional[int] = None,
 ) -> None:
@@ -99,7 +99,7 @@ async def process_welcome_message(
 
 
 async def process_profile(
-    bot: AsyncTeleBot, database: Firestore, callback: types.CallbackQuery
+    bot: AsyncTeleBot, database: Storage, callback: types.CallbackQuery
 ) -> None:
     responder = await database.get_responder(callback.from_user.id)
 
@@ -148,7 +148,7 @@ async def process_profile(
 
 
 async def process_cancel(
-    bot: AsyncTeleBot, database: Firestore, callback: types.CallbackQuery
+    bot: AsyncTeleBot, database: Storage, callback: types.CallbackQuery
 ) -> None:
     await process_welcome_message(
         bot=bot, database=database, message=callback.message, is_edit=True
@@ -0,0 +1,138 @@
+import asyncio
+import ssl
+from typing import Any, Coroutine, Optional, TypeVar
+
+import aiohttp
+import certifi
+from opentelemetry.trace import SpanKind
+from telebot import asyncio_helper
+
+from utils import (
+    get_http_keepalive_timeout,
+    get_http_pool_size,
+    get_http_pool_size_per_host,
+)
+from utils.background import get_background_loop
+from utils.metrics import TELEGRAM_LATENCY, observe
+from utils.ratelimit import RateLimiter
+from utils.tracing import start_span
+
+T = TypeVar("T")
+
+
+class ConnectionPool:
+    """
+    Keep-alive connections for outbound HTTP requests, shared by a worker.
+
+    aiohttp sessions are bound to the loop that created them, so the pool lives
+    on the worker's long-lived background loop (the server loop in ASGI mode).
+    Requests made on any other loop, such as the per-request loops of WSGI
+    mode, are run on it instead, so TLS handshakes are only paid once per
+    connection rather than once per request.
+    """
+
+    def __init__(self, limit: int, limit_per_host: int, keepalive_timeout: float):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.ssl_context = ssl.create_default_context(cafile=certifi.where())
+        self.sessions_created = 0
+        self.requests = 0
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        # Only called on the pool's loop, see run()
+        loop = asyncio.get_running_loop()
+        session = self.session
+
+        if session is not None and not session.closed and session._loop is loop:
+            return session
+
+        if session is not None and not session.closed and session._loop.is_running():
+            # The background loop was replaced by the server loop
+            asyncio.run_coroutine_threadsafe(session.close(), session._loop)
+
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ssl=self.ssl_context,
+            )
+        )
+        self.sessions_created += 1
+        return self.session
+
+    async def run(self, coroutine: Coroutine[Any, Any, T]) -> T:
+        """
+        Runs a coroutine making requests on the pool's loop.
+        :param coroutine: Coroutine using sessions from get_session().
+        """
+        self.requests += 1
+        loop = get_background_loop()
+
+        if asyncio.get_running_loop() is loop:
+            return await coroutine
+        # Cancelling the caller cancels the request on the pool's loop as well
+        return await asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(coroutine, loop)
+        )
+
+    async def get_json(self, url: str, timeout: float) -> Any:
+        async def request() -> Any:
+            session = await self.get_session()
+            async with session.get(
+                url, timeout=aiohttp.ClientTimeout(total=timeout)
+            ) as response:
+                return await response.json()
+
+        return await self.run(request())
+
+    def get_metrics(self) -> dict:
+        connector = self.session.connector if self.session is not None else None
+
+        return {
+            "limit": self.limit,
+            "limit_per_host": self.limit_per_host,
+            "keepalive_timeout": self.keepalive_timeout,
+            "sessions_created": self.sessions_created,
+            "requests": self.requests,
+            "idle_connections": (
+                sum(len(x) for x in connector._conns.values())
+                if connector is not None
+                else 0
+            ),
+        }
+
+
+def use_for_telegram(pool: ConnectionPool, limiter: RateLimiter) -> None:
+    """
+    Routes every Bot API request of pyTelegramBotAPI through a connection pool,
+    within the rate limits of Telegram.
+    """
+    process_request = asyncio_helper._process_request
+
+    async def _process_request(
+        token, url, method="get", params=None, files=None, **kwargs
+    ):
+        async def send():
+            # Timed once allowed through, the wait is reported by the rate limiter
+            with observe(TELEGRAM_LATENCY, method=url):
+                return await process_request(
+                    token, url, method, params, files, **kwargs
+                )
+
+        # Spans the wait for the rate limiter as well, as seen by the caller
+        with start_span(f"telegram.{url}", kind=SpanKind.CLIENT):
+            return await pool.run(limiter.submit(url, params, send))
+
+    # The library looks both up as module globals on every request
+    asyncio_helper.session_manager = pool
+    asyncio_helper._process_request = _process_request
+
+
+connection_pool = ConnectionPool(
+    limit=get_http_pool_size(),
+    limit_per_host=get_http_pool_size_per_host(),
+    keepalive_timeout=get_http_keepalive_timeout(),
+)
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+from typing import Awaitable, Callable, List, Optional
+
+from opentelemetry import context
+from telebot import types
+from telebot.async_telebot import ExceptionHandler
+
+from utils.background import get_background_loop, run_in_background
+from utils.tracing import start_span
+
+
+def _get_chat_id(update: types.Update) -> int:
+    # Updates from the same chat must land on the same lane to keep their order
+    if update.message is not None:
+        return update.message.chat.id
+    if update.callback_query is not None:
+        if update.callback_query.message is not None:
+            return update.callback_query.message.chat.id
+        return update.callback_query.from_user.id
+    if update.edited_message is not None:
+        return update.edited_message.chat.id
+    return update.update_id
+
+
+class RaisingExceptionHandler(ExceptionHandler):
+    # The bot swallows handler errors otherwise, so they would never be counted
+    def handle(self, exception: Exception) -> bool:
+        raise exception
+
+
+class UpdateQueue:
+    """
+    Bounded pool of workers that processes Telegram updates off the request path.
+
+    Each chat is pinned to one lane and every lane is drained by a single worker
+    on the background loop, so updates from a chat are handled in order while
+    different chats proceed concurrently. Submissions beyond the capacity are
+    rejected so that the webhook can push back on Telegram.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[List[types.Update]], Awaitable[None]],
+        workers: int,
+        max_size: int,
+    ) -> None:
+        self.handler = handler
+        self.workers = workers
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._lanes: Optional[List[asyncio.Queue]] = None
+        self._depth = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    async def _start(self) -> None:
+        if self._lanes is not None:
+            return
+
+        self._lanes = [asyncio.Queue() for _ in range(self.workers)]
+        for lane in self._lanes:
+            asyncio.get_running_loop().create_task(self._work(lane))
+
+    def start(self) -> None:
+        if self._lanes is None:
+            run_in_background(self._start()).result()
+
+    async def _work(self, lane: asyncio.Queue) -> None:
+        while True:
+            update, trace_context = await lane.get()
+            try:
+                # Joins the trace of the webhook request that received the update
+                with start_span(
+                    "telegram.update",
+                    context=trace_context,
+                    **{"telegram.update_id": update.update_id},
+                ):
+                    await self.handler([update])
+                with self._lock:
+                    self.processed += 1
+            except Exception as e:
+                print(f"Failed to process update {update.update_id}", e)
+                with self._lock:
+                    self.failed += 1
+            finally:
+                with self._lock:
+                    self._depth -= 1
+                lane.task_done()
+
+    def submit(self, update: types.Update) -> bool:
+        """
+        Enqueues an update for processing.
+        :param update: Update received by the webhook.
+        :return: False if the queue is full and the update was rejected.
+        """
+        self.start()
+
+        with self._lock:
+            if self._depth >= self.max_size:
+                self.rejected += 1
+                return False
+            self._depth += 1
+
+        lane = self._lanes[_get_chat_id(update) % self.workers]
+        get_background_loop().call_soon_threadsafe(
+            lane.put_nowait, (update, context.get_current())
+        )
+        return True
+
+    def get_metrics(self) -> dict:
+        return {
+            "depth": self._depth,
+            "lanes": [x.qsize() for x in self._lanes] if self._lanes else [],
+            "max_size": self.max_size,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
@@ -1,11 +1,11 @@
-import asyncio
 from typing import cast
 
-from database import Firestore
+from database import Storage
 from database.models import Location
 from telebot import types
 from telebot.async_telebot import AsyncTeleBot
 
+from utils.deferred import NOTIFICATION_DELAY, deferred
 from utils.handlers import process_welcome_message
 
 
@@ -14,7 +14,7 @@ def _get_check_in_out_message(check_in=True):
 
 
 async def process_check_in(
-    bot: AsyncTeleBot, database: Firestore, callback: types.CallbackQuery
+    bot: AsyncTeleBot, database: Storage, callback: types.CallbackQuery
 ) -> None:
     markup = types.ReplyKeyboardMarkup(one_time_keyboard=True, resize_keyboard=True)
     button = types.KeyboardButton(
@@ -38,7 +38,7 @@ async def process_check_in(
 
 
 async def process_check_out(
-    bot: AsyncTeleBot, database: Firestore, callback: types.CallbackQuery
+    bot: AsyncTeleBot, database: Storage, callback: types.CallbackQuery
 ) -> None:
     responder = await database.get_responder(callback.message.chat.id)
 
@@ -49,9 +49,11 @@ async def process_check_out(
         chat_id=callback.message.chat.id,
         text=_get_check_in_out_message(False),
     )
-    await asyncio.sleep(3)
-    await bot.delete_message(
-        chat_id=callback.message.chat.id, message_id=notification.id
+    deferred.schedule(
+        NOTIFICATION_DELAY,
+        bot.delete_message,
+        chat_id=callback.message.chat.id,
+        message_id=notification.id,
     )
     await process_welcome_message(
         bot=bot, message=callback.message, is_edit=True, database=database
@@ -59,7 +61,7 @@ async def process_check_out(
 
 
 async def process_location(
-    bot: AsyncTeleBot, database: Firestore, message: types.Message
+    bot: AsyncTeleBot, database: Storage, message: types.Message
 ) -> None:
     responder = await database.get_responder(message.chat.id)
 
@@ -74,8 +76,12 @@ async def process_location(
         chat_id=message.chat.id,
         text=_get_check_in_out_message(),
     )
-    await asyncio.sleep(3)
-    await bot.delete_message(chat_id=message.chat.id, message_id=notification.id)
+    deferred.schedule(
+        NOTIFICATION_DELAY,
+        bot.delete_message,
+        chat_id=message.chat.id,
+        message_id=notification.id,
+    )
     await process_welcome_message(
         bot=bot,
         message=responder.message_id,
@@ -1,12 +1,12 @@
-import asyncio
 from datetime import datetime
 from typing import List
 
-from database import Firestore
+from database import Storage
 from database.models import CustomStates, ExistingMedicalKnowledge, Responder
 from telebot import types
 from telebot.async_telebot import AsyncTeleBot
 
+from utils.deferred import NOTIFICATION_DELAY, deferred
 from utils.handlers import CANCEL_BUTTON, process_welcome_message
 
 MEDICAL_CONDITIONS = [
@@ -31,7 +31,7 @@ def _get_list_of_existing_experience(responder: Responder) -> List[str]:
 
 
 async def process_list_medical_conditions(
-    bot: AsyncTeleBot, database: Firestore, callback: types.CallbackQuery
+    bot: AsyncTeleBot, database: Storage, callback: types.CallbackQuery
 ) -> None:
     responder = await database.get_responder(callback.from_user.id)
     existing_experience = _get_list_of_existing_experience(responder)
@@ -51,8 +51,12 @@ async def process_list_medical_conditions(
                 "You already possess all the medical conditions available in the system. Do contact our staffs at +65 9812 3456 if you deem that this condition is necessary."
             ),
         )
-        await asyncio.sleep(3)
-        await bot.delete_message(chat_id=message.chat.id, message_id=message.id)
+        deferred.schedule(
+            NOTIFICATION_DELAY,
+            bot.delete_message,
+            chat_id=message.chat.id,
+            message_id=message.id,
+        )
         return
 
     buttons = [
@@ -72,7 +76,7 @@ async def process_list_medical_conditions(
 
 async def process_add_medical_condition(
     bot: AsyncTeleBot,
-    database: Firestore,
+    database: Storage,
     callback: types.CallbackQuery,
     condition: str,
 ) -> None:
@@ -101,7 +105,7 @@ async def process_add_medical_condition(
 
 
 async def process_skip_description(
-    bot: AsyncTeleBot, database: Firestore, callback: types.CallbackQuery
+    bot: AsyncTeleBot, database: Storage, callback: types.CallbackQuery
 ) -> None:
     responder = await database.get_responder(callback.from_user.id)
     responder.state = CustomStates.NOOP
@@ -113,9 +117,13 @@ async def process_skip_description(
         text=(f"You have successfully updated your profile."),
     )
 
-    await asyncio.sleep(3)
-    await process_welcome_message(
-        bot=bot, database=database, message=callback.message, is_edit=True
+    deferred.schedule(
+        NOTIFICATION_DELAY,
+        process_welcome_message,
+        bot=bot,
+        database=database,
+        message=callback.message,
+        is_edit=True,
     )
 
 
@@ -139,15 +147,19 @@ async def process_add_medical_condition_description(
             f"You have successfully added a description to {sorted_medical_conditions[0].condition}."
         ),
     )
-    await asyncio.sleep(3)
-    await process_welcome_message(
-        bot=bot, message=responder.message_id, chat_id=message.chat.id, is_edit=True
+    deferred.schedule(
+        NOTIFICATION_DELAY,
+        process_welcome_message,
+        bot=bot,
+        message=responder.message_id,
+        chat_id=message.chat.id,
+        is_edit=True,
     )
     return True
 
 
 async def process_list_existing_medical_condition(
-    bot: AsyncTeleBot, database: Firestore, callback: types.CallbackQuery
+    bot: AsyncTeleBot, database: Storage, callback: types.CallbackQuery
 ) -> None:
     responder = await database.get_responder(callback.from_user.id)
     existing_experience = _get_list_of_existing_experience(responder)
@@ -156,9 +168,11 @@ async def process_list_existing_medical_condition(
         notification = await bot.send_message(
             chat_id=callback.message.chat.id, text="You do not any medical experiences."
         )
-        await asyncio.sleep(3)
-        await bot.delete_message(
-            chat_id=callback.message.chat.id, message_id=notification.id
+        deferred.schedule(
+            NOTIFICATION_DELAY,
+            bot.delete_message,
+            chat_id=callback.message.chat.id,
+            message_id=notification.id,
         )
         return
 
@@ -180,7 +194,7 @@ async def process_list_existing_medical_condition(
 
 async def process_remove_medical_condition(
     bot: AsyncTeleBot,
-    database: Firestore,
+    database: Storage,
     callback: types.CallbackQuery,
     condition: str,
 ) -> None:
@@ -202,8 +216,9 @@ async def process_remove_medical_condition(
         ),
         parse_mode="HTML",
     )
-    await asyncio.sleep(3)
-    await process_welcome_message(
+    deferred.schedule(
+        NOTIFICATION_DELAY,
+        process_welcome_message,
         bot=bot,
         message=callback.message.id,
         chat_id=callback.message.chat.id,
@@ -0,0 +1,135 @@
+import functools
+import inspect
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Type, TypeVar
+
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import REGISTRY, GaugeMetricFamily
+
+T = TypeVar("T")
+
+# Seconds, from sub-millisecond storage reads to Telegram sends under load
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUEST_LATENCY = Histogram(
+    "connectid_request_duration_seconds",
+    "Time taken to handle a request, by route.",
+    ["method", "route", "status"],
+    buckets=BUCKETS,
+)
+STORAGE_LATENCY = Histogram(
+    "connectid_storage_duration_seconds",
+    "Time taken by storage operations, by method.",
+    ["method"],
+    buckets=BUCKETS,
+)
+TELEGRAM_LATENCY = Histogram(
+    "connectid_telegram_duration_seconds",
+    "Time taken by Bot API requests once sent, by method.",
+    ["method"],
+    buckets=BUCKETS,
+)
+SOS_STAGE_LATENCY = Histogram(
+    "connectid_sos_stage_duration_seconds",
+    "Time taken by each stage of processing a distress signal.",
+    ["stage"],
+    buckets=BUCKETS,
+)
+SOS_OUTCOMES = Counter(
+    "connectid_sos_total",
+    "Distress signals received, by outcome.",
+    ["outcome"],
+)
+# Counted by storage on every scrape rather than tracked by each worker
+GAUGES = {
+    "pending_distress": "Distress signals neither acknowledged nor assigned.",
+    "incomplete_distress": "Distress signals not yet completed or cancelled.",
+    "available_responders": "Responders checked in and available.",
+}
+
+
+@contextmanager
+def observe(histogram: Histogram, **labels: str) -> Iterator[None]:
+    # Records the duration of the block, whether or not it raises
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - start)
+
+
+def timed(histogram: Histogram, **labels: str) -> Callable[[T], T]:
+    """
+    Records the duration of every call to a function or coroutine function.
+    :param histogram: Histogram to record to.
+    :param labels: Label values of the histogram.
+    """
+    child = histogram.labels(**labels)
+
+    def decorator(function: Any) -> Any:
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    child.observe(time.perf_counter() - start)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def instrument_storage(cls: Type[T]) -> Type[T]:
+    # Times every public coroutine of a storage backend, including inherited ones
+    for name, member in inspect.getmembers(cls, inspect.iscoroutinefunction):
+        if not name.startswith("_"):
+            setattr(cls, name, timed(STORAGE_LATENCY, method=name)(member))
+    return cls
+
+
+class _GaugeCollector:
+    def __init__(self, gauges: Dict[str, float]) -> None:
+        self.gauges = gauges
+
+    def collect(self):
+        for name, value in self.gauges.items():
+            gauge = GaugeMetricFamily(f"connectid_{name}", GAUGES[name])
+            gauge.add_metric([], value)
+            yield gauge
+
+
+def generate_metrics(gauges: Dict[str, float]) -> bytes:
+    """
+    Renders every metric in the Prometheus text format.
+    :param gauges: Values of GAUGES read at scrape time.
+    """
+    registry = REGISTRY
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # Aggregates the metrics every worker writes to the directory
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+
+    scraped = CollectorRegistry()
+    scraped.register(_GaugeCollector(gauges))
+    return generate_latest(registry) + generate_latest(scraped)
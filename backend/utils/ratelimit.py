@@ -0,0 +1,309 @@
+import asyncio
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from cachetools import LRUCache
+from telebot.asyncio_helper import ApiTelegramException
+
+from utils import (
+    get_telegram_chat_rate_limit,
+    get_telegram_group_rate_limit,
+    get_telegram_rate_limit,
+)
+
+MAX_RETRIES = 3
+MAX_TRACKED_CHATS = 10000
+GROUP_BURST = 3  # Lets the few messages about one distress signal go out together
+
+# Edits of the same message only need to deliver the latest text
+COALESCED_METHODS = ["editMessageText", "editMessageReplyMarkup"]
+
+
+class Priority(IntEnum):
+    DISTRESS = 0  # Distress notifications and responses to them
+    DEFAULT = 1  # Onboarding, profile and check in/out
+    BACKGROUND = 2  # Deferred cleanups, e.g. deleting stale prompts
+
+
+_priority: ContextVar[Priority] = ContextVar(
+    "telegram_priority", default=Priority.DEFAULT
+)
+
+
+@contextmanager
+def priority(lane: Priority) -> Iterator[None]:
+    # Bot API requests made within the block are sent in the given lane
+    token = _priority.set(lane)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def get_delay(self, now: float) -> float:
+        # Seconds until a token can be consumed
+        self._refill(now)
+        delay = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(delay, self.paused_until - now)
+
+    def consume(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, until: float) -> None:
+        self.paused_until = max(self.paused_until, until)
+
+
+def _get_chat_id(params: dict) -> Optional[Union[int, str]]:
+    # Chat IDs are sent as strings, channels may be addressed by @username
+    chat_id = params.get("chat_id")
+    if chat_id is None:
+        return None
+    try:
+        return int(chat_id)
+    except ValueError:
+        return chat_id
+
+
+class _Request:
+    def __init__(
+        self,
+        lane: Priority,
+        sequence: int,
+        chat_id: Optional[Union[int, str]],
+        key: Optional[Tuple],
+        send: Callable[[], Awaitable[Any]],
+    ) -> None:
+        self.lane = lane
+        self.sequence = sequence
+        self.chat_id = chat_id
+        self.key = key
+        self.send = send
+        self.futures: List[asyncio.Future] = []
+        self.retries = 0
+
+
+class RateLimiter:
+    """
+    Schedules Bot API requests within Telegram's global and per-chat limits.
+
+    Requests wait in a single queue ordered by priority lane, then arrival.
+    The dispatcher sends the first request whose chat has a token left and no
+    request in flight, so a busy chat never holds up requests to other chats. Pending edits of the
+    same message are coalesced into the latest one, and a 429 pauses the chat
+    for the retry_after given by Telegram before the request is retried.
+
+    Must only be used from a single event loop, see ConnectionPool.
+    """
+
+    def __init__(self, rate: float, chat_rate: float, group_rate: float) -> None:
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self._global = TokenBucket(rate, rate)
+        self._chats = LRUCache(maxsize=MAX_TRACKED_CHATS)
+        self._pending: List[_Request] = []
+        self._edits: Dict[Tuple, _Request] = {}
+        self._in_flight: Set[Union[int, str]] = set()
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.coalesced = 0
+        self.retried = 0
+
+    def _get_chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # Groups have negative IDs and a per-minute limit
+            if isinstance(chat_id, int) and chat_id < 0:
+                bucket = TokenBucket(self.group_rate / 60, GROUP_BURST)
+            else:
+                bucket = TokenBucket(self.chat_rate, max(1.0, self.chat_rate))
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._dispatcher is not None and self._dispatcher.get_loop() is loop:
+            return
+
+        self._wakeup = asyncio.Event()
+        self._dispatcher = loop.create_task(self._dispatch())
+
+    async def submit(
+        self, method: str, params: Optional[dict], send: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Queues a Bot API request and waits for its result.
+        :param method: Bot API method, e.g. sendMessage.
+        :param params: Parameters of the request.
+        :param send: Sends the request once it is allowed to.
+        """
+        self._start()
+        params = params or {}
+        chat_id = _get_chat_id(params)
+        key = (
+            (method, chat_id, params.get("message_id"))
+            if method in COALESCED_METHODS and params.get("message_id") is not None
+            else None
+        )
+        future = asyncio.get_running_loop().create_future()
+
+        request = self._edits.get(key) if key is not None else None
+        if request is not None:
+            # Earlier callers receive the result of the latest edit
+            request.send = send
+            request.lane = min(request.lane, _priority.get())
+            self.coalesced += 1
+        else:
+            request = _Request(
+                _priority.get(), next(self._sequence), chat_id, key, send
+            )
+            self._pending.append(request)
+            if key is not None:
+                self._edits[key] = request
+
+        request.futures.append(future)
+        self._wakeup.set()
+        return await future
+
+    def _get_next(self, now: float) -> Tuple[Optional[_Request], Optional[float]]:
+        # Returns the next request that can be sent, or how long to wait for one
+        delay = self._global.get_delay(now)
+        if delay > 0:
+            return None, delay
+
+        delay = None
+        for request in sorted(self._pending, key=lambda x: (x.lane, x.sequence)):
+            if all(x.done() for x in request.futures):
+                # Every caller gave up waiting
+                self._remove(request)
+                continue
+            if request.chat_id is None:
+                return request, None
+            if request.chat_id in self._in_flight:
+                # Requests to a chat are sent one at a time to keep their order
+                continue
+
+            chat_delay = self._get_chat_bucket(request.chat_id).get_delay(now)
+            if chat_delay <= 0:
+                return request, None
+            delay = chat_delay if delay is None else min(delay, chat_delay)
+        return None, delay
+
+    def _remove(self, request: _Request) -> None:
+        self._pending.remove(request)
+        if request.key is not None and self._edits.get(request.key) is request:
+            del self._edits[request.key]
+
+    async def _dispatch(self) -> None:
+        while True:
+            now = time.monotonic()
+            request, delay = self._get_next(now)
+
+            if request is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._remove(request)
+            self._global.consume(now)
+            if request.chat_id is not None:
+                self._get_chat_bucket(request.chat_id).consume(now)
+                self._in_flight.add(request.chat_id)
+            asyncio.get_running_loop().create_task(self._send(request))
+
+    async def _send(self, request: _Request) -> None:
+        try:
+            result = await request.send()
+        except ApiTelegramException as e:
+            if e.error_code == 429 and request.retries < MAX_RETRIES:
+                self._retry(request, e)
+                return
+            self._resolve(request, exception=e)
+        except Exception as e:
+            self._resolve(request, exception=e)
+        else:
+            self.sent += 1
+            self._resolve(request, result=result)
+        finally:
+            self._in_flight.discard(request.chat_id)
+            self._wakeup.set()
+
+    def _retry(self, request: _Request, e: ApiTelegramException) -> None:
+        retry_after = e.result_json.get("parameters", {}).get("retry_after", 1)
+        until = time.monotonic() + retry_after
+        print(f"Telegram rate limited chat {request.chat_id} for {retry_after}s")
+
+        if request.chat_id is not None:
+            self._get_chat_bucket(request.chat_id).pause(until)
+        else:
+            self._global.pause(until)
+
+        request.retries += 1
+        request.key = None  # Later edits are no longer merged into a sent request
+        self.retried += 1
+        self._pending.append(request)
+        self._wakeup.set()
+
+    def _resolve(
+        self,
+        request: _Request,
+        result: Any = None,
+        exception: Optional[Exception] = None,
+    ) -> None:
+        for future in request.futures:
+            if future.done():
+                continue
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+    def get_metrics(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "retried": self.retried,
+            "chats": len(self._chats),
+        }
+
+
+rate_limiter = RateLimiter(
+    rate=get_telegram_rate_limit(),
+    chat_rate=get_telegram_chat_rate_limit(),
+    group_rate=get_telegram_group_rate_limit(),
+)
@@ -2,12 +2,14 @@ import asyncio
 from datetime import datetime
 from typing import cast
 
-from database import Firestore
+from database import Storage
 from database.models import Distress, Responder
 from telebot import types
 from telebot.async_telebot import AsyncTeleBot
 
 from utils import get_group_chat_id
+from utils.deferred import NOTIFICATION_DELAY, deferred
+from utils.escalation import get_offer_deadline, offer_timers
 from utils.handlers import process_welcome_message
 from utils.text import _get_pwid_contacts
 from utils.url import _get_google_maps_link
@@ -17,34 +19,61 @@ def _get_anchor_tag(distress: Distress) -> str:
     return f"<a href='{_get_google_maps_link(distress.location.address)}'>{(distress.location.address)}</a>"
 
 
+async def _is_offered_to(
+    bot: AsyncTeleBot, distress: Distress, callback: types.CallbackQuery
+) -> bool:
+    # Offers expire and move on to the next responder
+    responder = distress.responder
+    if (
+        responder is not None
+        and responder.telegram_id == callback.message.chat.id
+        and not distress.is_acknowledged
+        and not distress.is_completed
+    ):
+        return True
+
+    await bot.edit_message_text(
+        chat_id=callback.message.chat.id,
+        message_id=callback.message.id,
+        text="This distress signal is no longer assigned to you.",
+    )
+    deferred.schedule(
+        NOTIFICATION_DELAY,
+        bot.delete_message,
+        chat_id=callback.message.chat.id,
+        message_id=callback.message.id,
+    )
+    return False
+
+
 async def process_acknowledge_distress(
     bot: AsyncTeleBot,
-    database: Firestore,
+    database: Storage,
     callback: types.CallbackQuery,
-    group_chat_message_id: int,
+    distress_id: str,
 ) -> None:
-    distress = await database.get_distress(group_chat_message_id)
-    distress.is_acknowledged = True
-    distress.acknowledged_at = str(datetime.now())
+    # Settled under the lease so that an expiring offer is not re-offered
+    async with offer_timers.hold(distress_id):
+        distress = await database.get_distress(distress_id)
+        if not await _is_offered_to(bot, distress, callback):
+            return
+
+        # Emergency contacts are only kept on the PWID document
+        await database.hydrate_distress(distress)
+        distress.is_acknowledged = True
+        distress.acknowledged_at = str(datetime.now())
 
-    await database.update_distress(distress)
+        await database.update_distress(distress)
+    offer_timers.cancel(distress.id)
 
     anchor_tag = _get_anchor_tag(distress)
     pwid_emergency_contacts = _get_pwid_contacts(distress.pwid)
 
-    # Responder message
-    await bot.edit_message_text(
-        chat_id=callback.message.chat.id,
-        message_id=callback.message.id,
-        text=f"You have acknowledged this distress signal. Kindly head over to {anchor_tag}\n\n{pwid_emergency_contacts}",
-        parse_mode="HTML",
-    )
-
     # Dispatcher group chat message
     keyboard = types.InlineKeyboardMarkup()
     decline = types.InlineKeyboardButton(
         text="❌ Cancel",
-        callback_data=f"dispatcher cancel {distress.group_chat_message_id}",
+        callback_data=f"dispatcher cancel {distress.id}",
     )
     keyboard.add(decline)
     text = "<b>❗ Distress Signal ❗</b>\n\n"
@@ -55,22 +84,44 @@ async def process_acknowledge_distress(
     text += f"<b>{responder.name} - {responder.phone_number}</b> is on the way to assist <b>{distress.pwid.name}</b> at {anchor_tag}\n\n"
     text += "<i>If you think that this is a false signal, please proceed to cancel this signal.</i>"
 
-    await bot.edit_message_text(
-        chat_id=get_group_chat_id(),
-        message_id=distress.group_chat_message_id,
-        text=text,
-        parse_mode="HTML",
-        reply_markup=keyboard,
+    await asyncio.gather(
+        # Responder message
+        bot.edit_message_text(
+            chat_id=callback.message.chat.id,
+            message_id=callback.message.id,
+            text=f"You have acknowledged this distress signal. Kindly head over to {anchor_tag}\n\n{pwid_emergency_contacts}",
+            parse_mode="HTML",
+        ),
+        bot.edit_message_text(
+            chat_id=get_group_chat_id(),
+            message_id=distress.group_chat_message_id,
+            text=text,
+            parse_mode="HTML",
+            reply_markup=keyboard,
+        ),
     )
 
 
 async def process_reject_distress(
     bot: AsyncTeleBot,
-    database: Firestore,
+    database: Storage,
     callback: types.CallbackQuery,
-    group_chat_message_id: int,
+    distress_id: str,
 ) -> None:
-    distress = await database.get_distress(group_chat_message_id)
+    async with offer_timers.hold(distress_id):
+        distress = await database.get_distress(distress_id)
+        if not await _is_offered_to(bot, distress, callback):
+            return
+
+        summary = cast(Responder, distress.responder)
+        distress.message_id = -1
+        distress.responder = None
+        distress.excluded_responders.append(summary.telegram_id)
+        # Offer the signal to the next ranked responder right away
+        distress.offered_at = ""
+        await database.update_distress(distress)
+    # Armed once the lease is released, which the timer needs to claim
+    offer_timers.arm(distress.id, get_offer_deadline(distress))
 
     # Responder message
     await bot.edit_message_text(
@@ -80,8 +131,9 @@ async def process_reject_distress(
         parse_mode="HTML",
     )
 
-    # Prevents same responder from getting matched to the same signal
-    responder = cast(Responder, distress.responder)
+    # Prevents same responder from getting matched to the same signal, the
+    # distress signal only keeps a summary of the responder
+    responder = await database.get_responder(summary.telegram_id)
     responder.is_available = False
     await database.update_responder(responder)
 
@@ -89,24 +141,20 @@ async def process_reject_distress(
     keyboard = types.InlineKeyboardMarkup()
     accept = types.InlineKeyboardButton(
         text="✅ Accept",
-        callback_data=f"dispatcher accept {distress.group_chat_message_id}",
+        callback_data=f"dispatcher accept {distress.id}",
     )
     decline = types.InlineKeyboardButton(
         text="❌ Cancel",
-        callback_data=f"dispatcher decline {distress.group_chat_message_id}",
+        callback_data=f"dispatcher decline {distress.id}",
     )
     keyboard.add(accept, decline, row_width=2)
 
     text = "<b>❗ Distress Signal ❗</b>\n\n"
     text += "<b>Status: </b> 🔴 Not Acknowledged\n\n"
-    text += f"<b>{cast(Responder, distress.responder).name}</b> is unavailable at the moment to assist <b>{distress.pwid.name}</b> at {_get_anchor_tag(distress)}.\n\n"
+    text += f"<b>{responder.name}</b> is unavailable at the moment to assist <b>{distress.pwid.name}</b> at {_get_anchor_tag(distress)}.\n\n"
     text += "The system will proceed to look for another responder. If you think this distress signal is urgent, kindly manage it manually.\n\n"
     text += "<i>If you think that this is a false signal, please proceed to cancel this signal.</i>"
 
-    distress.message_id = -1
-    distress.responder = None
-    await database.update_distress(distress)
-
     await bot.edit_message_text(
         chat_id=get_group_chat_id(),
         message_id=distress.group_chat_message_id,
@@ -116,9 +164,11 @@ async def process_reject_distress(
     )
 
     # Clean up message in responder chat
-    await asyncio.sleep(3)
-    await bot.delete_message(
-        chat_id=callback.message.chat.id, message_id=callback.message.id
+    deferred.schedule(
+        NOTIFICATION_DELAY,
+        bot.delete_message,
+        chat_id=callback.message.chat.id,
+        message_id=callback.message.id,
     )
 
     await process_welcome_message(
@@ -0,0 +1,162 @@
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from database.models import PWID, Responder
+from utils.medical import _get_list_of_existing_experience
+from utils.spatial import EARTH_RADIUS_KM
+
+WORD_SIZE = 64
+
+
+class _Vocabulary:
+    # Assigns each distinct term a bit position within a multi-word bitmask
+    def __init__(self) -> None:
+        self._positions: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def add(self, terms: Iterable[str]) -> None:
+        for term in terms:
+            self._positions.setdefault(term, len(self._positions))
+
+    def encode(self, terms: Iterable[str], words: int) -> np.ndarray:
+        mask = np.zeros(words, dtype=np.uint64)
+        for term in terms:
+            position = self._positions.get(term)
+            if position is not None:
+                mask[position // WORD_SIZE] |= np.uint64(1 << (position % WORD_SIZE))
+        return mask
+
+
+def _get_word_count(vocabulary: _Vocabulary) -> int:
+    return max(1, -(-len(vocabulary) // WORD_SIZE))
+
+
+def _popcount(masks: np.ndarray) -> np.ndarray:
+    # Counts set bits per row of a (n, words) uint64 matrix
+    return np.unpackbits(masks.view(np.uint8), axis=1).sum(axis=1, dtype=np.int64)
+
+
+def haversine_many(
+    latitude: float,
+    longitude: float,
+    latitudes: np.ndarray,
+    longitudes: np.ndarray,
+) -> np.ndarray:
+    phi = np.radians(latitude)
+    phis = np.radians(latitudes)
+    delta_phi = phis - phi
+    delta_lambda = np.radians(longitudes - longitude)
+
+    a = (
+        np.sin(delta_phi / 2) ** 2
+        + np.cos(phi) * np.cos(phis) * np.sin(delta_lambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+class ResponderMatrix:
+    """
+    Columnar snapshot of responders used to score every candidate in one pass.
+
+    Coordinates are packed into float arrays, genders into integer codes, and
+    languages and medical knowledge into bitmasks so that preference checks and
+    condition overlap become vectorised bitwise operations.
+    """
+
+    def __init__(self, responders: Sequence[Responder]) -> None:
+        self.responders = list(responders)
+        self._languages = _Vocabulary()
+        self._conditions = _Vocabulary()
+        self._genders: Dict[str, int] = {}
+
+        experiences = [_get_list_of_existing_experience(x) for x in self.responders]
+        for responder, experience in zip(self.responders, experiences):
+            self._languages.add(responder.languages)
+            self._conditions.add(experience)
+            self._genders.setdefault(responder.gender, len(self._genders))
+
+        self._language_words = _get_word_count(self._languages)
+        self._condition_words = _get_word_count(self._conditions)
+
+        count = len(self.responders)
+        self.latitudes = np.fromiter(
+            (x.location.latitude for x in self.responders),
+            dtype=np.float64,
+            count=count,
+        )
+        self.longitudes = np.fromiter(
+            (x.location.longitude for x in self.responders),
+            dtype=np.float64,
+            count=count,
+        )
+        self.is_available = np.fromiter(
+            (x.is_available for x in self.responders), dtype=bool, count=count
+        )
+        self.genders = np.fromiter(
+            (self._genders[x.gender] for x in self.responders),
+            dtype=np.int32,
+            count=count,
+        )
+        self.languages = np.zeros((count, self._language_words), dtype=np.uint64)
+        self.conditions = np.zeros((count, self._condition_words), dtype=np.uint64)
+
+        for row, (responder, experience) in enumerate(
+            zip(self.responders, experiences)
+        ):
+            self.languages[row] = self._languages.encode(
+                responder.languages, self._language_words
+            )
+            self.conditions[row] = self._conditions.encode(
+                experience, self._condition_words
+            )
+
+    def __len__(self) -> int:
+        return len(self.responders)
+
+    def score(self, pwid: PWID) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Scores every responder against a PWID.
+        :param pwid: PWID requesting for help.
+        :return: Tuple of (eligibility mask, distance in km, condition overlap).
+        """
+        distances = haversine_many(
+            pwid.location.latitude,
+            pwid.location.longitude,
+            self.latitudes,
+            self.longitudes,
+        )
+
+        condition_mask = self._conditions.encode(
+            pwid.medical_conditions, self._condition_words
+        )
+        overlaps = _popcount(self.conditions & condition_mask)
+
+        language_mask = self._languages.encode(
+            [pwid.language_preference], self._language_words
+        )
+        matches_language_preference = (self.languages & language_mask).any(axis=1)
+
+        gender_code = self._genders.get(pwid.gender_preference, -1)
+        matches_gender_preference = self.genders == gender_code
+
+        is_eligible = (
+            self.is_available
+            & (overlaps > 0)
+            & matches_language_preference
+            & matches_gender_preference
+        )
+        return is_eligible, distances, overlaps
+
+    def rank(self, pwid: PWID, k: int = 1) -> List[Responder]:
+        # Nearest eligible responders first, ties broken by most shared conditions
+        if len(self) == 0 or k <= 0:
+            return []
+
+        is_eligible, distances, overlaps = self.score(pwid)
+        candidates = np.flatnonzero(is_eligible)
+        order = np.lexsort((-overlaps[candidates], distances[candidates]))
+
+        return [self.responders[i] for i in candidates[order[:k]]]
@@ -0,0 +1,181 @@
+import heapq
+import math
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from database.models import Responder
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+DEFAULT_CELL_SIZE = 0.01  # In degrees, roughly 1.1km at the equator
+
+Cell = Tuple[int, int]
+
+
+def haversine(
+    latitude_a: float, longitude_a: float, latitude_b: float, longitude_b: float
+) -> float:
+    # Great-circle distance between two coordinates in kilometres
+    phi_a, phi_b = math.radians(latitude_a), math.radians(latitude_b)
+    delta_phi = phi_b - phi_a
+    delta_lambda = math.radians(longitude_b - longitude_a)
+
+    a = (
+        math.sin(delta_phi / 2) ** 2
+        + math.cos(phi_a) * math.cos(phi_b) * math.sin(delta_lambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class ResponderIndex:
+    """
+    Grid-bucketed spatial index over available responders.
+
+    Responders are hashed into fixed-size latitude/longitude cells. Nearest
+    neighbour queries expand ring by ring from the query cell and stop as soon as
+    no unvisited ring can contain a closer responder, so a query only touches the
+    cells around the PWID instead of every checked-in responder.
+    """
+
+    def __init__(
+        self,
+        responders: Iterable[Responder] = (),
+        cell_size: float = DEFAULT_CELL_SIZE,
+    ) -> None:
+        self.cell_size = cell_size
+        self._cells: Dict[Cell, Dict[int, Responder]] = {}
+        self._positions: Dict[int, Cell] = {}
+
+        for responder in responders:
+            self.add(responder)
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, telegram_id: int) -> bool:
+        return telegram_id in self._positions
+
+    def __iter__(self) -> Iterator[Responder]:
+        for bucket in self._cells.values():
+            yield from bucket.values()
+
+    def copy(self) -> "ResponderIndex":
+        index = ResponderIndex(cell_size=self.cell_size)
+        index._cells = {cell: dict(bucket) for cell, bucket in self._cells.items()}
+        index._positions = dict(self._positions)
+        return index
+
+    def _get_cell(self, latitude: float, longitude: float) -> Cell:
+        return (
+            math.floor(latitude / self.cell_size),
+            math.floor(longitude / self.cell_size),
+        )
+
+    def add(self, responder: Responder) -> None:
+        # Re-adding a responder moves it to its latest location
+        self.remove(responder.telegram_id)
+
+        if not responder.is_available:
+            return
+
+        cell = self._get_cell(responder.location.latitude, responder.location.longitude)
+        self._cells.setdefault(cell, {})[responder.telegram_id] = responder
+        self._positions[responder.telegram_id] = cell
+
+    def remove(self, telegram_id: int) -> None:
+        cell = self._positions.pop(telegram_id, None)
+        if cell is None:
+            return
+
+        bucket = self._cells[cell]
+        bucket.pop(telegram_id, None)
+        if not bucket:
+            del self._cells[cell]
+
+    def _get_ring(self, center: Cell, radius: int) -> Iterator[Cell]:
+        row, column = center
+        if radius == 0:
+            yield center
+            return
+
+        for offset in range(-radius, radius + 1):
+            yield (row - radius, column + offset)
+            yield (row + radius, column + offset)
+        for offset in range(-radius + 1, radius):
+            yield (row + offset, column - radius)
+            yield (row + offset, column + radius)
+
+    def _get_ring_lower_bound(self, radius: int, latitude: float) -> float:
+        # Any point in ring r is at least (r - 1) cells away along one axis
+        if radius <= 1:
+            return 0.0
+
+        degrees = (radius - 1) * self.cell_size
+        widest_latitude = min(90.0, abs(latitude) + radius * self.cell_size)
+        return degrees * KM_PER_DEGREE * math.cos(math.radians(widest_latitude))
+
+    def nearest(
+        self,
+        latitude: float,
+        longitude: float,
+        k: int = 1,
+        predicate: Optional[Callable[[Responder], bool]] = None,
+    ) -> List[Tuple[float, Responder]]:
+        """
+        Returns up to k responders closest to the given coordinates.
+        :param latitude: Latitude of the query point.
+        :param longitude: Longitude of the query point.
+        :param k: Maximum number of responders to return.
+        :param predicate: Optional filter, responders failing it are skipped.
+        :return: List of (distance in km, responder) sorted by distance.
+        """
+        if k <= 0 or not self._cells:
+            return []
+
+        # Max-heap of the k best candidates so far, keyed by negated distance
+        best: List[Tuple[float, int, Responder]] = []
+        visited = 0
+        center = self._get_cell(latitude, longitude)
+
+        def consider(bucket: Dict[int, Responder]) -> None:
+            for telegram_id, responder in bucket.items():
+                if predicate is not None and not predicate(responder):
+                    continue
+
+                distance = haversine(
+                    latitude,
+                    longitude,
+                    responder.location.latitude,
+                    responder.location.longitude,
+                )
+                if len(best) < k:
+                    heapq.heappush(best, (-distance, telegram_id, responder))
+                elif distance < -best[0][0]:
+                    heapq.heapreplace(best, (-distance, telegram_id, responder))
+
+        radius = 0
+        while visited < len(self._cells):
+            if (
+                len(best) == k
+                and self._get_ring_lower_bound(radius, latitude) > -best[0][0]
+            ):
+                break
+
+            # Sparse grids are cheaper to finish off by scanning the occupied cells
+            if 8 * radius > len(self._cells) - visited:
+                for cell, bucket in self._cells.items():
+                    row, column = cell
+                    if max(abs(row - center[0]), abs(column - center[1])) >= radius:
+                        consider(bucket)
+                break
+
+            for cell in self._get_ring(center, radius):
+                bucket = self._cells.get(cell)
+                if bucket is not None:
+                    visited += 1
+                    consider(bucket)
+            radius += 1
+
+        return [
+            (-distance, responder)
+            for distance, _, responder in sorted(best, key=lambda x: -x[0])
+        ]
@@ -0,0 +1,123 @@
+import functools
+import inspect
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, Type, TypeVar
+
+from opentelemetry import trace
+from opentelemetry.context import Context
+from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    ConsoleSpanExporter,
+    SpanExporter,
+)
+from opentelemetry.trace import Span, SpanKind, Status, StatusCode
+
+from utils import get_tracing_exporter, get_tracing_file_path
+
+T = TypeVar("T")
+
+SERVICE_NAME = "connectid-backend"
+
+# No-op until setup_tracing() installs a provider
+tracer = trace.get_tracer("connectid")
+_lock = threading.Lock()
+_is_setup = False
+
+
+def _create_exporter(name: str) -> SpanExporter:
+    if name == "file":
+        # One span per line, appended to by every worker
+        return ConsoleSpanExporter(
+            service_name=SERVICE_NAME,
+            out=open(get_tracing_file_path(), "a"),
+            formatter=lambda span: span.to_json(indent=None) + os.linesep,
+        )
+    if name == "otlp":
+        # Endpoint is read from OTEL_EXPORTER_OTLP_ENDPOINT, e.g. a local collector
+        return OTLPSpanExporter()
+    raise ValueError(f"Unknown tracing exporter {name}")
+
+
+def setup_tracing() -> None:
+    # Called once per worker, spans are dropped unless an exporter is configured
+    global _is_setup
+
+    with _lock:
+        exporter = get_tracing_exporter()
+        if _is_setup or exporter == "none":
+            return
+
+        provider = TracerProvider(
+            resource=Resource.create({"service.name": SERVICE_NAME})
+        )
+        provider.add_span_processor(BatchSpanProcessor(_create_exporter(exporter)))
+        trace.set_tracer_provider(provider)
+        _is_setup = True
+
+
+@contextmanager
+def start_span(
+    name: str,
+    kind: SpanKind = SpanKind.INTERNAL,
+    context: Optional[Context] = None,
+    **attributes: Any,
+) -> Iterator[Span]:
+    """
+    Runs the block in a span, exceptions are recorded before they propagate.
+    :param name: Name of the span.
+    :param kind: Kind of the span, e.g. CLIENT for outbound requests.
+    :param context: Context of the parent span, the current one by default.
+    :param attributes: Attributes set on the span.
+    """
+    with tracer.start_as_current_span(
+        name, context=context, kind=kind, attributes=attributes
+    ) as span:
+        yield span
+
+
+def traced(name: str, **attributes: Any) -> Callable[[T], T]:
+    """
+    Runs every call to a function or coroutine function in its own span.
+    :param name: Name of the span.
+    :param attributes: Attributes set on the span.
+    """
+
+    def decorator(function: Any) -> Any:
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with start_span(name, **attributes):
+                    return await function(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with start_span(name, **attributes):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def trace_storage(cls: Type[T]) -> Type[T]:
+    # Spans every public coroutine of a storage backend, including inherited ones
+    for name, member in inspect.getmembers(cls, inspect.iscoroutinefunction):
+        if not name.startswith("_"):
+            setattr(
+                cls,
+                name,
+                traced(f"storage.{name}", **{"storage.backend": cls.__name__})(member),
+            )
+    return cls
+
+
+def set_error(span: Span, description: str) -> None:
+    span.set_status(Status(StatusCode.ERROR, description))
@@ -0,0 +1,29 @@
+import { IClusterProps } from "./types";
+
+export const Cluster = ({ count, pending, acknowledged }: IClusterProps) => {
+  const renderColor = (): string => {
+    if (pending > 0) {
+      return "bg-red-600";
+    }
+    if (acknowledged > 0) {
+      return "bg-orange-600";
+    }
+    return "bg-green-600";
+  };
+
+  // Grows with the number of signals, capped so that clusters stay readable
+  const size = Math.min(20 + Math.log2(count) * 6, 56);
+
+  return (
+    <div
+      className={`flex items-center justify-center rounded-full text-white text-xs font-semibold opacity-90 ${renderColor()}`}
+      style={{
+        width: size,
+        height: size,
+        transform: "translate(-50%, -50%)",
+      }}
+    >
+      {count}
+    </div>
+  );
+};
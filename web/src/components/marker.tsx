@@ -2,7 +2,7 @@ import { useState } from "react";
 import { BsGenderFemale, BsGenderMale } from "react-icons/bs";
 import { toast } from "react-toastify";
 import { SignalService } from "../services";
-import { EGender, IMarkerProps, TMarkerResponse } from "./types";
+import { EGender, IMarkerProps, IPWID, TMarkerResponse } from "./types";
 
 export const Marker = ({
   id,
@@ -14,10 +14,16 @@ export const Marker = ({
   ...otherProps
 }: IMarkerProps & TMarkerResponse) => {
   const [display, setDisplay] = useState<boolean>(false);
+  const [details, setDetails] = useState<IPWID>();
 
-  const handleOnClick = () => {
+  const handleOnClick = async () => {
     onClick && onClick();
     setDisplay(!display);
+
+    if (!display && !details) {
+      const signal = await SignalService.fetchSignal(id);
+      setDetails(signal.pwid);
+    }
   };
 
   const handleAcceptSignal = async (e: React.MouseEvent<HTMLButtonElement>) => {
@@ -57,12 +63,17 @@ export const Marker = ({
       return;
     }
 
+    const person = details ?? pwid;
+
     const formatLocation = () => {
       return <span>{location.address}</span>;
     };
 
     const formatEmergencyContacts = () => {
-      return pwid.emergency_contacts.map((contact, index) => (
+      if (!person.emergency_contacts) {
+        return <span>Loading...</span>;
+      }
+      return person.emergency_contacts.map((contact, index) => (
         <span key={index}>
           {contact.name} ({contact.relationship}) - {contact.phone_number}
         </span>
@@ -70,16 +81,19 @@ export const Marker = ({
     };
 
     const formatMedicalConditions = () => {
-      if (!pwid.medical_condtions || pwid.medical_condtions.length === 0) {
+      if (
+        !person.medical_conditions ||
+        person.medical_conditions.length === 0
+      ) {
         return <span>None</span>;
       }
-      return pwid.medical_condtions.map((condition, index) => {
+      return person.medical_conditions.map((condition, index) => {
         return <span key={index}>{condition}</span>;
       });
     };
 
     const formatGender = () => {
-      if (pwid.gender === EGender.Female) {
+      if (person.gender === EGender.Female) {
         return <BsGenderFemale className="stroke-1 text-pink-500" />;
       }
       return <BsGenderMale className="stroke-1 text-blue-500" />;
@@ -89,7 +103,7 @@ export const Marker = ({
       <div className="card w-64 bg-base-100 shadow-xl">
         <div className="card-body">
           <h2 className="card-title">
-            <span>{pwid.name}</span>
+            <span>{person.name}</span>
             {formatGender()}
           </h2>
           <div className="flex flex-col">
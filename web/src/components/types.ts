@@ -9,11 +9,15 @@ interface IEmergencyContact {
   relationship: string;
 }
 
-interface IPWID {
+// Listings only carry a summary, the remaining fields are fetched per signal
+export interface IPWID {
+  id: string;
   name: string;
-  emergency_contacts: IEmergencyContact[];
-  gender: EGender;
-  medical_condtions: string[];
+  phone_number: string;
+  location: ILocation;
+  emergency_contacts?: IEmergencyContact[];
+  gender?: EGender;
+  medical_conditions?: string[];
 }
 
 interface ILocation {
@@ -25,7 +29,7 @@ interface ILocation {
 export interface IMarkerProps {
   lat: number;
   lng: number;
-  id: number;
+  id: string;
   is_acknowledged: boolean;
   is_completed: boolean;
   pwid: IPWID;
@@ -38,19 +42,19 @@ interface IMedicalKnowledge {
 }
 
 interface IResponser {
-  address: string;
-  date_of_birth: string;
-  existing_medical_knowledge: IMedicalKnowledge[];
-  gender: string;
+  address?: string;
+  date_of_birth?: string;
+  existing_medical_knowledge?: IMedicalKnowledge[];
+  gender?: string;
   id: string;
-  is_available: boolean;
-  languages: string[];
+  is_available?: boolean;
+  languages?: string[];
   location: ILocation;
-  message_id: number;
+  message_id?: number;
   name: string;
-  nric: string;
+  nric?: string;
   phone_number: string;
-  state: number;
+  state?: number;
   telegram_id: number;
 }
 
@@ -59,4 +63,27 @@ export type TMarkerResponse = Exclude<IMarkerProps, "onClick" | "id"> & {
   group_chat_message_id: number;
   responder: IResponser;
   status: string;
+  updated_at: string;
 };
+
+export interface IClusterProperties {
+  count: number;
+  pending: number;
+  acknowledged: number;
+  completed: number;
+  id?: string; // Only set for a single signal
+}
+
+export interface ICluster {
+  type: "Feature";
+  geometry: {
+    type: "Point";
+    coordinates: [number, number]; // Longitude, latitude
+  };
+  properties: IClusterProperties;
+}
+
+export interface IClusterProps extends IClusterProperties {
+  lat: number;
+  lng: number;
+}
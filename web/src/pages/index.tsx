@@ -1,65 +1,175 @@
-import GoogleMapReact from "google-map-react";
-import { useEffect, useState } from "react";
+import GoogleMapReact, { ChangeEventValue } from "google-map-react";
+import { useEffect, useRef, useState } from "react";
 import {
   AiOutlineSortAscending,
   AiOutlineSortDescending,
 } from "react-icons/ai";
 import { ToastContainer } from "react-toastify";
 import "react-toastify/dist/ReactToastify.css";
-import { Marker, TMarkerResponse } from "../components";
-import { SignalService } from "../services";
+import { Cluster, ICluster, Marker, TMarkerResponse } from "../components";
+import { IBounds, ISignalQuery, SignalService } from "../services";
 
 const SINGAPORE_CENTER_COORDINATES = {
   lat: 1.3521,
   lng: 103.8198,
 };
+const POLL_INTERVAL = 5000;
 
 export default function Home() {
   const [signals, setSignals] = useState<TMarkerResponse[]>([]);
-  const [markers, setMarkers] = useState<TMarkerResponse[]>([]);
+  const [clusters, setClusters] = useState<ICluster[]>([]);
   const [isAscending, setIsAscending] = useState<boolean>(false);
+  const [sortQuery, setSortQuery] = useState<ISignalQuery>({});
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const watermark = useRef<string | null>(null);
+  const etag = useRef<string | null>(null);
+  const viewport = useRef<{ bounds: IBounds; zoom: number } | null>(null);
 
   useEffect(() => {
     fetchSignals();
   }, []);
 
   useEffect(() => {
-    if (signals && signals.length > 0) {
-      handleMarkers(signals);
+    let interval: ReturnType<typeof setInterval> | undefined;
+    const startPolling = () => {
+      interval = setInterval(pollSignals, POLL_INTERVAL);
+    };
+
+    if (typeof EventSource === "undefined") {
+      startPolling();
+      return () => clearInterval(interval);
     }
+
+    const unsubscribe = SignalService.subscribeSignals(
+      (data) => mergeSignals([data]),
+      () => fetchSignals(),
+      startPolling
+    );
+    return () => {
+      unsubscribe();
+      clearInterval(interval);
+    };
+  }, []);
+
+  useEffect(() => {
+    // Signals changed, the backend only re-aggregates the affected tiles
+    fetchClusters();
   }, [signals]);
 
-  const handleMarkers = (signals: TMarkerResponse[]): void => {
-    // const markers = signals.filter((signal) => {
-    //   return !signal.is_completed;
-    // });
+  const fetchClusters = async (): Promise<void> => {
+    if (!viewport.current) {
+      return;
+    }
 
-    setMarkers(signals);
+    const { bounds, zoom } = viewport.current;
+    setClusters(await SignalService.fetchClusters(bounds, zoom));
   };
 
-  const fetchSignals = async (): Promise<void> => {
-    const data = await SignalService.fetchSignals();
-    setSignals(data);
+  const handleMapChange = ({ bounds, zoom }: ChangeEventValue): void => {
+    viewport.current = {
+      bounds: {
+        south: bounds.sw.lat,
+        west: bounds.sw.lng,
+        north: bounds.ne.lat,
+        east: bounds.ne.lng,
+      },
+      zoom,
+    };
+    fetchClusters();
   };
 
-  const handleSort = () => {
-    let sortedSignals = signals;
+  const renderCluster = (cluster: ICluster, index: number): JSX.Element => {
+    const [lng, lat] = cluster.geometry.coordinates;
+    const { id } = cluster.properties;
+    const signal = id && signals.find((data) => data.id === id);
 
-    sortedSignals.sort((a, b) => {
-      if (isAscending) {
-        return a.status.localeCompare(b.status);
+    // Single signals that are already listed open their details on click
+    if (signal) {
+      return (
+        <Marker
+          key={id}
+          {...signal}
+          id={signal.id}
+          lat={signal.location.latitude}
+          lng={signal.location.longitude}
+        />
+      );
+    }
+    return <Cluster key={index} {...cluster.properties} lat={lat} lng={lng} />;
+  };
+
+  const fetchSignals = async (query: ISignalQuery = {}): Promise<void> => {
+    const page = await SignalService.fetchSignals(query);
+
+    // Pages after the first are appended to the current listing
+    setSignals(query.cursor ? [...signals, ...page.data] : page.data);
+    setNextCursor(page.next_cursor);
+    if (!query.cursor) {
+      watermark.current = page.watermark;
+    }
+  };
+
+  const pollSignals = async (): Promise<void> => {
+    // Only signals changed since the last poll are returned, if any
+    const since = watermark.current;
+    const changes = await SignalService.fetchSignalChanges(since, etag.current);
+    etag.current = changes.etag;
+
+    let page = changes.page;
+    while (page && page.data.length > 0) {
+      watermark.current = page.watermark;
+      mergeSignals(page.data);
+      if (!page.next_cursor) {
+        return;
+      }
+      // A burst of changes may not fit in one page
+      page = await SignalService.fetchSignals({
+        since,
+        cursor: page.next_cursor,
+      });
+    }
+  };
+
+  const mergeSignals = (changes: TMarkerResponse[]): void => {
+    setSignals((signals) => {
+      // Deltas overlap the previous poll, signals already up to date are skipped
+      const current = new Map(signals.map((data) => [data.id, data]));
+      const fresh = changes.filter(
+        (data) => current.get(data.id)?.updated_at !== data.updated_at
+      );
+      if (fresh.length === 0) {
+        return signals;
       }
-      return b.status.localeCompare(a.status);
+
+      const changed = new Map(fresh.map((data) => [data.id, data]));
+      const updated = signals.map((data) => changed.get(data.id) ?? data);
+      const created = fresh.filter(
+        (data) => !signals.some((signal) => signal.id === data.id)
+      );
+      return [...created, ...updated];
     });
+  };
 
-    setSignals(sortedSignals);
+  const handleSort = () => {
+    // Sorted by the backend so that only the first page has to be fetched
+    const query: ISignalQuery = {
+      sort: "status",
+      order: isAscending ? "desc" : "asc",
+    };
+
+    fetchSignals(query);
+    setSortQuery(query);
     setIsAscending(!isAscending);
   };
 
+  const handleLoadMore = () => {
+    fetchSignals({ ...sortQuery, cursor: nextCursor });
+  };
+
   const renderTable = (): JSX.Element[] => {
     return signals.map((data) => {
       return (
-        <tr key={data.group_chat_message_id}>
+        <tr key={data.id}>
           <td>{data.group_chat_message_id}</td>
           <td>{data.pwid.name}</td>
           <td>{data.responder.name ? data.responder.name : "None"}</td>
@@ -93,6 +203,11 @@ export default function Home() {
             </thead>
             <tbody>{renderTable()}</tbody>
           </table>
+          {nextCursor && (
+            <button className="btn btn-sm w-full mt-2" onClick={handleLoadMore}>
+              Load more
+            </button>
+          )}
         </div>
       </div>
       <GoogleMapReact
@@ -105,16 +220,9 @@ export default function Home() {
           maxZoom: 15,
           minZoom: 12,
         }}
+        onChange={handleMapChange}
       >
-        {markers.map((props, index) => (
-          <Marker
-            key={index}
-            {...props}
-            id={props.group_chat_message_id}
-            lat={props.location.latitude}
-            lng={props.location.longitude}
-          />
-        ))}
+        {clusters.map(renderCluster)}
       </GoogleMapReact>
       <ToastContainer />
     </div>
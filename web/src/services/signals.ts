@@ -1,11 +1,11 @@
-import { TMarkerResponse } from "../components";
+import { ICluster, TMarkerResponse } from "../components";
 import { axiosInstance } from "./axios";
 
 interface ISignalResponse {
   message: string;
 }
 
-const acceptSignal = async (id: number): Promise<ISignalResponse> => {
+const acceptSignal = async (id: string): Promise<ISignalResponse> => {
   const response = await axiosInstance.post<ISignalResponse>(
     `/distress/accept/${id}`
   );
@@ -13,7 +13,7 @@ const acceptSignal = async (id: number): Promise<ISignalResponse> => {
   return response.data;
 };
 
-const cancelSignal = async (id: number): Promise<ISignalResponse> => {
+const cancelSignal = async (id: string): Promise<ISignalResponse> => {
   const response = await axiosInstance.post<ISignalResponse>(
     `/distress/cancel/${id}`
   );
@@ -21,23 +21,136 @@ const cancelSignal = async (id: number): Promise<ISignalResponse> => {
   return response.data;
 };
 
-const fetchSignals = async (): Promise<TMarkerResponse[]> => {
-  const response = await axiosInstance.get<TMarkerResponse[]>("/distress");
+const fetchSignal = async (id: string): Promise<TMarkerResponse> => {
+  const response = await axiosInstance.get<TMarkerResponse>(`/distress/${id}`);
 
-  return response.data.map((data) => {
-    if (data.is_completed) {
-      data["status"] = "Completed";
-    } else if (data.is_acknowledged) {
-      data["status"] = "Acknowledged";
-    } else {
-      data["status"] = "Pending";
-    }
-    return data;
+  return response.data;
+};
+
+export interface ISignalQuery {
+  cursor?: string | null;
+  since?: string | null;
+  sort?: "created_at" | "status";
+  order?: "asc" | "desc";
+  status?: string;
+  pwid?: string;
+}
+
+export interface ISignalPage {
+  data: TMarkerResponse[];
+  next_cursor: string | null;
+  watermark: string | null;
+}
+
+export interface ISignalChanges {
+  page: ISignalPage | null; // Null if nothing has changed
+  etag: string | null;
+}
+
+const withStatus = (data: TMarkerResponse): TMarkerResponse => {
+  if (data.is_completed) {
+    data["status"] = "Completed";
+  } else if (data.is_acknowledged) {
+    data["status"] = "Acknowledged";
+  } else {
+    data["status"] = "Pending";
+  }
+  return data;
+};
+
+const fetchSignals = async (query: ISignalQuery = {}): Promise<ISignalPage> => {
+  const response = await axiosInstance.get<ISignalPage>("/distress", {
+    params: query,
+  });
+
+  return { ...response.data, data: response.data.data.map(withStatus) };
+};
+
+const fetchSignalChanges = async (
+  since: string | null,
+  etag: string | null
+): Promise<ISignalChanges> => {
+  const response = await axiosInstance.get<ISignalPage>("/distress", {
+    params: { since },
+    headers: etag ? { "If-None-Match": etag } : {},
+    validateStatus: (status) => status === 200 || status === 304,
   });
+
+  if (response.status === 304) {
+    return { page: null, etag };
+  }
+  return {
+    page: { ...response.data, data: response.data.data.map(withStatus) },
+    etag: response.headers["etag"] ?? null,
+  };
+};
+
+export interface IBounds {
+  south: number;
+  west: number;
+  north: number;
+  east: number;
+}
+
+interface IClusterResponse {
+  type: "FeatureCollection";
+  features: ICluster[];
+}
+
+const fetchClusters = async (
+  bounds: IBounds,
+  zoom: number
+): Promise<ICluster[]> => {
+  const response = await axiosInstance.get<IClusterResponse>("/distress/geo", {
+    params: { ...bounds, zoom },
+  });
+
+  return response.data.features;
+};
+
+const DISTRESS_EVENTS = [
+  "created",
+  "assigned",
+  "declined",
+  "acknowledged",
+  "completed",
+  "cancelled",
+  "updated",
+];
+
+// One stream replaces polling, reconnects resume from the last event received
+const subscribeSignals = (
+  onChange: (data: TMarkerResponse) => void,
+  onResync: () => void,
+  onRefused: () => void
+): (() => void) => {
+  const source = new EventSource(
+    `${axiosInstance.defaults.baseURL}/distress/stream`
+  );
+
+  DISTRESS_EVENTS.forEach((event) => {
+    source.addEventListener(event, (e) => {
+      onChange(withStatus(JSON.parse((e as MessageEvent).data)));
+    });
+  });
+  source.addEventListener("resync", onResync);
+  source.onerror = () => {
+    // EventSource gives up on error responses, e.g. a 503 once the backend
+    // serves as many streams as it allows
+    if (source.readyState === EventSource.CLOSED) {
+      onRefused();
+    }
+  };
+
+  return () => source.close();
 };
 
 export const SignalService = {
   acceptSignal,
   cancelSignal,
+  fetchClusters,
+  fetchSignal,
+  fetchSignalChanges,
   fetchSignals,
+  subscribeSignals,
 };